@@ -1,3 +1,9 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta, timezone
@@ -8,9 +14,21 @@ SECRET_KEY = "c038fmrv02xw02302ejdioc" # Thay bằng chuỗi ngẫu nhiên
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Thời gian (giây) và số người dùng tối đa được giữ trong principal_cache, TTL = 0 để tắt cache
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+# Số thread băm mật khẩu, 0 để băm ngay trên event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 # Đối tượng dùng để băm mật khẩu (hash password)
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
+# pbkdf2 tốn hàng chục ms CPU mỗi lần, chạy trên thread pool riêng để không chặn event loop
+# (hashlib nhả GIL khi băm nên các thread chạy song song được)
+hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+) if PASSWORD_HASH_WORKERS > 0 else None
+
 
 def verify_password(plain_password, hashed_password):
     """Verify mật khẩu khi người dùng đăng nhập"""
@@ -22,6 +40,65 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def _run_hashing(fn, *args):
+    if hash_executor is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, fn, *args)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password chạy trên hash_executor, dùng trong các endpoint async"""
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    """get_password_hash chạy trên hash_executor, dùng trong các endpoint async"""
+    return await _run_hashing(get_password_hash, password)
+
+
+class PrincipalCache:
+    """
+    Cache username -> user id của các token đã xác thực, để get_current_user không phải
+    truy vấn bảng users ở mỗi request. Entry hết hạn sau ttl giây nên người dùng bị xóa
+    chỉ còn dùng được token tối đa ttl giây.
+    """
+
+    def __init__(self, ttl=AUTH_CACHE_TTL_SECONDS, max_entries=AUTH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            user_id, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return user_id
+
+    def put(self, username: str, user_id: int):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Cache dùng chung cho toàn bộ server
+principal_cache = PrincipalCache()
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Tạo access token cho người dùng trong phiên truy cập"""
     to_encode = data.copy()
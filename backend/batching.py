@@ -0,0 +1,129 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from . import inference
+from . import metrics
+from .executor import inference_executor
+
+# Cấu hình micro-batching (có thể ghi đè bằng biến môi trường)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+# Worker của một hàng đợi không có request trong khoảng này (giây) thì dừng và xóa hàng đợi
+BATCH_IDLE_SECONDS = float(os.getenv("BATCH_IDLE_SECONDS", "60"))
+
+
+class MicroBatcher:
+    """
+    Gom các request dịch cùng chiều trong một cửa sổ thời gian ngắn
+    rồi dịch chung trong một lần model.generate.
+    Mỗi chiều dịch có một hàng đợi và một worker thread riêng để gom batch,
+    còn model.generate được chạy trên thread pool của executor.
+    Chỉ chiều dịch được hỗ trợ mới có hàng đợi, và worker rảnh quá idle_seconds sẽ dừng.
+    """
+
+    def __init__(self, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, executor=inference_executor,
+                 idle_seconds=BATCH_IDLE_SECONDS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.idle_seconds = max(0.1, idle_seconds)
+        self.executor = executor
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, text: str, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None) -> Future:
+        """
+        Đưa một câu vào hàng đợi, trả về Future chứa (translated_text, error).
+        Caller cần tra cache (inference.get_cached_translation) trước khi gọi hàm này.
+        Mỗi adapter và preset giải mã có hàng đợi riêng vì một batch chỉ chạy được với một cấu hình.
+        Cấu hình có tham số ghi đè (giá trị tùy ý của client) không được gom batch mà chạy riêng trên executor,
+        để số hàng đợi (và worker thread) luôn hữu hạn.
+        """
+        future = Future()
+        if inference.get_direction(source_lang, target_lang) is None:
+            # Không tạo hàng đợi cho cặp ngôn ngữ tùy ý của client
+            future.set_result((None, "[Unsupported Language Pair]"))
+            return future
+        if not inference.is_adapter_available(source_lang, target_lang, adapter):
+            future.set_result((None, f"[Unknown Adapter: {adapter}]"))
+            return future
+        preset = inference.decoding_preset(decoding)
+        if preset is None:
+            return self.executor.submit(inference.perform_translation, text, source_lang, target_lang, adapter, decoding)
+        self._enqueue((source_lang, target_lang, adapter, preset), (text, future, time.perf_counter()))
+        return future
+
+    def _enqueue(self, key, item):
+        # Đưa vào hàng đợi khi đang giữ lock để worker không dừng giữa lúc lấy hàng đợi và put
+        with self._lock:
+            if key not in self._queues:
+                q = queue.Queue()
+                worker = threading.Thread(
+                    target=self._worker,
+                    args=(key, q),
+                    name=f"batcher-{key[0]}2{key[1]}-{key[3]}" + (f"-{key[2]}" if key[2] else ""),
+                    daemon=True
+                )
+                self._queues[key] = q
+                worker.start()
+            self._queues[key].put(item)
+
+    def _worker(self, key, q):
+        while True:
+            try:
+                batch = [q.get(timeout=self.idle_seconds)]
+            except queue.Empty:
+                with self._lock:
+                    if q.empty():
+                        del self._queues[key]
+                        return
+                continue
+            # Chờ thêm request cho đến khi đủ batch hoặc hết thời gian chờ
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Chờ batch hiện tại chạy xong, trong lúc đó các request mới tiếp tục dồn vào hàng đợi
+            # nên batch kế tiếp sẽ lớn hơn khi model đang bận
+            self.executor.submit(self._run_batch, key, batch).result()
+
+    def _run_batch(self, key, batch):
+        # Bỏ qua các request đã bị hủy
+        batch = [(text, future, enqueued) for text, future, enqueued in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Thời gian chờ từ lúc vào hàng đợi tới khi batch bắt đầu chạy (gom batch + chờ executor)
+        now = time.perf_counter()
+        for _, _, enqueued in batch:
+            metrics.QUEUE_WAIT_SECONDS.observe(now - enqueued, queue="batcher")
+        batch = [(text, future) for text, future, _ in batch]
+
+        source_lang, target_lang, adapter, preset = key
+        try:
+            translated_texts, error = inference.translate_batch(
+                [text for text, _ in batch], source_lang, target_lang,
+                check_cache=False, adapter=adapter, decoding={"preset": preset}
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        if error:
+            for _, future in batch:
+                future.set_result((None, error))
+            return
+
+        for (_, future), translated_text in zip(batch, translated_texts):
+            future.set_result((translated_text, None))
+
+
+# Batcher dùng chung cho toàn bộ server
+batcher = MicroBatcher()
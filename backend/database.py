@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Load biến môi trường từ file .env 
@@ -15,12 +17,54 @@ DB_PORT = os.getenv("DB_PORT", "5435")
 DB_NAME = os.getenv("DB_NAME", "translation_db")
 
 # Format: postgresql://<user>:<password>@<host>:<port>/<db_name>
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DATABASE_URL ghi đè toàn bộ URL (vd. sqlite:///bench.db khi chạy benchmark không có PostgreSQL)
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
 
-# Quản lý các kết nối tới postgreSQL
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Driver async cho các endpoint (asyncpg / aiosqlite), ASYNC_DATABASE_URL để chỉ định driver khác
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    _url.set(drivername=ASYNC_DRIVERS.get(_url.get_backend_name(), _url.drivername))
+    .render_as_string(hide_password=False)
+)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+
+# Cấu hình pool cho mỗi engine (mỗi process): số connection giữ sẵn, số connection tạo thêm khi pool hết,
+# thời gian chờ connection rảnh, thời gian (giây) trước khi thay connection cũ
+# (để không dùng connection đã bị database/proxy đóng), và kiểm tra connection trước khi dùng
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+if IS_SQLITE:
+    # SQLite là file cục bộ, giữ pool mặc định của SQLAlchemy (in-memory dùng một connection duy nhất)
+    pool_args = {}
+else:
+    pool_args = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Engine đồng bộ: migration lúc khởi động và các thread nền (history_writer, worker dịch file)
+# SQLite cần cho phép dùng connection từ nhiều thread (request, worker nền)
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **pool_args)
 # Tạo phiên làm việc
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Engine async cho các endpoint: chờ database không chặn event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_args)
+# expire_on_commit=False: đọc thuộc tính sau commit không cần query lại (lazy load không dùng được với async)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -30,3 +74,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,47 +1,52 @@
-from datasets import load_dataset
+from datasets import Dataset, DatasetDict, load_dataset, load_from_disk
+import glob
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 
+# Thư mục cache các tập train/eval đã tokenize (file Arrow, được memory-map khi load), rỗng để tắt cache
+TOKENIZED_CACHE_DIR = os.getenv(
+    "TOKENIZED_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenized_cache")
+)
+# Số process tokenize song song
+DATASET_NUM_PROC = int(os.getenv("DATASET_NUM_PROC", str(os.cpu_count() or 1)))
+# Seed cố định khi chia train/eval để cache (và kết quả đánh giá) tái lập được
+SPLIT_SEED = 42
+TEST_SIZE = 0.1
+# Số cặp câu tối đa lấy từ dataset trên Hugging Face Hub
+MAX_HUB_ROWS = 400000
+# Tăng khi đổi cách tiền xử lý để không dùng lại cache cũ
+PREPROCESS_VERSION = 1
 
-def load_and_preprocess_data(
-    dataset_path, 
-    dataset_name, 
-    dataset_config, 
-    tokenizer, 
-    max_length, 
-    source_lang, 
-    target_lang
-): 
-    """Tải dataset, chia tập train/test và tiền xử lý (tokenize)"""
-    if dataset_path and os.path.exists(dataset_path):
-        print(f"Loading dataset from {dataset_path}...")
-        if dataset_path.endswith('.json'):
-            dataset_dict = load_dataset("json", data_files=dataset_path)
-        else:
-            dataset_dict = load_dataset("csv", data_files=dataset_path)
-        dataset = dataset_dict[list(dataset_dict.keys())[0]]
-    else:
-        print(f"Using dataset {dataset_name} config {dataset_config}...")
-        dataset = load_dataset(dataset_name, dataset_config, split="train") 
-        if len(dataset) > 400000:
-            dataset = dataset.select(range(400000))   
-            
-    print(f"Dataset size: {len(dataset)}")
+# Chế độ streaming: số cặp câu trong bộ đệm xáo trộn, tỉ lệ cặp câu được giữ lại làm tập đánh giá
+# (chọn theo hash của câu nguồn) và số cặp câu tối đa của tập đánh giá
+STREAM_SHUFFLE_BUFFER = int(os.getenv("STREAM_SHUFFLE_BUFFER", "10000"))
+STREAM_EVAL_FRACTION = 0.01
+STREAM_EVAL_SIZE = 2000
+# Đuôi file đọc được ở chế độ streaming -> loại dữ liệu của load_dataset
+STREAM_FORMATS = {".json": "json", ".jsonl": "json", ".csv": "csv", ".parquet": "parquet"}
+# Các cột model cần sau khi tokenize
+MODEL_COLUMNS = ["input_ids", "attention_mask", "labels"]
 
-    # Chia train/val
-    dataset_split = dataset.train_test_split(test_size=0.1)
-    train_dataset = dataset_split["train"]
-    eval_dataset = dataset_split["test"]
+# Mapping ngôn ngữ cho mBART
+LANG_CODE_MAP = {
+    "en": "en_XX",
+    "vi": "vi_VN"
+}
 
-    # Mapping ngôn ngữ cho mBART
-    LANG_CODE_MAP = {
-        "en": "en_XX",
-        "vi": "vi_VN"
-    }
+
+def make_preprocess_function(tokenizer, max_length, source_lang, target_lang):
+    """Hàm tokenize một batch cặp câu (dùng cho Dataset.map / IterableDataset.map với batched=True)"""
+    # Lấy mã ngôn ngữ
+    source_code = LANG_CODE_MAP.get(source_lang, "en_XX")
+    target_code = LANG_CODE_MAP.get(target_lang, "vi_VN")
 
     def preprocess_function(examples):
         inputs = []
         targets = []
-        
+
         # Kiểm tra cấu trúc dữ liệu
         if "translation" in examples:
             inputs = [ex[source_lang] for ex in examples["translation"]]
@@ -50,27 +55,202 @@ def load_and_preprocess_data(
             inputs = examples[source_lang]
             targets = examples[target_lang]
 
-        # Lấy mã ngôn ngữ
-        source_code = LANG_CODE_MAP.get(source_lang, "en_XX")
-        target_code = LANG_CODE_MAP.get(target_lang, "vi_VN")
-        
         # Thiết lập mã ngôn ngữ nguồn và đích
         tokenizer.src_lang = source_code
         tokenizer.tgt_lang = target_code
-        
+
         # Tokenize input và output
         model_inputs = tokenizer(inputs, text_target=targets, max_length=max_length, truncation=True)
-        
+
         return model_inputs
 
-    print("Preprocessing dataset...")
-    tokenized_train = train_dataset.map(preprocess_function, batched=True, remove_columns=train_dataset.column_names)
-    tokenized_eval = eval_dataset.map(preprocess_function, batched=True, remove_columns=eval_dataset.column_names)
+    return preprocess_function
+
+
+def tokenizer_fingerprint(tokenizer):
+    """sha256 của các file tokenizer (vocab, sentencepiece model, special tokens, cấu hình)"""
+    digest = hashlib.sha256()
+    with tempfile.TemporaryDirectory() as tmp:
+        tokenizer.save_pretrained(tmp)
+        for name in sorted(os.listdir(tmp)):
+            digest.update(name.encode())
+            with open(os.path.join(tmp, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cache_fingerprint(dataset_path, dataset_name, dataset_config, tokenizer, max_length, source_lang, target_lang, split_seed):
+    """Khóa của cache: nguồn dữ liệu, seed chia tập, tokenizer, max_length và chiều dịch"""
+    if dataset_path and os.path.exists(dataset_path):
+        # File cục bộ: đổi nội dung thì đổi kích thước hoặc thời gian sửa
+        stat = os.stat(dataset_path)
+        source = {"path": os.path.abspath(dataset_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    else:
+        source = {"name": dataset_name, "config": dataset_config, "max_rows": MAX_HUB_ROWS}
+    key = {
+        "version": PREPROCESS_VERSION,
+        "source": source,
+        "split_seed": split_seed,
+        "test_size": TEST_SIZE,
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "max_length": max_length,
+        "direction": f"{source_lang}-{target_lang}",
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_and_preprocess_data(
+    dataset_path,
+    dataset_name,
+    dataset_config,
+    tokenizer,
+    max_length,
+    source_lang,
+    target_lang,
+    num_proc=DATASET_NUM_PROC,
+    split_seed=SPLIT_SEED,
+    cache_dir=TOKENIZED_CACHE_DIR
+):
+    """
+    Tải dataset, chia tập train/test và tiền xử lý (tokenize).
+    Kết quả được lưu vào cache_dir theo fingerprint, các lần chạy sau load thẳng từ cache (memory-map, không tokenize lại).
+    """
+    # Đặt mã ngôn ngữ trước khi tính fingerprint để cấu hình tokenizer luôn giống nhau
+    tokenizer.src_lang = LANG_CODE_MAP.get(source_lang, "en_XX")
+    tokenizer.tgt_lang = LANG_CODE_MAP.get(target_lang, "vi_VN")
+
+    cache_path = None
+    if cache_dir:
+        fingerprint = cache_fingerprint(
+            dataset_path, dataset_name, dataset_config, tokenizer, max_length, source_lang, target_lang, split_seed
+        )
+        cache_path = os.path.join(cache_dir, f"{source_lang}2{target_lang}-{fingerprint}")
+        if os.path.exists(cache_path):
+            print(f"Loading tokenized dataset from cache {cache_path}...")
+            splits = load_from_disk(cache_path)
+            return splits["train"], splits["eval"]
+
+    if dataset_path and os.path.exists(dataset_path):
+        print(f"Loading dataset from {dataset_path}...")
+        if dataset_path.endswith('.json'):
+            dataset_dict = load_dataset("json", data_files=dataset_path)
+        else:
+            dataset_dict = load_dataset("csv", data_files=dataset_path)
+        dataset = dataset_dict[list(dataset_dict.keys())[0]]
+    else:
+        print(f"Using dataset {dataset_name} config {dataset_config}...")
+        dataset = load_dataset(dataset_name, dataset_config, split="train")
+        if len(dataset) > MAX_HUB_ROWS:
+            dataset = dataset.select(range(MAX_HUB_ROWS))
+
+    print(f"Dataset size: {len(dataset)}")
+
+    # Chia train/val
+    dataset_split = dataset.train_test_split(test_size=TEST_SIZE, seed=split_seed)
+    train_dataset = dataset_split["train"]
+    eval_dataset = dataset_split["test"]
+
+    preprocess_function = make_preprocess_function(tokenizer, max_length, source_lang, target_lang)
+    num_proc = num_proc if num_proc and num_proc > 1 else None
+    print(f"Preprocessing dataset ({num_proc or 1} processes)...")
+    tokenized_train = train_dataset.map(
+        preprocess_function, batched=True, remove_columns=train_dataset.column_names, num_proc=num_proc
+    )
+    tokenized_eval = eval_dataset.map(
+        preprocess_function, batched=True, remove_columns=eval_dataset.column_names, num_proc=num_proc
+    )
     # Output sau khi tokenize
     # {
     #     'input_ids': [...],
     #     'attention_mask': [...],
     #     'labels': [...]
     # }
-    
+
+    if cache_path is None:
+        return tokenized_train, tokenized_eval
+
+    # Ghi vào thư mục tạm rồi đổi tên, để lần chạy bị ngắt giữa chừng không để lại cache dở dang
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    DatasetDict({"train": tokenized_train, "eval": tokenized_eval}).save_to_disk(tmp_path)
+    try:
+        os.replace(tmp_path, cache_path)
+        print(f"Tokenized dataset cached at {cache_path}")
+    except OSError:
+        # Process khác đã ghi cùng cache
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    splits = load_from_disk(cache_path)
+    return splits["train"], splits["eval"]
+
+
+def resolve_data_files(dataset_path):
+    """File, thư mục hoặc glob -> (loại dữ liệu của load_dataset, danh sách shard)"""
+    if os.path.isdir(dataset_path):
+        files = [
+            os.path.join(dataset_path, name) for name in sorted(os.listdir(dataset_path))
+            if os.path.splitext(name)[1].lower() in STREAM_FORMATS
+        ]
+    else:
+        files = sorted(glob.glob(dataset_path))
+    if not files:
+        raise ValueError(f"No data files found at {dataset_path}")
+    builders = {STREAM_FORMATS.get(os.path.splitext(path)[1].lower()) for path in files}
+    if len(builders) != 1 or None in builders:
+        raise ValueError(f"All data files must share one format ({', '.join(STREAM_FORMATS)}): {dataset_path}")
+    return builders.pop(), files
+
+
+def is_heldout(example, source_lang, eval_fraction):
+    """
+    Cặp câu thuộc tập đánh giá hay không. Chỉ phụ thuộc câu nguồn nên không đổi giữa các lần chạy,
+    khi thêm shard hay đổi thứ tự shard, và các cặp trùng câu nguồn luôn cùng một phía.
+    """
+    text = example["translation"][source_lang] if "translation" in example else example[source_lang]
+    bucket = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    return bucket < eval_fraction * 2 ** 64
+
+
+def load_streaming_data(
+    dataset_path,
+    dataset_name,
+    dataset_config,
+    tokenizer,
+    max_length,
+    source_lang,
+    target_lang,
+    shuffle_buffer=STREAM_SHUFFLE_BUFFER,
+    eval_fraction=STREAM_EVAL_FRACTION,
+    eval_size=STREAM_EVAL_SIZE,
+    seed=SPLIT_SEED
+):
+    """
+    Đọc dataset dạng stream cho dữ liệu lớn hơn RAM: các shard JSON/CSV/Parquet (file, thư mục hoặc glob)
+    hoặc dataset trên Hub (không giới hạn số dòng), tokenize trong lúc train.
+    Trả về (IterableDataset train, Dataset eval) đã tokenize, train chỉ dùng được với max_steps.
+    """
+    if dataset_path:
+        builder, files = resolve_data_files(dataset_path)
+        print(f"Streaming {len(files)} {builder} shard(s) from {dataset_path}...")
+        stream = load_dataset(builder, data_files=files, split="train", streaming=True)
+    else:
+        print(f"Streaming dataset {dataset_name} config {dataset_config}...")
+        stream = load_dataset(dataset_name, dataset_config, split="train", streaming=True)
+
+    preprocess_function = make_preprocess_function(tokenizer, max_length, source_lang, target_lang)
+
+    # Tập đánh giá: eval_size cặp câu held-out đầu tiên của stream, đọc một lần và giữ trong bộ nhớ
+    # (chỉ cần đọc khoảng eval_size / eval_fraction dòng đầu)
+    eval_rows = list(stream.filter(lambda ex: is_heldout(ex, source_lang, eval_fraction)).take(eval_size))
+    if not eval_rows:
+        raise ValueError("No held-out pairs found for evaluation, increase eval_fraction")
+    eval_dataset = Dataset.from_list(eval_rows)
+    tokenized_eval = eval_dataset.map(preprocess_function, batched=True, remove_columns=eval_dataset.column_names)
+    print(f"Eval size: {len(tokenized_eval)}")
+
+    # Tập train: các cặp câu còn lại, xáo trộn thứ tự shard và trong bộ đệm shuffle_buffer cặp câu
+    # (Trainer gọi set_epoch nên mỗi lượt qua dữ liệu có thứ tự khác)
+    train_stream = stream.filter(lambda ex: not is_heldout(ex, source_lang, eval_fraction))
+    if shuffle_buffer > 1:
+        train_stream = train_stream.shuffle(seed=seed, buffer_size=shuffle_buffer)
+    tokenized_train = train_stream.map(preprocess_function, batched=True).select_columns(MODEL_COLUMNS)
+
     return tokenized_train, tokenized_eval
@@ -1,7 +1,25 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
+import hashlib
 from .database import Base
+from .search import search_text_default
+
+
+def make_content_hash(original_text: str, translated_text: str) -> str:
+    """
+    sha256 của cặp (văn bản gốc, bản dịch), dùng để tra cứu bằng index thay vì so sánh cả cột Text.
+    Không gồm chiều dịch vì bảng ratings/contributions không lưu ngôn ngữ.
+    """
+    return hashlib.sha256(f"{original_text}\0{translated_text}".encode("utf-8")).hexdigest()
+
+
+def content_hash_default(translated_column: str):
+    """Giá trị mặc định của cột content_hash, tính từ các cột văn bản của chính bản ghi khi insert"""
+    def default(context):
+        params = context.get_current_parameters()
+        return make_content_hash(params["original_text"], params[translated_column])
+    return default
 
 
 class User(Base):
@@ -14,6 +32,10 @@ class User(Base):
 
 class TranslationHistory(Base):
     __tablename__ = "translation_history"
+    __table_args__ = (
+        Index("ix_translation_history_user_created", "user_id", "created_at"),
+        Index("ix_translation_history_user_hash", "user_id", "content_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -22,10 +44,17 @@ class TranslationHistory(Base):
     source_lang = Column(String(10))
     target_lang = Column(String(10))
     created_at = Column(DateTime, default=datetime.utcnow)
+    content_hash = Column(String(64), default=content_hash_default("translated_text"))
+    # Văn bản gốc + bản dịch đã chuẩn hóa cho tìm kiếm toàn văn (xem search.py)
+    search_text = deferred(Column(Text, default=search_text_default("translated_text")))
 
 
 class SavedTranslation(Base):
     __tablename__ = "saved_translations"
+    __table_args__ = (
+        Index("ix_saved_translations_user_created", "user_id", "created_at"),
+        Index("ix_saved_translations_user_hash", "user_id", "content_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -35,10 +64,16 @@ class SavedTranslation(Base):
     target_lang = Column(String(10))
 
     created_at = Column(DateTime, default=datetime.utcnow)
+    content_hash = Column(String(64), default=content_hash_default("translated_text"))
+    # Văn bản gốc + bản dịch đã chuẩn hóa cho tìm kiếm toàn văn (xem search.py)
+    search_text = deferred(Column(Text, default=search_text_default("translated_text")))
 
 
 class TranslationContribution(Base):
     __tablename__ = "contributions"
+    __table_args__ = (
+        Index("ix_contributions_user_hash", "user_id", "content_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -46,15 +81,55 @@ class TranslationContribution(Base):
     suggested_translation = Column(Text, nullable=False)
     source_lang = Column(String(10))
     target_lang = Column(String(10))
+    content_hash = Column(String(64), default=content_hash_default("suggested_translation"))
 
 
 
 class TranslationRating(Base):
     __tablename__ = "ratings"
+    __table_args__ = (
+        Index("ix_ratings_user_hash", "user_id", "content_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     original_text = Column(Text, nullable=False)
     translated_text = Column(Text, nullable=False)
     rating = Column(Integer, nullable=False) # 1-5
+    content_hash = Column(String(64), default=content_hash_default("translated_text"))
+
+
+class TranslationJob(Base):
+    __tablename__ = "translation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    filename = Column(String, nullable=False)
+    file_format = Column(String(10), nullable=False) # txt, csv, json
+    source_content = Column(Text, nullable=False)
+    source_lang = Column(String(10))
+    target_lang = Column(String(10))
+    status = Column(String(20), default="pending", nullable=False) # pending, running, completed, failed
+    total_chunks = Column(Integer, default=0, nullable=False)
+    done_chunks = Column(Integer, default=0, nullable=False)
+    failed_chunks = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TranslationJobChunk(Base):
+    __tablename__ = "translation_job_chunks"
+    __table_args__ = (
+        Index("ix_translation_job_chunks_status_job", "status", "job_id", "position"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("translation_jobs.id", ondelete="CASCADE"), index=True, nullable=False)
+    position = Column(Integer, nullable=False)
+    source_units = Column(Text, nullable=False) # JSON list các đoạn cần dịch
+    translated_units = Column(Text, nullable=True) # JSON list bản dịch tương ứng
+    status = Column(String(20), default="pending", nullable=False) # pending, running, done, failed
+    error = Column(Text, nullable=True)
+    claimed_at = Column(DateTime, nullable=True) # Lease của worker đang dịch chunk
 
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from . import metrics
+
+# Số thread chạy model.generate song song và số request dịch tối đa được chờ
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "64"))
+# Số giây client nên chờ trước khi gửi lại khi hàng đợi đầy (header Retry-After)
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+
+
+class QueueFullError(Exception):
+    """Hàng đợi dịch đã đầy, request cần được từ chối (503)"""
+
+
+class InferenceExecutor:
+    """
+    Thread pool riêng cho inference, tách khỏi event loop của FastAPI.
+    Giới hạn số request đang chờ bằng semaphore để trả 503 thay vì xếp hàng vô hạn.
+    """
+
+    def __init__(self, max_workers=INFERENCE_WORKERS, max_queue_depth=INFERENCE_QUEUE_DEPTH):
+        self.max_workers = max(1, max_workers)
+        self.max_queue_depth = max(1, max_queue_depth)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._slots = threading.BoundedSemaphore(self.max_queue_depth)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Số request đang chờ hoặc đang được dịch"""
+        return self._pending
+
+    @contextmanager
+    def reserve(self):
+        """Giữ một chỗ trong hàng đợi trong suốt thời gian xử lý request, raise QueueFullError nếu đầy"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_depth} pending requests)")
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            yield
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """Chạy hàm trên thread pool inference, trả về concurrent.futures.Future"""
+        submitted = time.perf_counter()
+
+        def run():
+            metrics.QUEUE_WAIT_SECONDS.observe(time.perf_counter() - submitted, queue="executor")
+            return fn(*args, **kwargs)
+
+        return self._pool.submit(run)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+# Executor dùng chung cho toàn bộ server
+inference_executor = InferenceExecutor()
+
+metrics.Gauge(
+    "inference_queue_pending", "Translation requests waiting or running on the inference executor",
+    function=lambda: inference_executor.pending
+)
@@ -0,0 +1,64 @@
+"""
+Merge LoRA adapter vào base model và lưu thành một checkpoint seq2seq thông thường.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m backend.export_merged --direction en2vi
+    MERGED_MODEL_DIR=/models/merged python -m backend.export_merged --direction vi2en   # -> /models/merged/vinai-vi2en
+Server (và bước export ONNX) chỉ đọc checkpoint tại MERGED_MODEL_DIR/vinai-<direction>.
+"""
+import argparse
+import json
+import os
+
+import torch
+from peft import PeftModel
+
+from . import inference
+from .translation_cache import adapter_fingerprint
+
+
+def export_merged_model(direction: str, output_dir: str = None):
+    """
+    Load base model + LoRA adapter, merge và lưu checkpoint (safetensors) kèm tokenizer.
+    output_dir mặc định là thư mục server load (MERGED_MODEL_DIR/vinai-<direction>), chỉ đổi khi dùng riêng (vd. benchmark).
+    """
+    base_model_name, adapter_path, merged_path = inference.get_model_paths(direction)
+    output_dir = output_dir or merged_path
+
+    if not os.path.exists(adapter_path):
+        raise FileNotFoundError(f"No LoRA adapter found at {adapter_path}")
+
+    # Merge trên CPU với float32 để tránh sai số khi cộng trọng số
+    device = torch.device("cpu")
+    model, tokenizer = inference.load_base_model(base_model_name, device)
+    model = model.float()
+
+    print(f"Loading LoRA adapter from {adapter_path}...")
+    model = PeftModel.from_pretrained(model, adapter_path)
+    print("Merging LoRA adapter into base weights...")
+    model = model.merge_and_unload()
+
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    tokenizer.save_pretrained(output_dir)
+
+    # Lưu thông tin adapter để cache bản dịch nhận biết checkpoint được merge từ adapter nào
+    merge_info = {
+        "direction": direction,
+        "base_model": base_model_name,
+        "adapter_path": os.path.relpath(adapter_path, inference.BASE_DIR),
+        "adapter_id": adapter_fingerprint(adapter_path),
+    }
+    with open(os.path.join(output_dir, inference.MERGE_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(merge_info, f, indent=2)
+
+    print(f"Merged model saved to {output_dir}")
+    return output_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge LoRA adapter into the base model")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], required=True)
+    args = parser.parse_args()
+
+    export_merged_model(args.direction)
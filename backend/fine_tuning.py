@@ -4,9 +4,54 @@ from transformers import (
     Seq2SeqTrainer,
     DataCollatorForSeq2Seq
 )
+from torch.utils.data import DataLoader
 import matplotlib.pyplot as plt
 from model import get_model_and_tokenizer
-from dataset_utils import load_and_preprocess_data
+from dataset_utils import (
+    load_and_preprocess_data, load_streaming_data,
+    DATASET_NUM_PROC, SPLIT_SEED, TOKENIZED_CACHE_DIR, STREAM_SHUFFLE_BUFFER
+)
+from length_bucketing import bucket_by_length, padding_stats
+
+
+class LengthBucketedTrainer(Seq2SeqTrainer):
+    """
+    Seq2SeqTrainer với DataLoader đánh giá chia batch theo số token (length_bucketing.py)
+    thay vì số câu cố định: câu ngắn được gom thành batch lớn, câu dài thành batch nhỏ, giảm padding khi generate.
+    """
+
+    def __init__(self, *args, eval_max_tokens=None, eval_max_batch_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.eval_max_tokens = eval_max_tokens
+        self.eval_max_batch_size = eval_max_batch_size
+        self._eval_batches = {}
+
+    def get_eval_dataloader(self, eval_dataset=None):
+        if isinstance(eval_dataset, str):
+            eval_dataset = self.eval_dataset[eval_dataset]
+        dataset = eval_dataset if eval_dataset is not None else self.eval_dataset
+
+        # Tập đánh giá không đổi giữa các lần evaluate nên chỉ chia batch một lần
+        if id(dataset) not in self._eval_batches:
+            lengths = [len(ids) for ids in dataset["input_ids"]]
+            batches = bucket_by_length(lengths, self.eval_max_tokens, self.eval_max_batch_size)
+            batch_size = self.args.eval_batch_size
+            fixed = [list(range(i, min(i + batch_size, len(lengths)))) for i in range(0, len(lengths), batch_size)]
+            print(
+                f"Eval padding ratio: {padding_stats(lengths, fixed)['padding_ratio']:.1%} "
+                f"({len(fixed)} batches of {batch_size}) -> {padding_stats(lengths, batches)['padding_ratio']:.1%} "
+                f"({len(batches)} length-bucketed batches)"
+            )
+            self._eval_batches[id(dataset)] = batches
+
+        dataloader = DataLoader(
+            dataset,
+            batch_sampler=self._eval_batches[id(dataset)],
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+        return self.accelerator.prepare(dataloader)
 
 
 def run_finetuning(
@@ -21,8 +66,23 @@ def run_finetuning(
     batch_size=16,
     grad_accumulation=2,
     num_epochs=3,
-    learning_rate=2e-4
+    learning_rate=2e-4,
+    eval_max_tokens=None,
+    num_proc=DATASET_NUM_PROC,
+    split_seed=SPLIT_SEED,
+    dataset_cache_dir=TOKENIZED_CACHE_DIR,
+    streaming=False,
+    max_steps=None,
+    shuffle_buffer=STREAM_SHUFFLE_BUFFER
 ):
+    """
+    streaming=True: đọc dataset_path (file, thư mục hoặc glob các shard JSON/CSV/Parquet) hoặc dataset trên Hub
+    dạng stream và tokenize trong lúc train, bộ nhớ không phụ thuộc kích thước dữ liệu.
+    Số epoch không xác định được với stream nên phải chỉ định max_steps (lịch learning rate tính theo số bước).
+    max_steps cũng dùng được khi không streaming, khi đó thay cho num_epochs.
+    """
+    if streaming and not max_steps:
+        raise ValueError("Streaming mode requires max_steps")
     
     # Tải model, tokenizer và cấu hình LoRA
     model, tokenizer = get_model_and_tokenizer(model_name)
@@ -37,15 +97,32 @@ def run_finetuning(
     print(f"Forced BOS token ID for evaluation set to: {model.config.forced_bos_token_id} ({target_code})")
 
     # Chuẩn bị dữ liệu
-    tokenized_train, tokenized_eval = load_and_preprocess_data(  
-        dataset_path, 
-        dataset_name, 
-        dataset_config, 
-        tokenizer, 
-        max_length, 
-        source_lang, 
-        target_lang
-    )
+    if streaming:
+        tokenized_train, tokenized_eval = load_streaming_data(
+            dataset_path,
+            dataset_name,
+            dataset_config,
+            tokenizer,
+            max_length,
+            source_lang,
+            target_lang,
+            shuffle_buffer=shuffle_buffer,
+            seed=split_seed
+        )
+    else:
+        # Dùng lại tập đã tokenize trong dataset_cache_dir nếu có
+        tokenized_train, tokenized_eval = load_and_preprocess_data(  
+            dataset_path, 
+            dataset_name, 
+            dataset_config, 
+            tokenizer, 
+            max_length, 
+            source_lang, 
+            target_lang,
+            num_proc=num_proc,
+            split_seed=split_seed,
+            cache_dir=dataset_cache_dir
+        )
 
     # Tham số huấn luyện
     args = Seq2SeqTrainingArguments(
@@ -56,6 +133,7 @@ def run_finetuning(
         weight_decay=0.01,
         save_total_limit=1,
         num_train_epochs=num_epochs,
+        max_steps=max_steps or -1,   # > 0 thì ghi đè num_train_epochs
         predict_with_generate=True,
         fp16=True,       # Dùng 16-bit để lưu và tính toán số thập phân
         gradient_accumulation_steps=grad_accumulation,
@@ -72,12 +150,16 @@ def run_finetuning(
     data_collator = DataCollatorForSeq2Seq(tokenizer, model=model)
 
     # Khởi tạo Trainer
-    trainer = Seq2SeqTrainer(
+    # Batch đánh giá giới hạn theo số token, mặc định bằng batch cố định toàn câu dài nhất (batch_size x max_length)
+    # nên bộ nhớ không vượt quá trước đây; số câu mỗi batch tối đa gấp 4 lần để generate không quá dài
+    trainer = LengthBucketedTrainer(
         model=model,
         args=args,
         train_dataset=tokenized_train,
         eval_dataset=tokenized_eval,
         data_collator=data_collator,
+        eval_max_tokens=eval_max_tokens or batch_size * max_length,
+        eval_max_batch_size=4 * batch_size,
     )
 
     # Huấn luyện (Train)
@@ -0,0 +1,206 @@
+"""
+Ghi lịch sử dịch kiểu write-behind: request dịch chỉ đưa bản ghi vào bộ đệm trong bộ nhớ rồi trả về ngay,
+một thread nền ghi các bản ghi theo batch (đủ HISTORY_FLUSH_MAX_ROWS bản ghi hoặc sau HISTORY_FLUSH_INTERVAL_MS).
+Mỗi batch là một câu INSERT nhiều dòng kèm upsert trên khóa nội dung (user_id, content_hash, source_lang, target_lang):
+bản dịch đã có trong lịch sử chỉ được cập nhật created_at (đưa lên đầu) thay vì tạo bản ghi trùng.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, inspect, select, tuple_
+
+from . import database
+from . import db_models
+from . import metrics
+from .search import make_search_text
+
+HISTORY_FLUSH_MAX_ROWS = int(os.getenv("HISTORY_FLUSH_MAX_ROWS", "500"))
+HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "200"))
+# Số bản ghi tối đa được giữ khi database lỗi, vượt quá thì bỏ các bản ghi cũ nhất
+HISTORY_BUFFER_MAX_ROWS = int(os.getenv("HISTORY_BUFFER_MAX_ROWS", "50000"))
+
+# Khóa nội dung của một bản ghi lịch sử và unique index trên khóa này
+# (migrations.py chỉ tạo index khi lịch sử không có bản trùng hoặc sau --dedupe-history)
+CONTENT_KEY = ("user_id", "content_hash", "source_lang", "target_lang")
+CONTENT_INDEX = "ux_translation_history_content"
+
+
+def has_content_index(connection) -> bool:
+    indexes = inspect(connection).get_indexes(db_models.TranslationHistory.__tablename__)
+    return any(index["name"] == CONTENT_INDEX for index in indexes)
+
+
+def upsert_history(connection, rows, on_conflict: bool = True):
+    """
+    Ghi các bản ghi lịch sử (dict có đủ cột, kể cả content_hash/search_text/created_at),
+    bản ghi trùng khóa nội dung chỉ cập nhật created_at.
+    on_conflict=False khi database chưa có unique index CONTENT_INDEX.
+    """
+    # ON CONFLICT không cho một câu lệnh cập nhật cùng một dòng 2 lần, nên chỉ giữ bản mới nhất của mỗi khóa
+    latest = {}
+    for row in rows:
+        key = tuple(row[column] for column in CONTENT_KEY)
+        if key not in latest or row["created_at"] >= latest[key]["created_at"]:
+            latest[key] = row
+    table = db_models.TranslationHistory.__table__
+
+    dialect = connection.dialect.name
+    if on_conflict and dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table).values(list(latest.values()))
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c[column] for column in CONTENT_KEY],
+            set_={"created_at": statement.excluded.created_at}
+        ))
+        return
+
+    # Chưa có unique index hoặc database khác: cập nhật bản ghi mới nhất của các khóa đã có
+    # (một câu UPDATE chạy executemany, tra bằng index (user_id, content_hash)) rồi insert phần còn lại
+    key_columns = tuple_(*(table.c[column] for column in CONTENT_KEY))
+    existing = {}
+    for row_id, *key in connection.execute(
+        select(table.c.id, *(table.c[column] for column in CONTENT_KEY)).where(key_columns.in_(list(latest)))
+    ):
+        key = tuple(key)
+        existing[key] = max(row_id, existing.get(key, row_id))
+    if existing:
+        connection.execute(
+            table.update().where(table.c.id == bindparam("row_id")).values(created_at=bindparam("new_created_at")),
+            [{"row_id": row_id, "new_created_at": latest[key]["created_at"]} for key, row_id in existing.items()]
+        )
+    new_rows = [row for key, row in latest.items() if key not in existing]
+    if new_rows:
+        connection.execute(insert(table), new_rows)
+
+
+class HistoryWriter:
+    """Bộ đệm lịch sử dịch dùng chung, thread ghi được tạo khi có bản ghi đầu tiên"""
+
+    def __init__(self, max_rows=HISTORY_FLUSH_MAX_ROWS, interval_ms=HISTORY_FLUSH_INTERVAL_MS,
+                 max_buffer_rows=HISTORY_BUFFER_MAX_ROWS):
+        self.max_rows = max(1, max_rows)
+        self.interval = interval_ms / 1000
+        self.max_buffer_rows = max_buffer_rows
+        self._rows = []
+        self._condition = threading.Condition()
+        # Chỉ một lần ghi tại một thời điểm (thread nền hoặc flush() từ request)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        # Database có unique index CONTENT_INDEX hay không, None = chưa kiểm tra
+        self._content_index = None
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+    def add(self, user_id: int, original_text: str, translated_text: str, source_lang: str, target_lang: str):
+        self.add_many([(user_id, original_text, translated_text, source_lang, target_lang)])
+
+    def add_many(self, records):
+        """records: các tuple (user_id, original_text, translated_text, source_lang, target_lang)"""
+        created_at = datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id,
+                "original_text": original_text,
+                "translated_text": translated_text,
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "created_at": created_at,
+                "content_hash": db_models.make_content_hash(original_text, translated_text),
+                "search_text": make_search_text(original_text, translated_text),
+            }
+            for user_id, original_text, translated_text, source_lang, target_lang in records
+        ]
+        if not rows:
+            return
+        with self._condition:
+            was_empty = not self._rows
+            self._rows.extend(rows)
+            self._start_locked()
+            # Đánh thức thread ghi để bắt đầu đếm thời gian chờ, hoặc ghi ngay khi đủ batch
+            if was_empty or len(self._rows) >= self.max_rows:
+                self._condition.notify()
+
+    def flush(self):
+        """Ghi ngay mọi bản ghi đang chờ (trả về khi đã ghi xong hoặc lỗi)"""
+        with self._flush_lock:
+            while True:
+                with self._condition:
+                    batch = self._rows[:self.max_rows]
+                    del self._rows[:self.max_rows]
+                if not batch:
+                    return
+                if not self._write(batch):
+                    return
+
+    def stop(self, timeout=None):
+        """Dừng thread nền và ghi nốt các bản ghi còn lại"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+        with self._condition:
+            self._thread = None
+            self._stopping = False
+
+    def _start_locked(self):
+        if self._thread is None and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and not self._rows:
+                    self._condition.wait()
+                # Bản ghi đầu tiên chờ tối đa interval để gom thêm bản ghi vào cùng batch
+                deadline = time.monotonic() + self.interval
+                while not self._stopping and len(self._rows) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def _write(self, batch) -> bool:
+        """Ghi một batch, lỗi thì đưa batch về đầu bộ đệm để thread nền thử lại sau interval"""
+        try:
+            with metrics.STAGE_SECONDS.time(stage="history_write"):
+                with database.engine.begin() as connection:
+                    if self._content_index is None:
+                        self._content_index = has_content_index(connection)
+                    upsert_history(connection, batch, on_conflict=self._content_index)
+            metrics.HISTORY_ROWS.inc(len(batch), result="written")
+            return True
+        except Exception as e:
+            print(f"History writer error: {e}")
+            # Index có thể vừa được tạo/xóa, kiểm tra lại ở lần ghi sau
+            self._content_index = None
+            with self._condition:
+                self._rows[:0] = batch
+                overflow = len(self._rows) - self.max_buffer_rows
+                if overflow > 0:
+                    del self._rows[:overflow]
+                    metrics.HISTORY_ROWS.inc(overflow, result="dropped")
+            return False
+
+
+# Bộ đệm dùng chung cho toàn bộ server
+history_writer = HistoryWriter()
+
+metrics.Gauge(
+    "history_buffer_pending", "History rows waiting to be written to the database",
+    function=lambda: history_writer.pending
+)
@@ -1,12 +1,29 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-from peft import PeftModel
 import os
 import re
+import json
+import threading
+import time
+from functools import lru_cache
+from .translation_cache import TranslationCache, make_key, adapter_fingerprint
+from .segmentation import split_segments, join_segments
+from .model_registry import registry, AdapterError, DEFAULT_ADAPTER
+from . import metrics
+from .length_bucketing import bucket_by_length, restore_order
 
 # Biến toàn cục chứa model
 models = {}
 tokenizers = {}
+# Fingerprint của adapter đã load cho mỗi chiều dịch
+adapter_ids = {}
+# Lock theo chiều dịch để 2 thread (startup và request đầu tiên) không load cùng một model 2 lần
+_load_locks = {"en2vi": threading.Lock(), "vi2en": threading.Lock()}
+
+# Cache bản dịch dùng chung
+translation_cache = TranslationCache()
+metrics.Gauge(
+    "translation_cache_hit_rate", "Overall translation cache hit rate since startup",
+    function=lambda: translation_cache.hits / max(1, translation_cache.hits + translation_cache.misses)
+)
 
 # Cấu hình
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,106 +33,595 @@ VI2EN_LORA_PATH = os.path.join(BASE_DIR, "lora-vinai-vi2en")
 EN2VI_BASE = "vinai/vinai-translate-en2vi"
 VI2EN_BASE = "vinai/vinai-translate-vi2en"
 
+# Merge LoRA vào trọng số gốc khi load (tắt bằng MERGE_LORA=0 nếu cần giữ adapter riêng)
+MERGE_LORA = os.getenv("MERGE_LORA", "1") == "1"
+# Thư mục chứa checkpoint đã merge sẵn (tạo bằng export_merged.py)
+MERGED_MODEL_DIR = os.getenv("MERGED_MODEL_DIR", os.path.join(BASE_DIR, "merged"))
+MERGE_INFO_FILE = "merge_info.json"
+# Engine chạy model: "torch" (Hugging Face generate) hoặc "onnx" (ONNX Runtime, xem onnx_engine.py)
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "torch").lower()
+# Lượng tử hóa khi chạy trên CPU: "none" (float32) hoặc "int8" (dynamic int8 cho các lớp Linear)
+QUANTIZATION = os.getenv("QUANTIZATION", "none").lower()
+
+# torch, transformers và peft chỉ được import khi thực sự load model hoặc dịch,
+# nên các process chỉ phục vụ auth/lịch sử khởi động nhanh hơn
+
+# Cấu hình giải mã (là một phần của key cache). Mỗi preset đánh đổi tốc độ và chất lượng,
+# so sánh bằng benchmarks/bench_decoding.py. Request có thể chọn preset và ghi đè từng tham số.
+# Số token được sinh tối đa tỉ lệ với độ dài đầu vào: max_new_tokens_offset + max_new_tokens_ratio * số token đầu vào,
+# để câu ngắn không thể bị lặp vô hạn tới 1024 token.
+DECODING_PRESETS = {
+    "fast": {
+        "num_beams": 1, # Greedy search
+        "max_new_tokens_ratio": 2.0,
+        "max_new_tokens_offset": 10,
+        "repetition_penalty": 1.0,
+        "no_repeat_ngram_size": 0,
+        "length_penalty": 1.0,
+        "early_stopping": False,
+    },
+    "balanced": {
+        "num_beams": 3,
+        "max_new_tokens_ratio": 2.0,
+        "max_new_tokens_offset": 10,
+        "repetition_penalty": 1.0,
+        "no_repeat_ngram_size": 4,
+        "length_penalty": 1.0,
+        "early_stopping": True,
+    },
+    "quality": {
+        "num_beams": 5,
+        "max_new_tokens_ratio": 2.0,
+        "max_new_tokens_offset": 10,
+        "repetition_penalty": 1.0,
+        "no_repeat_ngram_size": 4,
+        "length_penalty": 1.0,
+        "early_stopping": True,
+    },
+}
+DECODING_PRESET = os.getenv("DECODING_PRESET", "fast")
+# Giới hạn cứng số token sinh ra, bất kể cấu hình của request
+MAX_NEW_TOKENS_LIMIT = int(os.getenv("MAX_NEW_TOKENS_LIMIT", "1024"))
+
+# Số câu tối đa trong một lần generate khi dịch văn bản dài
+DOCUMENT_BATCH_SIZE = int(os.getenv("DOCUMENT_BATCH_SIZE", "16"))
+# Số token tối đa (số câu x câu dài nhất, tính cả padding) trong một lần generate, 0 = không giới hạn.
+# Batch vượt quá được chia nhỏ theo độ dài token (length_bucketing.py)
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "1024"))
+
+
+def get_model_paths(direction: str):
+    """Trả về (tên base model, thư mục LoRA adapter, thư mục model đã merge) của chiều dịch"""
+    if direction == "en2vi":
+        base_model_name, adapter_path = EN2VI_BASE, EN2VI_LORA_PATH
+    else:
+        base_model_name, adapter_path = VI2EN_BASE, VI2EN_LORA_PATH
+    return base_model_name, adapter_path, os.path.join(MERGED_MODEL_DIR, f"vinai-{direction}")
+
+
+def resolve_decoding(options: dict = None) -> dict:
+    """
+    Ghép preset (mặc định DECODING_PRESET) với các tham số ghi đè, trả về cấu hình đầy đủ.
+    Gọi lại với kết quả trả về cho ra cùng cấu hình.
+    """
+    options = dict(options or {})
+    preset = options.pop("preset", None) or DECODING_PRESET
+    if preset not in DECODING_PRESETS:
+        raise ValueError(f"Unknown decoding preset: {preset}")
+    decoding = dict(DECODING_PRESETS[preset])
+    unknown = set(options) - set(decoding)
+    if unknown:
+        raise ValueError(f"Unknown decoding options: {sorted(unknown)}")
+    decoding.update({key: value for key, value in options.items() if value is not None})
+    return decoding
+
+
+def decoding_preset(decoding: dict = None):
+    """Tên preset có cấu hình trùng hoàn toàn với decoding (sau khi resolve), None nếu có tham số ghi đè khác preset"""
+    resolved = resolve_decoding(decoding)
+    return next((name for name, preset in DECODING_PRESETS.items() if preset == resolved), None)
+
+
+def generation_kwargs(decoding: dict, input_length: int) -> dict:
+    """Tham số cho model.generate, max_new_tokens tính theo độ dài đầu vào (đã pad) của batch"""
+    max_new_tokens = int(decoding["max_new_tokens_offset"] + decoding["max_new_tokens_ratio"] * input_length)
+    return {
+        "max_new_tokens": max(1, min(max_new_tokens, MAX_NEW_TOKENS_LIMIT)),
+        "num_beams": decoding["num_beams"],
+        "repetition_penalty": decoding["repetition_penalty"],
+        "no_repeat_ngram_size": decoding["no_repeat_ngram_size"],
+        "length_penalty": decoding["length_penalty"],
+        "early_stopping": decoding["early_stopping"],
+    }
+
+
+def get_torch_dtype():
+    import torch
+    return torch.float16 if torch.cuda.is_available() else torch.float32
+
+
+def is_cached_locally(model_name: str) -> bool:
+    """Kiểm tra model đã có trên máy (thư mục hoặc cache Hugging Face) mà không cần gọi mạng"""
+    if os.path.isdir(model_name):
+        return True
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        return isinstance(try_to_load_from_cache(model_name, "config.json"), str)
+    except Exception:
+        return False
+
+
+def load_base_model(base_model_name: str, device):
+    """Load base model và tokenizer, dùng cache cục bộ nếu đã có, chỉ tải từ Hugging Face Hub khi chưa có"""
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    local = is_cached_locally(base_model_name)
+    print(f"Loading {base_model_name} from {'local cache' if local else 'Hugging Face Hub'}...")
+    model = AutoModelForSeq2SeqLM.from_pretrained(
+        base_model_name,
+        torch_dtype=get_torch_dtype(),
+        local_files_only=local
+    ).to(device)
+    tokenizer = AutoTokenizer.from_pretrained(base_model_name, use_fast=True, local_files_only=local)
+
+    return model, tokenizer
+
+
+def quantize_model(model, mode: str = None):
+    """
+    Lượng tử hóa dynamic int8 các lớp Linear (chỉ hỗ trợ CPU).
+    Gọi sau khi đã merge LoRA để trọng số LoRA cũng được lượng tử hóa.
+    """
+    mode = (mode or QUANTIZATION).lower()
+    if mode in ("", "none"):
+        return model
+    import torch
+    if mode != "int8":
+        raise ValueError(f"Unsupported quantization mode: {mode}")
+    if next(model.parameters()).device.type != "cpu":
+        print("Dynamic int8 quantization is only supported on CPU. Skipping.")
+        return model
+
+    print("Applying dynamic int8 quantization to Linear layers...")
+    return torch.ao.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+
 
 def load_model(direction="en2vi"):
     """
     Hàm load model + LoRA adapter (nếu có).
-    Chỉ load khi cần để tiết kiệm RAM.
+    Được gọi khi khởi động server (startup.py) hoặc ở request đầu tiên nếu MODEL_LOADING=lazy.
+    Nếu đã có checkpoint merge sẵn (export_merged.py) thì load trực tiếp checkpoint đó.
     """
-    global models, tokenizers
-    
     if direction in models:
         return models[direction], tokenizers[direction]
 
+    with _load_locks[direction]:
+        if direction in models:
+            return models[direction], tokenizers[direction]
+        return _load_model(direction)
+
+
+def _load_model(direction):
+    import torch
+
     print(f"Loading model for {direction}...")
     
-    if direction == "en2vi":
-        base_model_name = EN2VI_BASE
-        adapter_path = EN2VI_LORA_PATH
-    else:
-        base_model_name = VI2EN_BASE
-        adapter_path = VI2EN_LORA_PATH
+    base_model_name, adapter_path, merged_path = get_model_paths(direction)
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    
-    try:
-        print(f"Attempting to load {base_model_name} from local cache...")
-        # Thử load từ cache cục bộ trước
-        model = AutoModelForSeq2SeqLM.from_pretrained(
-            base_model_name,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            local_files_only=True
-        ).to(device)
-        
-        tokenizer = AutoTokenizer.from_pretrained(
-            base_model_name, 
-            local_files_only=True
-        )
-        print("Loaded from local cache.")
 
-    except Exception as e:
-        print(f"Local cache cannot found ({e}). Downloading from Hugging Face Hub...")
-        # Chuyển sang tải online 
+    merge_info_path = os.path.join(merged_path, MERGE_INFO_FILE)
+    # Có adapter phụ (adapters/<direction>/...) => giữ PeftModel chưa merge để đổi adapter theo request
+    multi_adapter = INFERENCE_ENGINE != "onnx" and registry.has_extra_adapters(direction) and os.path.exists(adapter_path)
+    if INFERENCE_ENGINE == "onnx":
+        # Model ONNX đã export sẵn, có cùng interface generate() như model Hugging Face
+        from .onnx_engine import load_onnx_model
+        model, tokenizer, adapter_id = load_onnx_model(direction)
+    elif os.path.exists(merge_info_path) and not multi_adapter:
+        # Checkpoint đã merge LoRA: một model seq2seq thông thường
+        # Trọng số safetensors được đọc qua mmap, tokenizer.json là tokenizer fast đã serialize sẵn
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+        print(f"Loading merged model from {merged_path}...")
         model = AutoModelForSeq2SeqLM.from_pretrained(
-            base_model_name,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+            merged_path,
+            torch_dtype=get_torch_dtype(),
+            local_files_only=True,
+            use_safetensors=True
         ).to(device)
-        
-        tokenizer = AutoTokenizer.from_pretrained(base_model_name)
-
-    # Tải LoRA Adapter
-    if os.path.exists(adapter_path):
-        print(f"Loading LoRA adapter from {adapter_path}...")
-        model = PeftModel.from_pretrained(model, adapter_path).to(device)
+        tokenizer = AutoTokenizer.from_pretrained(merged_path, use_fast=True, local_files_only=True)
+        with open(merge_info_path, encoding="utf-8") as f:
+            adapter_id = json.load(f)["adapter_id"]
+        if os.path.exists(adapter_path) and adapter_id != adapter_fingerprint(adapter_path):
+            print(f"Warning: merged model at {merged_path} was built from a different adapter than {adapter_path}.")
     else:
-        print(f"No LoRA adapter found at {adapter_path}. Using base model.")
+        model, tokenizer = load_base_model(base_model_name, device)
+
+        # Tải LoRA Adapter
+        if os.path.exists(adapter_path):
+            from peft import PeftModel
+            print(f"Loading LoRA adapter from {adapter_path}...")
+            model = PeftModel.from_pretrained(model, adapter_path, adapter_name=DEFAULT_ADAPTER).to(device)
+            if MERGE_LORA and not multi_adapter:
+                # Cộng trọng số LoRA vào trọng số gốc một lần, bỏ các phép nhân low-rank ở mỗi forward
+                print("Merging LoRA adapter into base weights...")
+                model = model.merge_and_unload()
+        else:
+            print(f"No LoRA adapter found at {adapter_path}. Using base model.")
+        adapter_id = adapter_fingerprint(adapter_path)
+
+    if multi_adapter:
+        # Lượng tử hóa thay thế các lớp Linear mà LoRA bám vào nên không dùng cùng adapter phụ
+        if QUANTIZATION not in ("", "none"):
+            print("Quantization is disabled because extra LoRA adapters are configured.")
+        registry.attach(direction, model)
+    elif INFERENCE_ENGINE != "onnx":
+        model = quantize_model(model)
+    model.eval()
+    # Độ dài sinh được tính theo từng request (generation_kwargs), bỏ max_length mặc định của checkpoint
+    if getattr(model, "generation_config", None) is not None:
+        model.generation_config.max_length = None
+
+    # Xóa các bản dịch cache được tạo bởi adapter cũ
+    adapter_ids[direction] = adapter_id
+    translation_cache.invalidate_adapter(direction, adapter_id)
 
     models[direction] = model
     tokenizers[direction] = tokenizer
     return model, tokenizer
 
 
-def perform_translation(text: str, source_lang: str, target_lang: str):
-    """Thực hiện dịch trên model đã load"""
+# Câu mẫu với nhiều độ dài khác nhau để warmup (cấp phát bộ nhớ, khởi tạo kernel) trước request thật
+WARMUP_TEXTS = {
+    "en": [
+        "Hello.",
+        "The weather is nice today, so we are going to the park.",
+        "Machine translation systems have improved considerably over the last decade, "
+        "but long sentences with several clauses, numbers such as 2024 and proper names "
+        "like Hanoi or Ho Chi Minh City are still a good test of their quality.",
+    ],
+    "vi": [
+        "Xin chào.",
+        "Hôm nay trời đẹp nên chúng tôi sẽ đi dạo công viên.",
+        "Các hệ thống dịch máy đã tiến bộ đáng kể trong thập kỷ qua, "
+        "nhưng những câu dài có nhiều mệnh đề, con số như 2024 và tên riêng "
+        "như Hà Nội hay Thành phố Hồ Chí Minh vẫn là phép thử tốt cho chất lượng của chúng.",
+    ],
+}
+
+
+def warmup_model(direction: str):
+    """
+    Chạy generate với các câu mẫu ngắn, vừa, dài (từng câu và cả batch).
+    Không đọc và ghi cache bản dịch. Trả về số giây đã chạy.
+    """
+    import torch
+
+    source_lang, target_lang = ("en", "vi") if direction == "en2vi" else ("vi", "en")
+    model, tokenizer = load_model(direction)
+    texts = WARMUP_TEXTS[source_lang]
+
+    start = time.perf_counter()
+    tokenizer.src_lang = LANG_CODE_MAP[source_lang]
+    for batch in [[text] for text in texts] + [texts]:
+        inputs = tokenizer(batch, return_tensors="pt", padding=True, max_length=1024, truncation=True).to(model.device)
+        with registry.activate(direction), torch.no_grad():
+            model.generate(
+                input_ids=inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                decoder_start_token_id=tokenizer.lang_code_to_id[LANG_CODE_MAP[target_lang]],
+                **generation_kwargs(resolve_decoding(), inputs.input_ids.shape[1])
+            )
+    return time.perf_counter() - start
+
+
+LANG_CODE_MAP = {
+    "en": "en_XX", 
+    "vi": "vi_VN"
+}
+
+
+def get_direction(source_lang: str, target_lang: str):
+    """Trả về chiều dịch (en2vi / vi2en), None nếu cặp ngôn ngữ không hỗ trợ"""
     if source_lang == "en" and target_lang == "vi":
-        direction = "en2vi"
-    elif source_lang == "vi" and target_lang == "en":
-        direction = "vi2en"
-    else:
+        return "en2vi"
+    if source_lang == "vi" and target_lang == "en":
+        return "vi2en"
+    return None
+
+
+def get_adapter_id(direction: str) -> str:
+    """Định danh adapter của chiều dịch: adapter đã load, hoặc adapter trên đĩa nếu model chưa load"""
+    if direction in adapter_ids:
+        return adapter_ids[direction]
+    _, adapter_path, _ = get_model_paths(direction)
+    return adapter_fingerprint(adapter_path)
+
+
+def get_cache_scope(direction: str, adapter: str = None):
+    """Trả về (nhóm cache, adapter_id): mỗi adapter phụ có nhóm riêng để việc load lại adapter mặc định không xóa cache của nó"""
+    if adapter in (None, DEFAULT_ADAPTER):
+        return direction, get_adapter_id(direction)
+    return f"{direction}/{adapter}", registry.adapter_id(direction, adapter)
+
+
+def get_cache_key(text: str, direction: str, adapter: str = None, decoding: dict = None) -> str:
+    # Engine và chế độ lượng tử hóa cho kết quả hơi khác nhau nên cũng là một phần của key
+    params = dict(
+        resolve_decoding(decoding),
+        max_new_tokens_limit=MAX_NEW_TOKENS_LIMIT,
+        quantization=QUANTIZATION,
+        engine=INFERENCE_ENGINE
+    )
+    scope, adapter_id = get_cache_scope(direction, adapter)
+    return make_key(text, scope, params, adapter_id)
+
+
+def is_adapter_available(source_lang: str, target_lang: str, adapter: str = None) -> bool:
+    direction = get_direction(source_lang, target_lang)
+    return direction is not None and registry.is_available(direction, adapter)
+
+
+def get_cached_translation(text: str, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None):
+    """
+    Tra cache bản dịch mà không cần load model hay tokenizer, trả về None nếu chưa có.
+    Có thể đọc tầng SQLite và stat file adapter nên từ event loop cần chạy qua asyncio.to_thread.
+    """
+    return get_cached_translations([text], source_lang, target_lang, adapter, decoding)[0]
+
+
+def get_cached_translations(texts, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None):
+    """Phiên bản nhiều câu của get_cached_translation (một lần chuyển thread cho cả văn bản)"""
+    texts = list(texts)
+    direction = get_direction(source_lang, target_lang)
+    if direction is None or not registry.is_available(direction, adapter):
+        return [None] * len(texts)
+    results = [translation_cache.get(get_cache_key(text, direction, adapter, decoding)) for text in texts]
+    if texts:
+        metrics.CACHE_HIT_RATIO.observe(sum(result is not None for result in results) / len(texts))
+    return results
+
+
+def translate_batch(texts, source_lang: str, target_lang: str, check_cache: bool = True, adapter: str = None, decoding: dict = None):
+    """
+    Dịch nhiều câu cùng chiều.
+    Câu đã có trong cache được trả về ngay, các câu còn lại được chia bucket theo số token
+    (tối đa BATCH_MAX_TOKENS token mỗi lần model.generate) rồi ghép lại theo thứ tự ban đầu.
+    check_cache=False khi caller đã tra cache trước đó (kết quả vẫn được ghi vào cache).
+    adapter: tên LoRA adapter phụ (xem model_registry.py), None là adapter mặc định.
+    decoding: preset và tham số giải mã (xem resolve_decoding), None là DECODING_PRESET.
+    Trả về danh sách bản dịch theo đúng thứ tự đầu vào.
+    """
+    direction = get_direction(source_lang, target_lang)
+    if direction is None:
         return None, "[Unsupported Language Pair]"
+    if not registry.is_available(direction, adapter):
+        return None, f"[Unknown Adapter: {adapter}]"
+
+    texts = list(texts)
+    decoding = resolve_decoding(decoding)
+    keys = [get_cache_key(text, direction, adapter, decoding) for text in texts]
+    if check_cache:
+        results = [translation_cache.get(key) for key in keys]
+    else:
+        results = [None] * len(texts)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if check_cache and texts:
+        metrics.CACHE_HIT_RATIO.observe(1 - len(missing) / len(texts))
+    if not missing:
+        return results, None
+
+    import torch
 
     model, tokenizer = load_model(direction)
     
     if model is None or tokenizer is None:
         return None, "Model could not be loaded"
     
-    LANG_CODE_MAP = {
-        "en": "en_XX", 
-        "vi": "vi_VN"
-    }
     src_code = LANG_CODE_MAP.get(source_lang)
     tgt_code = LANG_CODE_MAP.get(target_lang)
     
     if not src_code or not tgt_code:
         return None, "Unsupported language code"
 
-    tokenizer.src_lang = src_code
-    inputs = tokenizer(text, return_tensors="pt", max_length=1024, truncation=True).to(model.device)
+    with metrics.STAGE_SECONDS.time(stage="tokenize"):
+        tokenizer.src_lang = src_code
+        encoded = tokenizer([texts[i] for i in missing], max_length=1024, truncation=True)
+    # Gom các câu có số token gần nhau, mỗi lần generate không vượt quá BATCH_MAX_TOKENS token (kể cả padding)
+    batches = bucket_by_length([len(ids) for ids in encoded.input_ids], BATCH_MAX_TOKENS)
+
+    try:
+        with registry.activate(direction, adapter), torch.no_grad():
+            batch_outputs = [
+                _generate_bucket(model, tokenizer, encoded, batch, tgt_code, decoding) for batch in batches
+            ]
+    except AdapterError as e:
+        return None, str(e)
+    translated_texts = restore_order(batches, batch_outputs)
+
+    scope, adapter_id = get_cache_scope(direction, adapter)
+    for i, translated_text in zip(missing, translated_texts):
+        results[i] = translated_text
+        translation_cache.set(keys[i], translated_text, scope, adapter_id)
     
-    with torch.no_grad():
+    return results, None
+
+
+def _generate_bucket(model, tokenizer, encoded, indices, tgt_code: str, decoding: dict):
+    """Pad các câu trong một bucket (đã tokenize) về cùng độ dài, generate và decode thành văn bản"""
+    with metrics.STAGE_SECONDS.time(stage="tokenize"):
+        inputs = tokenizer.pad(
+            {
+                "input_ids": [encoded.input_ids[i] for i in indices],
+                "attention_mask": [encoded.attention_mask[i] for i in indices],
+            },
+            return_tensors="pt"
+        ).to(model.device)
+    metrics.BATCH_SIZE.observe(len(indices))
+    lengths = inputs.attention_mask.sum(dim=1).tolist()
+    for length in lengths:
+        metrics.INPUT_TOKENS.observe(length)
+    metrics.PADDING_RATIO.observe(1 - sum(lengths) / inputs.attention_mask.numel())
+
+    # Chạy encoder riêng để đo thời gian encoder và vòng lặp decode tách biệt
+    with metrics.STAGE_SECONDS.time(stage="encode"):
+        encoder_outputs = model.get_encoder()(
+            input_ids=inputs.input_ids, attention_mask=inputs.attention_mask
+        )
+    with metrics.STAGE_SECONDS.time(stage="decode"):
         outputs = model.generate(
             input_ids=inputs.input_ids,
             attention_mask=inputs.attention_mask,
-            max_length=1024,
+            encoder_outputs=encoder_outputs,
             decoder_start_token_id=tokenizer.lang_code_to_id[tgt_code],
-            num_beams=1, # Dùng greedy search 
-            early_stopping=False
+            **generation_kwargs(decoding, inputs.input_ids.shape[1])
         )
         # Output shape: (batch_size, sequence_length)
+    for length in (outputs[:, 1:] != tokenizer.pad_token_id).sum(dim=1).tolist():
+        metrics.OUTPUT_TOKENS.observe(length)
 
     # Chuyển token ids thành từ 
+    with metrics.STAGE_SECONDS.time(stage="detokenize"):
+        translated_texts = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        return [re.sub(r"^[-.\s]+", "", t).strip() for t in translated_texts]
+
+
+def perform_translation(text: str, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None):
+    """Thực hiện dịch trên model đã load"""
+    translated_texts, error = translate_batch([text], source_lang, target_lang, adapter=adapter, decoding=decoding)
+    if error:
+        return None, error
+    return translated_texts[0], None
+
+
+def translate_many(
+    texts, source_lang: str, target_lang: str, batch_size: int = DOCUMENT_BATCH_SIZE,
+    adapter: str = None, decoding: dict = None
+):
+    """
+    Dịch một danh sách câu độc lập, trả về danh sách (translated_text, error) theo thứ tự đầu vào.
+    Các câu được sắp xếp theo độ dài rồi chia nhóm tối đa batch_size câu,
+    translate_batch chia tiếp mỗi nhóm theo số token để giảm padding.
+    Nếu một batch lỗi, từng câu trong batch được dịch lại riêng để chỉ câu lỗi bị báo lỗi.
+    """
+    texts = list(texts)
+    direction = get_direction(source_lang, target_lang)
+    if direction is None:
+        return [(None, "[Unsupported Language Pair]")] * len(texts)
+    if not registry.is_available(direction, adapter):
+        return [(None, f"[Unknown Adapter: {adapter}]")] * len(texts)
+
+    results = [None] * len(texts)
+
+    # Gom các câu có độ dài gần nhau vào cùng batch
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        try:
+            translated_texts, error = translate_batch(
+                [texts[i] for i in indices], source_lang, target_lang, adapter=adapter, decoding=decoding
+            )
+        except Exception as e:
+            translated_texts, error = None, str(e)
+
+        if error is None:
+            for i, translated_text in zip(indices, translated_texts):
+                results[i] = (translated_text, None)
+        elif len(indices) == 1:
+            results[indices[0]] = (None, error)
+        else:
+            for i in indices:
+                results[i] = translate_many([texts[i]], source_lang, target_lang, adapter=adapter, decoding=decoding)[0]
+
+    return results
+
+
+def translate_document(text: str, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None):
+    """
+    Dịch văn bản dài theo từng câu.
+    Các câu được dịch theo batch (translate_many), mỗi câu được cache riêng
+    nên sửa một câu chỉ phải dịch lại câu đó.
+    Kết quả được ghép lại với khoảng trắng và dấu xuống dòng gốc.
+    """
+    if get_direction(source_lang, target_lang) is None:
+        return None, "[Unsupported Language Pair]"
+
+    leading, segments = split_segments(text, source_lang)
+    translated = []
+    sentences = [sentence for sentence, _ in segments]
+    for translated_text, error in translate_many(sentences, source_lang, target_lang, adapter=adapter, decoding=decoding):
+        if error:
+            return None, error
+        translated.append(translated_text)
+
+    return join_segments(leading, translated, [whitespace for _, whitespace in segments]), None
+
+
+@lru_cache(maxsize=None)
+def get_callback_streamer_class():
+    """Tạo class streamer khi cần để không phải import transformers lúc import module"""
+    from transformers import TextStreamer
+
+    class CallbackStreamer(TextStreamer):
+        """Streamer gọi callback mỗi khi có thêm một đoạn văn bản đã decode xong"""
+
+        def __init__(self, tokenizer, callback):
+            super().__init__(tokenizer, skip_special_tokens=True)
+            self.callback = callback
+
+        def on_finalized_text(self, text: str, stream_end: bool = False):
+            if text:
+                self.callback(text)
+
+    return CallbackStreamer
+
+
+def stream_translation(text: str, source_lang: str, target_lang: str, on_text, adapter: str = None, decoding: dict = None):
+    """
+    Dịch một đoạn văn bản và đẩy từng token đã decode qua on_text(chunk) ngay khi sinh ra.
+    Chỉ hỗ trợ greedy search (num_beams=1) vì beam search chưa biết câu cuối cùng cho tới khi kết thúc.
+    Hàm blocking, trả về (translated_text, error) như perform_translation.
+    """
+    direction = get_direction(source_lang, target_lang)
+    if direction is None:
+        return None, "[Unsupported Language Pair]"
+    if not registry.is_available(direction, adapter):
+        return None, f"[Unknown Adapter: {adapter}]"
+
+    decoding = resolve_decoding(decoding)
+    if decoding["num_beams"] > 1:
+        return None, "Token streaming requires num_beams=1"
+
+    key = get_cache_key(text, direction, adapter, decoding)
+    cached = translation_cache.get(key)
+    metrics.CACHE_HIT_RATIO.observe(1.0 if cached is not None else 0.0)
+    if cached is not None:
+        on_text(cached)
+        return cached, None
+
+    import torch
+
+    model, tokenizer = load_model(direction)
+    
+    if model is None or tokenizer is None:
+        return None, "Model could not be loaded"
+
+    tokenizer.src_lang = LANG_CODE_MAP[source_lang]
+    inputs = tokenizer(text, return_tensors="pt", max_length=1024, truncation=True).to(model.device)
+    
+    try:
+        with registry.activate(direction, adapter), torch.no_grad():
+            outputs = model.generate(
+                input_ids=inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                decoder_start_token_id=tokenizer.lang_code_to_id[LANG_CODE_MAP[target_lang]],
+                streamer=get_callback_streamer_class()(tokenizer, on_text),
+                **generation_kwargs(decoding, inputs.input_ids.shape[1])
+            )
+    except AdapterError as e:
+        return None, str(e)
+
     translated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
     translated_text = re.sub(r"^[-.\s]+", "", translated_text).strip()
+    translation_cache.set(key, translated_text, *get_cache_scope(direction, adapter))
     
     return translated_text, None
- 
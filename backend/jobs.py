@@ -0,0 +1,370 @@
+import csv
+import io
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+
+from . import database
+from . import db_models
+from . import inference
+from .executor import inference_executor, QueueFullError
+from .segmentation import split_segments
+
+# Cấu hình job dịch file (có thể ghi đè bằng biến môi trường)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "64"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Chunk đang dịch không được gia hạn trong khoảng này (process dịch nó đã dừng) sẽ được worker khác nhận lại
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_FILE_MB = float(os.getenv("JOB_MAX_FILE_MB", "20"))
+JOB_MAX_FILE_BYTES = int(JOB_MAX_FILE_MB * 1024 * 1024)
+
+SUPPORTED_FORMATS = ("txt", "csv", "json")
+MEDIA_TYPES = {
+    "txt": "text/plain; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+}
+
+
+class JobFileError(ValueError):
+    """File tải lên không hợp lệ"""
+
+
+def _should_translate(text) -> bool:
+    """Chỉ dịch các đoạn có chứa chữ cái (bỏ qua số, ký hiệu, chuỗi rỗng)"""
+    return isinstance(text, str) and any(c.isalpha() for c in text)
+
+
+def _json_leaves(value):
+    """Duyệt các chuỗi trong JSON theo thứ tự cố định"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            yield from _json_leaves(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _json_leaves(item)
+
+
+def _json_replace(value, translations):
+    """Thay các chuỗi trong JSON bằng bản dịch, cùng thứ tự với _json_leaves"""
+    if isinstance(value, str):
+        return next(translations) if _should_translate(value) else value
+    if isinstance(value, list):
+        return [_json_replace(item, translations) for item in value]
+    if isinstance(value, dict):
+        return {key: _json_replace(item, translations) for key, item in value.items()}
+    return value
+
+
+def extract_units(file_format: str, content: str, source_lang: str):
+    """
+    Tách nội dung file thành danh sách các đoạn cần dịch:
+    - txt: từng câu (giữ nguyên khoảng trắng, xuống dòng khi ghép lại)
+    - csv: từng ô, trừ dòng tiêu đề
+    - json: từng chuỗi trong cấu trúc JSON
+    """
+    if file_format == "txt":
+        _, segments = split_segments(content, source_lang)
+        return [sentence for sentence, _ in segments if _should_translate(sentence)]
+    if file_format == "csv":
+        rows = list(csv.reader(io.StringIO(content)))
+        return [cell for row in rows[1:] for cell in row if _should_translate(cell)]
+    if file_format == "json":
+        return [leaf for leaf in _json_leaves(json.loads(content)) if _should_translate(leaf)]
+    raise JobFileError(f"Unsupported file format: {file_format}")
+
+
+def rebuild_content(file_format: str, content: str, source_lang: str, translations) -> str:
+    """Ghép bản dịch vào đúng vị trí trong cấu trúc file gốc"""
+    translations = iter(translations)
+    if file_format == "txt":
+        leading, segments = split_segments(content, source_lang)
+        parts = [leading]
+        for sentence, whitespace in segments:
+            parts.append((next(translations) if _should_translate(sentence) else sentence) + whitespace)
+        return "".join(parts)
+    if file_format == "csv":
+        rows = list(csv.reader(io.StringIO(content)))
+        output = io.StringIO()
+        writer = csv.writer(output)
+        if rows:
+            writer.writerow(rows[0])
+        for row in rows[1:]:
+            writer.writerow([next(translations) if _should_translate(cell) else cell for cell in row])
+        return output.getvalue()
+    if file_format == "json":
+        data = _json_replace(json.loads(content), translations)
+        return json.dumps(data, ensure_ascii=False, indent=2)
+    raise JobFileError(f"Unsupported file format: {file_format}")
+
+
+def check_file_size(size: int):
+    if size > JOB_MAX_FILE_BYTES:
+        raise JobFileError(f"File is too large (max {JOB_MAX_FILE_MB:g} MB)")
+
+
+def create_job(db, user_id: int, filename: str, raw: bytes, source_lang: str, target_lang: str):
+    """Kiểm tra file, tách thành các chunk và lưu job vào database"""
+    check_file_size(len(raw))
+    file_format = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if file_format not in SUPPORTED_FORMATS:
+        raise JobFileError(f"Unsupported file type. Allowed: {', '.join(SUPPORTED_FORMATS)}")
+    if inference.get_direction(source_lang, target_lang) is None:
+        raise JobFileError("[Unsupported Language Pair]")
+
+    try:
+        content = raw.decode("utf-8-sig")
+        units = extract_units(file_format, content, source_lang)
+    except (UnicodeDecodeError, csv.Error, json.JSONDecodeError) as e:
+        raise JobFileError(f"Could not parse file: {e}")
+
+    job = db_models.TranslationJob(
+        user_id=user_id,
+        filename=filename,
+        file_format=file_format,
+        source_content=content,
+        source_lang=source_lang,
+        target_lang=target_lang,
+        status="pending" if units else "completed"
+    )
+    db.add(job)
+    db.flush()
+
+    chunks = [
+        {"job_id": job.id, "position": position, "source_units": json.dumps(units[start:start + JOB_CHUNK_SIZE], ensure_ascii=False)}
+        for position, start in enumerate(range(0, len(units), JOB_CHUNK_SIZE))
+    ]
+    if chunks:
+        db.bulk_insert_mappings(db_models.TranslationJobChunk, chunks)
+    job.total_chunks = len(chunks)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def is_finished(job) -> bool:
+    return job.status in ("completed", "failed")
+
+
+def build_result(db, job) -> str:
+    """Ghép kết quả của job, đoạn dịch lỗi được giữ nguyên văn bản gốc"""
+    chunks = db.query(db_models.TranslationJobChunk)\
+        .filter(db_models.TranslationJobChunk.job_id == job.id)\
+        .order_by(db_models.TranslationJobChunk.position)\
+        .all()
+    translations = []
+    for chunk in chunks:
+        source_units = json.loads(chunk.source_units)
+        translated_units = json.loads(chunk.translated_units) if chunk.translated_units else [None] * len(source_units)
+        translations.extend(t if t is not None else s for s, t in zip(source_units, translated_units))
+    return rebuild_content(job.file_format, job.source_content, job.source_lang, translations)
+
+
+class ChunkAbandoned(Exception):
+    """Worker không còn giữ chunk (lease đã hết hạn và bị worker khác nhận lại, hoặc server đang dừng)"""
+
+
+class JobWorkerPool:
+    """
+    Các worker thread lấy chunk chưa dịch từ database và lưu kết quả ngay sau mỗi chunk.
+    Chunk được dịch trên inference_executor theo từng phần DOCUMENT_BATCH_SIZE đoạn, mỗi phần giữ một chỗ
+    trong hàng đợi riêng, nên request dịch trực tiếp chỉ phải chờ tối đa một phần thay vì cả chunk.
+    Hàng đợi nằm trong database nên không cần broker ngoài. Worker nhận chunk kèm claimed_at (lease),
+    gia hạn sau mỗi phần; chunk của process đã dừng được nhận lại khi lease hết hạn (JOB_LEASE_SECONDS).
+    """
+
+    def __init__(self, num_workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL,
+                 lease_seconds=JOB_LEASE_SECONDS, piece_size=inference.DOCUMENT_BATCH_SIZE):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.piece_size = max(1, piece_size)
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads or self.num_workers <= 0:
+            return
+        self._stop.clear()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Đánh thức worker khi có job mới"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_next_chunk()
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                processed = False
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claimable(self, now):
+        """Chunk đang chờ, hoặc đang dịch nhưng lease đã hết hạn (process nhận nó đã dừng)"""
+        Chunk = db_models.TranslationJobChunk
+        return or_(
+            Chunk.status == "pending",
+            and_(Chunk.status == "running", Chunk.claimed_at < now - timedelta(seconds=self.lease_seconds))
+        )
+
+    def _claim_chunk(self, db):
+        """Nhận một chunk, UPDATE có điều kiện để 2 worker không nhận cùng một chunk. Trả về (chunk, lease) hoặc None"""
+        Chunk = db_models.TranslationJobChunk
+        now = datetime.utcnow()
+        candidates = db.query(Chunk.id)\
+            .filter(self._claimable(now))\
+            .order_by(Chunk.job_id, Chunk.position)\
+            .limit(self.num_workers + 1)\
+            .all()
+        for (chunk_id,) in candidates:
+            result = db.execute(
+                update(Chunk)
+                .where(Chunk.id == chunk_id, self._claimable(now))
+                .values(status="running", claimed_at=now)
+            )
+            db.commit()
+            if result.rowcount == 1:
+                return db.get(Chunk, chunk_id), now
+        return None
+
+    def _held(self, chunk_id, lease):
+        """Điều kiện WHERE: chunk vẫn thuộc worker đã nhận nó với lease này"""
+        Chunk = db_models.TranslationJobChunk
+        return and_(Chunk.id == chunk_id, Chunk.status == "running", Chunk.claimed_at == lease)
+
+    def _renew_lease(self, db, chunk_id, lease):
+        """Gia hạn lease, trả về lease mới. ChunkAbandoned nếu chunk đã bị worker khác nhận lại"""
+        now = datetime.utcnow()
+        result = db.execute(
+            update(db_models.TranslationJobChunk).where(self._held(chunk_id, lease)).values(claimed_at=now)
+        )
+        db.commit()
+        if result.rowcount != 1:
+            raise ChunkAbandoned(f"Job chunk {chunk_id} was claimed by another worker")
+        return now
+
+    def _release_chunk(self, db, chunk_id, lease):
+        """Trả chunk về hàng đợi (nếu vẫn còn giữ nó)"""
+        db.execute(update(db_models.TranslationJobChunk).where(self._held(chunk_id, lease)).values(status="pending"))
+        db.commit()
+
+    def process_next_chunk(self) -> bool:
+        """Dịch một chunk, trả về False nếu không còn chunk nào đang chờ"""
+        db = database.SessionLocal()
+        try:
+            claimed = self._claim_chunk(db)
+            if claimed is None:
+                return False
+            chunk, lease = claimed
+            chunk_id, job_id = chunk.id, chunk.job_id
+            try:
+                self._translate_chunk(db, chunk, lease)
+            except ChunkAbandoned as e:
+                print(e)
+                db.rollback()
+            except Exception as e:
+                if self._stop.is_set():
+                    # Lỗi do server đang dừng (executor đã shutdown), chunk được dịch lại sau khi khởi động
+                    print(f"Job chunk {chunk_id} returned to the queue on shutdown: {e}")
+                    db.rollback()
+                    self._release_chunk(db, chunk_id, lease)
+                    return True
+                # Không để chunk kẹt ở trạng thái running
+                print(f"Job chunk {chunk_id} error: {e}")
+                db.rollback()
+                try:
+                    self._finish_chunk(db, chunk_id, job_id, lease, None, [str(e)])
+                except ChunkAbandoned:
+                    db.rollback()
+                except Exception as e:
+                    print(f"Job chunk {chunk_id} could not be marked failed, returning it to the queue: {e}")
+                    db.rollback()
+                    self._release_chunk(db, chunk_id, lease)
+            return True
+        finally:
+            db.close()
+
+    def _translate_chunk(self, db, chunk, lease):
+        chunk_id, job_id = chunk.id, chunk.job_id
+        job = db.get(db_models.TranslationJob, job_id)
+        if job.status == "pending":
+            job.status = "running"
+            db.commit()
+
+        source_units = json.loads(chunk.source_units)
+        results = [None] * len(source_units)
+        # Sắp theo độ dài trước khi chia phần để các câu trong cùng batch có độ dài gần nhau
+        order = sorted(range(len(source_units)), key=lambda i: len(source_units[i]))
+        for start in range(0, len(order), self.piece_size):
+            indices = order[start:start + self.piece_size]
+            while True:
+                try:
+                    with inference_executor.reserve():
+                        piece = inference_executor.submit(
+                            inference.translate_many, [source_units[i] for i in indices], job.source_lang, job.target_lang
+                        ).result()
+                    break
+                except QueueFullError:
+                    # Hàng đợi đầy: nhường cho request dịch trực tiếp, vẫn giữ lease trong lúc chờ
+                    lease = self._renew_lease(db, chunk_id, lease)
+                    if self._stop.wait(self.poll_interval):
+                        self._release_chunk(db, chunk_id, lease)
+                        raise ChunkAbandoned(f"Job chunk {chunk_id} returned to the queue on shutdown")
+            for i, result in zip(indices, piece):
+                results[i] = result
+            lease = self._renew_lease(db, chunk_id, lease)
+
+        errors = [error for _, error in results if error]
+        self._finish_chunk(db, chunk_id, job_id, lease, [text for text, _ in results], errors)
+
+    def _finish_chunk(self, db, chunk_id, job_id, lease, translated_units, errors):
+        """Lưu kết quả của chunk (translated_units=None: giữ nguyên văn bản gốc) và cập nhật tiến độ của job"""
+        values = {"status": "failed" if errors else "done", "error": errors[0] if errors else None}
+        if translated_units is not None:
+            values["translated_units"] = json.dumps(translated_units, ensure_ascii=False)
+        # Chỉ worker còn giữ lease mới lưu kết quả, nên mỗi chunk chỉ được cộng vào tiến độ một lần
+        result = db.execute(update(db_models.TranslationJobChunk).where(self._held(chunk_id, lease)).values(values))
+        if result.rowcount != 1:
+            raise ChunkAbandoned(f"Job chunk {chunk_id} was claimed by another worker, discarding its result")
+
+        # Cập nhật tiến độ bằng phép cộng trong SQL (cùng transaction) để an toàn khi nhiều worker cùng cập nhật
+        counter = db_models.TranslationJob.failed_chunks if errors else db_models.TranslationJob.done_chunks
+        db.execute(
+            update(db_models.TranslationJob)
+            .where(db_models.TranslationJob.id == job_id)
+            .values({counter: counter + 1})
+        )
+        db.commit()
+
+        job = db.get(db_models.TranslationJob, job_id)
+        db.refresh(job)
+        if job.done_chunks + job.failed_chunks >= job.total_chunks:
+            job.status = "failed" if job.failed_chunks else "completed"
+            if job.failed_chunks:
+                job.error = f"{job.failed_chunks} of {job.total_chunks} chunks failed: {values['error'] or ''}".strip()
+            db.commit()
+
+
+# Worker pool dùng chung cho toàn bộ server
+worker_pool = JobWorkerPool()
@@ -0,0 +1,50 @@
+"""
+Chia batch theo độ dài token để giảm padding.
+Dùng cho inference (translate_batch) và cho tập đánh giá khi fine-tune (fine_tuning.py),
+nên module này không phụ thuộc vào phần còn lại của backend.
+"""
+
+
+def bucket_by_length(lengths, max_tokens: int, max_batch_size: int = None):
+    """
+    Sắp xếp các câu theo số token rồi chia batch sao cho số token sau khi pad
+    (số câu x câu dài nhất trong batch) không vượt quá max_tokens.
+    max_tokens <= 0: không giới hạn số token. max_batch_size: giới hạn thêm số câu mỗi batch (tùy chọn).
+    Câu dài hơn max_tokens vẫn được đặt vào một batch riêng.
+    Trả về danh sách batch, mỗi batch là danh sách chỉ số (vị trí trong lengths).
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    for i in order:
+        # Các câu đã sắp tăng dần nên câu hiện tại là câu dài nhất của batch nếu được thêm vào
+        over_tokens = max_tokens > 0 and lengths[i] * (len(current) + 1) > max_tokens
+        over_size = max_batch_size and len(current) >= max_batch_size
+        if current and (over_tokens or over_size):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def restore_order(batches, batch_results):
+    """Ghép kết quả của từng batch (cùng thứ tự với batch) về đúng thứ tự đầu vào ban đầu"""
+    results = [None] * sum(len(batch) for batch in batches)
+    for batch, outputs in zip(batches, batch_results):
+        for i, output in zip(batch, outputs):
+            results[i] = output
+    return results
+
+
+def padding_stats(lengths, batches):
+    """Số token thật, số token sau khi pad và tỉ lệ padding của một cách chia batch"""
+    real_tokens = sum(lengths[i] for batch in batches for i in batch)
+    padded_tokens = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+    return {
+        "batches": len(batches),
+        "real_tokens": real_tokens,
+        "padded_tokens": padded_tokens,
+        "padding_ratio": 1 - real_tokens / padded_tokens if padded_tokens else 0.0,
+    }
@@ -1,8 +1,17 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Query
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, status, Query, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+from urllib.parse import quote
 from typing import List, Optional
 from jose import JWTError, jwt
 
@@ -11,11 +20,45 @@ from . import schemas
 from . import auth
 from . import database
 from . import inference
+from . import batching
+from . import jobs
+from . import metrics
+from . import migrations
+from . import pagination
+from . import search as search_index
+from .model_registry import registry
+from .startup import model_loader
+from .history_writer import history_writer
+from .executor import inference_executor, QueueFullError, INFERENCE_RETRY_AFTER
+from .segmentation import split_segments
+
+# Số câu tối đa trong một request /translate/batch
+BATCH_MAX_TEXTS = int(os.getenv("BATCH_MAX_TEXTS", "1000"))
+# Kích thước mỗi lần đọc file tải lên ở /jobs
+UPLOAD_READ_CHUNK_BYTES = 1024 * 1024
 
 # Khởi tạo kết nối tới database và tạo các bảng dữ liệu
 db_models.Base.metadata.create_all(bind=database.engine)
+# Thêm cột/index mới vào các bảng đã tồn tại và backfill dữ liệu cũ (bỏ qua nếu đã cập nhật)
+migrations.upgrade(database.engine)
 
-app = FastAPI(title="En - Vi Translator Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load model song song và warmup trên thread nền (MODEL_LOADING=lazy để bỏ qua)
+    model_loader.start()
+    # Khởi động worker dịch file, các job dở dang được tiếp tục từ chunk chưa xong
+    jobs.worker_pool.start()
+    yield
+    jobs.worker_pool.stop(timeout=5)
+    # Chờ các việc đang chạy/chờ trên executor xong rồi dừng thread pool inference
+    await asyncio.to_thread(inference_executor.shutdown)
+    # Ghi nốt lịch sử dịch còn trong bộ đệm
+    history_writer.stop(timeout=5)
+    await database.async_engine.dispose()
+
+
+app = FastAPI(title="En - Vi Translator Backend", lifespan=lifespan)
 
 # Cấu hình CORS
 origins = [
@@ -30,15 +73,57 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cho phép frontend đọc cursor phân trang
+    expose_headers=[pagination.NEXT_CURSOR_HEADER],
 )
 
+
+class RequestMetricsMiddleware:
+    """
+    Đếm request và đo độ trễ theo route tới khi gửi header (với SSE là thời gian tới event đầu tiên).
+    Viết dạng ASGI thuần để không phải bọc lại body của StreamingResponse.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status_code):
+            nonlocal recorded
+            recorded = True
+            # Router ghi route vào scope khi match, dùng path template để không tạo quá nhiều label
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.HTTP_REQUESTS.inc(method=scope["method"], path=path, status=status_code)
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], path=path)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if not recorded:
+                record(500)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
 # Khởi tạo phương pháp lấy token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Tạo các hàm dependencies
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Xác thực token từ request và return user"""
     credentials_exception = HTTPException(
@@ -48,28 +133,38 @@ def get_current_user(
     )
     try:
         # Chuyển đổi token thành data
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        with metrics.STAGE_SECONDS.time(stage="jwt_decode"):
+            payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = db.query(db_models.User).filter(db_models.User.username == username).first()
+    # Người dùng đã xác thực gần đây: không cần truy vấn database (endpoint chỉ dùng current_user.id)
+    user_id = auth.principal_cache.get(username)
+    if user_id is not None:
+        metrics.PRINCIPAL_CACHE_LOOKUPS.inc(result="hit")
+        return db_models.User(id=user_id, username=username)
+    metrics.PRINCIPAL_CACHE_LOOKUPS.inc(result="miss")
+
+    with metrics.STAGE_SECONDS.time(stage="user_lookup"):
+        user = await db.scalar(select(db_models.User).where(db_models.User.username == username))
     if user is None:
         raise credentials_exception
+    auth.principal_cache.put(username, user.id)
     return user
 
 
-def get_current_user_optional(
+async def get_current_user_optional(
     token: Optional[str] = Depends(OAuth2PasswordBearer(tokenUrl="login", auto_error=False)), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Trả về user nếu tồn tại token, nếu không trả về None (cho phép đăng nhập không có token - chế độ khách)"""
     if not token:
         return None
     try:
-        return get_current_user(token, db)
+        return await get_current_user(token, db)
     except HTTPException:
         return None
 
@@ -79,24 +174,46 @@ async def root():
     return {"message": "Welcome to En - Vi Translator API!"}
 
 
+@app.get("/health/live")
+async def health_live():
+    """Server đang chạy (không phụ thuộc model)"""
+    return {"status": "alive"}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics cho Prometheus: độ trễ từng bước, hàng đợi, kích thước batch, số token, cache"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Trả 200 khi tất cả model đã load và warmup xong, 503 nếu chưa (dùng cho load balancer)"""
+    status_info = model_loader.status()
+    if not status_info["ready"]:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=status_info)
+    return status_info
+
+
 # 1. ĐĂNG KÝ
 @app.post("/register", response_model=schemas.Token)
-async def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
     """Đăng ký tài khoản, trả về access token"""
     # Xác thực mật khẩu lần 2 phải giống lần 1
     if user.password != user.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
     
     # Kiểm tra username hiện tại đã có trong database chưa
-    db_user = db.query(db_models.User).filter(db_models.User.username == user.username).first()
+    db_user = await db.scalar(select(db_models.User).where(db_models.User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already taken. Please choose another one.")
     
-    hashed_password = auth.get_password_hash(user.password)
+    # Trả connection về pool trước khi chờ băm mật khẩu (Session dùng lại được sau close)
+    await db.close()
+    hashed_password = await auth.get_password_hash_async(user.password)
     new_user = db_models.User(username=user.username, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     access_token = auth.create_access_token(data={"sub": new_user.username}, expires_delta=timedelta(minutes=30))
     return {"access_token": access_token, "token_type": "bearer"}
@@ -104,10 +221,12 @@ async def register(user: schemas.UserCreate, db: Session = Depends(database.get_
 
 # 2.1. ĐĂNG NHẬP
 @app.post("/login", response_model=schemas.Token)
-async def login(user: schemas.UserLogin, db: Session = Depends(database.get_db)):
+async def login(user: schemas.UserLogin, db: AsyncSession = Depends(database.get_async_db)):
     """Đăng nhập vào tài khoản, trả về access token"""
-    db_user = db.query(db_models.User).filter(db_models.User.username == user.username).first()
-    if not db_user or not auth.verify_password(user.password, db_user.hashed_password):
+    db_user = await db.scalar(select(db_models.User).where(db_models.User.username == user.username))
+    # Trả connection về pool trước khi chờ băm mật khẩu (Session dùng lại được sau close)
+    await db.close()
+    if not db_user or not await auth.verify_password_async(user.password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     
     access_token = auth.create_access_token(data={"sub": db_user.username}, expires_delta=timedelta(minutes=30))
@@ -118,11 +237,12 @@ async def login(user: schemas.UserLogin, db: Session = Depends(database.get_db))
 @app.post("/token", response_model=schemas.Token)
 async def login_for_swagger(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Đăng nhập cho Swagger UI"""
-    db_user = db.query(db_models.User).filter(db_models.User.username == form_data.username).first()
-    if not db_user or not auth.verify_password(form_data.password, db_user.hashed_password):
+    db_user = await db.scalar(select(db_models.User).where(db_models.User.username == form_data.username))
+    await db.close()
+    if not db_user or not await auth.verify_password_async(form_data.password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     
     access_token = auth.create_access_token(data={"sub": db_user.username}, expires_delta=timedelta(minutes=30))
@@ -130,137 +250,538 @@ async def login_for_swagger(
 
 
 # 3. DỊCH
+async def run_translation(
+    text: str, source_lang: str, target_lang: str, mode: str = "text",
+    adapter: str = None, decoding: dict = None
+):
+    """
+    Dịch văn bản mà không chặn event loop, trả về (translated_text, error).
+    Raise QueueFullError nếu hàng đợi inference đã đầy.
+    """
+    if mode == "document":
+        # Dịch theo câu, các câu đã có trong cache được bỏ qua
+        with inference_executor.reserve():
+            return await asyncio.wrap_future(
+                inference_executor.submit(inference.translate_document, text, source_lang, target_lang, adapter, decoding)
+            )
+
+    # Tra cache trước (trên thread vì có thể đọc SQLite), cache hit không cần tới model và tokenizer
+    translated_text = await asyncio.to_thread(
+        inference.get_cached_translation, text, source_lang, target_lang, adapter, decoding
+    )
+    if translated_text is not None:
+        return translated_text, None
+
+    # Giữ chỗ trong hàng đợi inference, trả 503 nếu hàng đợi đã đầy
+    with inference_executor.reserve():
+        # Gom request vào micro-batch cùng chiều dịch và adapter, chờ kết quả mà không chặn event loop
+        return await asyncio.wrap_future(batching.batcher.submit(text, source_lang, target_lang, adapter, decoding))
+
+
+def check_adapter(source_lang: str, target_lang: str, adapter: Optional[str]):
+    """Trả lỗi 400 nếu adapter không tồn tại cho chiều dịch"""
+    if adapter and not inference.is_adapter_available(source_lang, target_lang, adapter):
+        raise HTTPException(status_code=400, detail=f"[Unknown Adapter: {adapter}]")
+
+
+def get_decoding(options: Optional[schemas.DecodingOptions]) -> dict:
+    """Cấu hình giải mã đầy đủ của request (preset + các tham số ghi đè)"""
+    return inference.resolve_decoding(options.dict(exclude_none=True) if options else None)
+
+
 @app.post("/translate")
 async def translate_text(
     request: schemas.TranslationRequest, 
-    db: Session = Depends(database.get_db),
     current_user: Optional[db_models.User] = Depends(get_current_user_optional)
 ):
     """Tiến hành dịch bản dịch"""
+    if inference.get_direction(request.source_lang, request.target_lang) is None:
+        raise HTTPException(status_code=400, detail="[Unsupported Language Pair]")
+    check_adapter(request.source_lang, request.target_lang, request.adapter)
     try:
-        translated_text, error = inference.perform_translation(
-            text=request.text,
-            source_lang=request.source_lang,
-            target_lang=request.target_lang
+        translated_text, error = await run_translation(
+            request.text, request.source_lang, request.target_lang, request.mode,
+            request.adapter, get_decoding(request.decoding)
         )
         
         if error:
              raise HTTPException(status_code=500, detail=error)
 
-        # Lưu bản dịch nếu người dùng đăng nhập
+        # Lưu bản dịch nếu người dùng đăng nhập (ghi vào database ở thread nền, không chờ)
         if current_user:
-            # Kiểm tra bản ghi trùng lặp
-            # Lấy bản ghi mới nhất
-            last_item = db.query(db_models.TranslationHistory)\
-                .filter(db_models.TranslationHistory.user_id == current_user.id)\
-                .order_by(db_models.TranslationHistory.created_at.desc())\
-                .first()
-            
-            should_save = True
-            if last_item and last_item.original_text == request.text and last_item.target_lang == request.target_lang:
-                should_save = False
-
-            if should_save:
-                history_item = db_models.TranslationHistory(
-                    user_id=current_user.id,
-                    original_text=request.text,
-                    translated_text=translated_text,
-                    source_lang=request.source_lang,
-                    target_lang=request.target_lang
-                )
-                db.add(history_item)
-                db.commit()
+            history_writer.add(current_user.id, request.text, translated_text, request.source_lang, request.target_lang)
 
         return {"original": request.text, "translated": translated_text}
 
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/translate/batch", response_model=schemas.BatchTranslationResponse)
+async def translate_text_batch(
+    request: schemas.BatchTranslationRequest,
+    current_user: Optional[db_models.User] = Depends(get_current_user_optional)
+):
+    """Dịch nhiều câu trong một request, lỗi của từng câu được trả về riêng"""
+    if len(request.texts) > BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=400, detail=f"Too many texts (max {BATCH_MAX_TEXTS})")
+    if inference.get_direction(request.source_lang, request.target_lang) is None:
+        raise HTTPException(status_code=400, detail="[Unsupported Language Pair]")
+    check_adapter(request.source_lang, request.target_lang, request.adapter)
+
+    # Chỉ dịch các câu không rỗng
+    indices = [i for i, text in enumerate(request.texts) if text.strip()]
+    try:
+        with inference_executor.reserve():
+            translations = await asyncio.wrap_future(inference_executor.submit(
+                inference.translate_many,
+                [request.texts[i] for i in indices],
+                request.source_lang,
+                request.target_lang,
+                adapter=request.adapter,
+                decoding=get_decoding(request.decoding)
+            ))
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)}
+        )
+
+    results = [
+        schemas.BatchTranslationItem(index=i, original=text, error="Empty text")
+        for i, text in enumerate(request.texts)
+    ]
+    for i, (translated_text, error) in zip(indices, translations):
+        results[i].translated = translated_text
+        results[i].error = error
+
+    # Lưu lịch sử của tất cả câu dịch thành công (cùng một batch ghi của history_writer)
+    if current_user:
+        history_writer.add_many(
+            (current_user.id, item.original, item.translated, request.source_lang, request.target_lang)
+            for item in results if item.error is None
+        )
+
+    return {"results": results}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Định dạng một sự kiện Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def cancel_or_hold(futures, slot: Optional[ExitStack]):
+    """
+    Hủy các future chưa chạy. Future đã chạy thì không hủy được, nên chỗ trong hàng đợi (slot)
+    được chuyển sang chúng và chỉ được trả khi chúng chạy xong, để số việc trên executor không vượt INFERENCE_QUEUE_DEPTH.
+    """
+    running = [future for future in futures if not future.cancel() and not future.done()]
+    if not running or slot is None:
+        return
+    held = slot.pop_all()
+    remaining = [len(running)]
+    lock = threading.Lock()
+
+    def release(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            held.close()
+
+    for future in running:
+        future.add_done_callback(release)
+
+
+async def stream_sentences(text: str, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None,
+                           slot: Optional[ExitStack] = None):
+    """Dịch song song tất cả các câu qua micro-batcher, trả về từng câu theo thứ tự ngay khi dịch xong"""
+    leading, segments = split_segments(text, source_lang)
+    # Mỗi câu là bản dịch đã cache hoặc Future từ micro-batcher
+    pending = []
+    cached_translations = await asyncio.to_thread(
+        inference.get_cached_translations, [sentence for sentence, _ in segments], source_lang, target_lang, adapter, decoding
+    )
+    for (sentence, _), cached in zip(segments, cached_translations):
+        if cached is not None:
+            pending.append((cached, None))
+        else:
+            pending.append((None, batching.batcher.submit(sentence, source_lang, target_lang, adapter, decoding)))
+
+    try:
+        first = True
+        for (_, whitespace), (cached, future) in zip(segments, pending):
+            if future is None:
+                translated_text, error = cached, None
+            else:
+                translated_text, error = await asyncio.wrap_future(future)
+            if error:
+                raise RuntimeError(error)
+            yield (leading if first else "") + translated_text + whitespace
+            first = False
+    finally:
+        # Hủy các câu chưa dịch nếu client ngắt kết nối
+        cancel_or_hold([future for _, future in pending if future is not None], slot)
+
+
+async def stream_tokens(text: str, source_lang: str, target_lang: str, adapter: str = None, decoding: dict = None,
+                        slot: Optional[ExitStack] = None):
+    """Chạy generate trên executor và trả về từng đoạn token đã decode qua asyncio.Queue"""
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+
+    def on_text(chunk):
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+    future = inference_executor.submit(
+        inference.stream_translation, text, source_lang, target_lang, on_text, adapter, decoding
+    )
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(chunks.put_nowait, None))
+
+    try:
+        started = False
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            # Bỏ các ký tự rác ở đầu bản dịch giống perform_translation
+            if not started:
+                chunk = chunk.lstrip("-. \n\t")
+                if not chunk:
+                    continue
+                started = True
+            yield chunk
+    finally:
+        # Client ngắt kết nối: không chạy generate của request còn trong hàng đợi
+        cancel_or_hold([future], slot)
+
+    _, error = future.result()
+    if error:
+        raise RuntimeError(error)
+
+
+class ReservedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse trả chỗ trong hàng đợi inference (slot) khi response kết thúc, kể cả khi client ngắt kết nối
+    (nếu việc dịch vẫn đang chạy thì cancel_or_hold đã chuyển slot sang nó, chỗ được trả khi nó xong).
+    """
+
+    def __init__(self, *args, slot: ExitStack, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.close()
+
+
+@app.post("/translate/stream")
+async def translate_stream(
+    request: schemas.StreamTranslationRequest,
+    current_user: Optional[db_models.User] = Depends(get_current_user_optional)
+):
+    """Dịch và trả về kết quả từng phần qua Server-Sent Events"""
+    if inference.get_direction(request.source_lang, request.target_lang) is None:
+        raise HTTPException(status_code=400, detail="[Unsupported Language Pair]")
+    check_adapter(request.source_lang, request.target_lang, request.adapter)
+
+    decoding = get_decoding(request.decoding)
+    mode = request.mode
+    if mode == "auto":
+        # Beam search không stream được theo token nên luôn dùng chế độ theo câu
+        _, segments = split_segments(request.text, request.source_lang)
+        mode = "token" if len(segments) <= 1 and decoding["num_beams"] == 1 else "sentence"
+    elif mode == "token" and decoding["num_beams"] > 1:
+        raise HTTPException(status_code=400, detail="Token streaming requires num_beams=1")
+    user_id = current_user.id if current_user else None
+
+    # Giữ chỗ trong hàng đợi trước khi trả response để hàng đợi đầy là 503 thật (không phải 200 kèm event lỗi),
+    # chỗ được trả khi stream kết thúc hoặc client ngắt kết nối
+    slot = ExitStack()
+    try:
+        slot.enter_context(inference_executor.reserve())
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)}
+        )
+
+    async def event_stream():
+        parts = []
+        try:
+            if mode == "token":
+                chunks = stream_tokens(request.text, request.source_lang, request.target_lang, request.adapter, decoding, slot)
+            else:
+                chunks = stream_sentences(request.text, request.source_lang, request.target_lang, request.adapter, decoding, slot)
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event("delta", {"text": chunk})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+
+        translated_text = "".join(parts).strip()
+        if user_id is not None:
+            history_writer.add(user_id, request.text, translated_text, request.source_lang, request.target_lang)
+        yield sse_event("done", {"original": request.text, "translated": translated_text})
+
+    return ReservedStreamingResponse(
+        event_stream(),
+        slot=slot,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/translate/cache-stats")
+async def get_translation_cache_stats():
+    """Thống kê hit/miss của cache bản dịch"""
+    return inference.translation_cache.stats()
+
+
+@app.get("/adapters")
+async def get_adapters():
+    """Danh sách adapter theo chiều dịch và thống kê load/gỡ/sử dụng của từng adapter"""
+    return registry.stats()
+
+
+# DỊCH FILE (JOB NỀN)
+async def get_user_job(db: AsyncSession, job_id: int, user_id: int):
+    job = await db.scalar(select(db_models.TranslationJob).where(
+        db_models.TranslationJob.id == job_id,
+        db_models.TranslationJob.user_id == user_id
+    ))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/jobs", response_model=schemas.TranslationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_translation_job(
+    file: UploadFile = File(...),
+    source_lang: str = Form(...),
+    target_lang: str = Form(...),
+    current_user: db_models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Tải lên file .txt/.csv/.json để dịch nền, trả về job id"""
+    try:
+        # Đọc từng phần và dừng ngay khi vượt JOB_MAX_FILE_MB, không đọc hết file quá lớn vào bộ nhớ
+        parts, size = [], 0
+        while part := await file.read(UPLOAD_READ_CHUNK_BYTES):
+            size += len(part)
+            jobs.check_file_size(size)
+            parts.append(part)
+        raw = b"".join(parts)
+        # create_job dùng Session đồng bộ, run_sync chạy nó trên connection async của db
+        job = await db.run_sync(jobs.create_job, current_user.id, file.filename, raw, source_lang, target_lang)
+    except jobs.JobFileError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    jobs.worker_pool.notify()
+    return job
+
+
+@app.get("/jobs", response_model=List[schemas.TranslationJobResponse])
+async def list_translation_jobs(
+    current_user: db_models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Danh sách job dịch file của người dùng"""
+    return (await db.scalars(
+        select(db_models.TranslationJob)
+        .where(db_models.TranslationJob.user_id == current_user.id)
+        .order_by(db_models.TranslationJob.created_at.desc())
+    )).all()
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.TranslationJobResponse)
+async def get_translation_job(
+    job_id: int,
+    current_user: db_models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Trạng thái và tiến độ của một job"""
+    return await get_user_job(db, job_id, current_user.id)
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_translation_job(
+    job_id: int,
+    current_user: db_models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Theo dõi tiến độ job qua Server-Sent Events cho tới khi job kết thúc"""
+    await get_user_job(db, job_id, current_user.id)
+
+    async def event_stream():
+        last = None
+        while True:
+            # Session của dependency đã đóng khi response bắt đầu stream nên mở session riêng
+            async with database.AsyncSessionLocal() as session:
+                job = await session.get(db_models.TranslationJob, job_id)
+                data = json.loads(schemas.TranslationJobResponse.model_validate(job).model_dump_json())
+            if data != last:
+                yield sse_event("progress", data)
+                last = data
+            if data["status"] in ("completed", "failed"):
+                yield sse_event("done", data)
+                return
+            await asyncio.sleep(jobs.JOB_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/jobs/{job_id}/download")
+async def download_translation_job(
+    job_id: int,
+    current_user: db_models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Tải file đã dịch, cùng định dạng với file gốc"""
+    job = await get_user_job(db, job_id, current_user.id)
+    if not jobs.is_finished(job):
+        raise HTTPException(status_code=409, detail=f"Job is not finished (status: {job.status})")
+
+    content = await db.run_sync(jobs.build_result, job)
+    name, ext = os.path.splitext(job.filename)
+    filename = f"{name}.{job.target_lang}{ext}"
+    return Response(
+        content=content,
+        media_type=jobs.MEDIA_TYPES[job.file_format],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+
 # 4. LỊCH SỬ DỊCH
+async def fetch_page(db: AsyncSession, query, model, user_id: int, response: Response, search: Optional[str], cursor: Optional[str], limit: int):
+    """
+    Một trang kết quả của câu select query (cột đầu tiên là model): có từ khóa thì tìm toàn văn và xếp theo độ liên quan,
+    không có thì mới nhất trước theo keyset. Cursor trang sau được đặt vào header X-Next-Cursor.
+    """
+    ranking = None
+    if search:
+        query, ranking = search_index.apply(query, model, search, db.bind.dialect.name, user_id)
+    try:
+        if ranking is None:
+            page_query, offset = pagination.keyset_page(query, model, cursor, limit), None
+        else:
+            page_query, offset = pagination.ranked_page(query, model, ranking, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = (await db.execute(page_query)).all()
+    if offset is None:
+        rows, next_cursor = pagination.split_page(rows, limit, key=lambda row: row[0])
+    else:
+        rows, next_cursor = pagination.split_ranked_page(rows, limit, offset)
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return rows
+
+
 @app.get("/history", response_model=List[schemas.HistoryResponse])
 async def get_history(
+    response: Response,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     current_user: db_models.User = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    """Trả về tất cả bản dịch"""
-    query = db.query(db_models.TranslationHistory).filter(db_models.TranslationHistory.user_id == current_user.id)
-    if search:
-        query = query.filter(
-            (db_models.TranslationHistory.original_text.ilike(f"%{search}%")) | 
-            (db_models.TranslationHistory.translated_text.ilike(f"%{search}%"))
-        )
-    
-    history_items = query.order_by(db_models.TranslationHistory.created_at.desc()).all()
-    
-    # Trạng thái lưu bản dịch
-    saved_query = db.query(db_models.SavedTranslation.original_text, db_models.SavedTranslation.translated_text)\
-        .filter(db_models.SavedTranslation.user_id == current_user.id).all()
-    saved_set = {(s.original_text, s.translated_text) for s in saved_query}
-
-    # 2. Đánh giá bản dịch
-    rating_query = db.query(db_models.TranslationRating.original_text, db_models.TranslationRating.translated_text, db_models.TranslationRating.rating)\
-        .filter(db_models.TranslationRating.user_id == current_user.id).all()
-    rating_map = {(r.original_text, r.translated_text): r.rating for r in rating_query}
-
-    # 3. Đóng góp bản dịch
-    contrib_query = db.query(db_models.TranslationContribution.original_text, db_models.TranslationContribution.suggested_translation)\
-        .filter(db_models.TranslationContribution.user_id == current_user.id).all()
-    contrib_map = {c.original_text: c.suggested_translation for c in contrib_query}
-
-    results = []
-    for item in history_items:
-        results.append(schemas.HistoryResponse(
+    """Trả về một trang bản dịch (mới nhất trước, hoặc theo độ liên quan khi tìm kiếm), cursor trang sau nằm trong header X-Next-Cursor"""
+    # Ghi các bản dịch còn trong bộ đệm để kết quả gồm cả các bản dịch vừa xong
+    await asyncio.to_thread(history_writer.flush)
+    History = db_models.TranslationHistory
+    Saved = db_models.SavedTranslation
+    Rating = db_models.TranslationRating
+    Contribution = db_models.TranslationContribution
+
+    # Trạng thái lưu/đánh giá/đóng góp lấy bằng subquery tương quan trong cùng câu SQL,
+    # chỉ chạy cho các dòng của trang (tra theo index (user_id, content_hash))
+    is_saved = select(Saved.id).where(
+        Saved.user_id == History.user_id, Saved.content_hash == History.content_hash
+    ).exists()
+    rating = select(Rating.rating).where(
+        Rating.user_id == History.user_id, Rating.content_hash == History.content_hash
+    ).order_by(Rating.id.desc()).limit(1).scalar_subquery()
+    suggestion = select(Contribution.suggested_translation).where(
+        Contribution.user_id == History.user_id, Contribution.original_text == History.original_text
+    ).order_by(Contribution.id.desc()).limit(1).scalar_subquery()
+
+    query = select(History, is_saved.label("is_saved"), rating.label("rating"), suggestion.label("suggestion"))\
+        .where(History.user_id == current_user.id)
+    rows = await fetch_page(db, query, History, current_user.id, response, search, cursor, limit)
+
+    return [
+        schemas.HistoryResponse(
             id=item.id,
             original_text=item.original_text,
             translated_text=item.translated_text,
             source_lang=item.source_lang,
             target_lang=item.target_lang,
             created_at=item.created_at,
-            is_saved=(item.original_text, item.translated_text) in saved_set,
-            rating=rating_map.get((item.original_text, item.translated_text)),
-            suggestion=contrib_map.get(item.original_text)
-        ))
-    
-    return results
+            is_saved=bool(item_saved),
+            rating=item_rating,
+            suggestion=item_suggestion
+        )
+        for item, item_saved, item_rating, item_suggestion in rows
+    ]
 
 
 @app.delete("/history/{history_id}")
 async def delete_history_item(
     history_id: int, 
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):  
     """Xóa một bản dịch"""
-    item = db.query(db_models.TranslationHistory).filter(db_models.TranslationHistory.id == history_id, db_models.TranslationHistory.user_id == current_user.id).first()
+    # Ghi các bản dịch còn trong bộ đệm để bản ghi cần xóa chắc chắn đã có trong database
+    await asyncio.to_thread(history_writer.flush)
+    item = await db.scalar(select(db_models.TranslationHistory).where(db_models.TranslationHistory.id == history_id, db_models.TranslationHistory.user_id == current_user.id))
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
     # Logic: Xóa lịch sử dịch => xóa bản ghi tương ứng đã lưu trong bảng đã lưu
-    db.query(db_models.SavedTranslation).filter(
+    await db.execute(delete(db_models.SavedTranslation).where(
         db_models.SavedTranslation.user_id == current_user.id,
-        db_models.SavedTranslation.original_text == item.original_text,
-        db_models.SavedTranslation.translated_text == item.translated_text,
+        db_models.SavedTranslation.content_hash == item.content_hash,
         db_models.SavedTranslation.source_lang == item.source_lang,
         db_models.SavedTranslation.target_lang == item.target_lang
-    ).delete()
+    ))
 
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
     return {"message": "Deleted"}
 
 
 @app.delete("/history")
 async def clear_all_history(
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Xóa tất cả lịch sử dịch"""
-    db.query(db_models.TranslationHistory).filter(db_models.TranslationHistory.user_id == current_user.id).delete()
+    # Ghi các bản dịch còn trong bộ đệm trước, để chúng không được ghi lại sau khi đã xóa
+    await asyncio.to_thread(history_writer.flush)
+    await db.execute(delete(db_models.TranslationHistory).where(db_models.TranslationHistory.user_id == current_user.id))
     # Xóa trong bảng các bản dịch đã lưu
-    db.query(db_models.SavedTranslation).filter(db_models.SavedTranslation.user_id == current_user.id).delete()
-    db.commit()
+    await db.execute(delete(db_models.SavedTranslation).where(db_models.SavedTranslation.user_id == current_user.id))
+    await db.commit()
     return {"message": "All history and saved translations cleared"}
 
 
@@ -269,17 +790,16 @@ async def clear_all_history(
 async def save_translation(
     item: schemas.SavedTranslationCreate, 
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Lưu một bản dịch"""
     try:
         new_item = db_models.SavedTranslation(**item.dict(), user_id=current_user.id)
         db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
+        await db.commit()
         return new_item
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
@@ -287,62 +807,60 @@ async def save_translation(
 async def unsave_translation(
     item: schemas.SavedTranslationCreate, 
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Hủy lưu một bản dịch"""
     try:
-        deleted_count = db.query(db_models.SavedTranslation).filter(
+        result = await db.execute(delete(db_models.SavedTranslation).where(
             db_models.SavedTranslation.user_id == current_user.id,
-            db_models.SavedTranslation.original_text == item.original_text,
-            db_models.SavedTranslation.translated_text == item.translated_text
-        ).delete()
-        db.commit()
-        if deleted_count == 0:
+            db_models.SavedTranslation.content_hash == db_models.make_content_hash(item.original_text, item.translated_text)
+        ))
+        await db.commit()
+        if result.rowcount == 0:
             return {"message": "Item was not saved"}
         return {"message": ""}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
 @app.get("/saved-translations", response_model=List[schemas.SavedTranslationResponse])
 async def get_saved_translations(
+    response: Response,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    """Trả về tất cả bản dịch đã lưu"""
-    query = db.query(db_models.SavedTranslation).filter(db_models.SavedTranslation.user_id == current_user.id)
-    if search:
-        query = query.filter(
-            (db_models.SavedTranslation.original_text.ilike(f"%{search}%")) | 
-            (db_models.SavedTranslation.translated_text.ilike(f"%{search}%"))
-        )
-    return query.order_by(db_models.SavedTranslation.created_at.desc()).all()
+    """Trả về một trang bản dịch đã lưu (mới nhất trước, hoặc theo độ liên quan khi tìm kiếm), cursor trang sau nằm trong header X-Next-Cursor"""
+    query = select(db_models.SavedTranslation).where(db_models.SavedTranslation.user_id == current_user.id)
+    rows = await fetch_page(db, query, db_models.SavedTranslation, current_user.id, response, search, cursor, limit)
+    return [item for item, in rows]
 
 
 @app.delete("/saved-translations/{saved_id}")
 async def delete_saved_translation(
     saved_id: int, current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Xóa một bản dịch đã lưu"""
-    item = db.query(db_models.SavedTranslation).filter(db_models.SavedTranslation.id == saved_id, db_models.SavedTranslation.user_id == current_user.id).first()
+    item = await db.scalar(select(db_models.SavedTranslation).where(db_models.SavedTranslation.id == saved_id, db_models.SavedTranslation.user_id == current_user.id))
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
     return {"message": "Deleted"}
 
 
 @app.delete("/saved-translations")
 async def clear_all_saved_translations(
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Xóa tất cả bản dịch đã lưu"""
-    db.query(db_models.SavedTranslation).filter(db_models.SavedTranslation.user_id == current_user.id).delete()
-    db.commit()
+    await db.execute(delete(db_models.SavedTranslation).where(db_models.SavedTranslation.user_id == current_user.id))
+    await db.commit()
     return {"message": "All saved translations cleared"}
 
 
@@ -351,26 +869,27 @@ async def clear_all_saved_translations(
 async def contribute_translation(
     item: schemas.ContributionCreate, 
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Đóng góp một bản dịch"""
     try:
         # Kiểm tra đã đóng góp cùng text này chưa
-        existing = db.query(db_models.TranslationContribution).filter(
+        existing = await db.scalar(select(db_models.TranslationContribution).where(
             db_models.TranslationContribution.user_id == current_user.id,
-            db_models.TranslationContribution.original_text == item.original_text,
-            db_models.TranslationContribution.suggested_translation == item.suggested_translation
-        ).first()
+            db_models.TranslationContribution.content_hash == db_models.make_content_hash(
+                item.original_text, item.suggested_translation
+            )
+        ))
         
         if existing:
             raise HTTPException(status_code=400, detail="You already contributed this translation")
         
         new_contrib = db_models.TranslationContribution(**item.dict(), user_id=current_user.id)
         db.add(new_contrib)
-        db.commit()
+        await db.commit()
         return {"message": "Contribution received. Thank you!"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
@@ -379,31 +898,30 @@ async def contribute_translation(
 async def rate_translation(
     item: schemas.RatingCreate, 
     current_user: db_models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Thêm hoặc cập nhật rating"""
     try:
         # Kiểm tra rating cũ
-        existing_rating = db.query(db_models.TranslationRating).filter(
+        existing_rating = await db.scalar(select(db_models.TranslationRating).where(
             db_models.TranslationRating.user_id == current_user.id,
-            db_models.TranslationRating.original_text == item.original_text,
-            db_models.TranslationRating.translated_text == item.translated_text
-        ).first()
+            db_models.TranslationRating.content_hash == db_models.make_content_hash(item.original_text, item.translated_text)
+        ))
         
         if existing_rating:
             # Nếu rating khác nhau, cập nhật (thay đổi like thành dislike và ngược lại)
             if existing_rating.rating != item.rating:
                 existing_rating.rating = item.rating
-                db.commit()
+                await db.commit()
                 return {"message": "Thank you for your feedback!"}
         
         # Chưa có rating, thêm mới
         new_rating = db_models.TranslationRating(**item.dict(), user_id=current_user.id)
         db.add(new_rating)
-        db.commit()
+        await db.commit()
         return {"message": "Thank you for your feedback!"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
@@ -411,22 +929,21 @@ async def rate_translation(
 async def undo_rating(
     item: schemas.RatingCreate,
     current_user: db_models.User = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Hủy rating (unlike/undislike)"""
     try:
-        deleted_count = db.query(db_models.TranslationRating).filter(
+        result = await db.execute(delete(db_models.TranslationRating).where(
             db_models.TranslationRating.user_id == current_user.id,
-            db_models.TranslationRating.original_text == item.original_text,
-            db_models.TranslationRating.translated_text == item.translated_text,
+            db_models.TranslationRating.content_hash == db_models.make_content_hash(item.original_text, item.translated_text),
             db_models.TranslationRating.rating == item.rating
-        ).delete()
-        db.commit()
-        if deleted_count == 0:
+        ))
+        await db.commit()
+        if result.rowcount == 0:
             return {"message": "No rating found"}
         return {"message": ""}  
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
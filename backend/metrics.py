@@ -0,0 +1,177 @@
+"""
+Metrics dạng Prometheus (text exposition format 0.0.4), không cần thư viện ngoài.
+Các metric được khai báo một lần ở cuối file và dùng chung cho toàn bộ server, GET /metrics trả về render().
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket mặc định (giây) cho các histogram thời gian
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+RATIO_BUCKETS = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+_metrics = []
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """Danh sách (tên, chuỗi label, giá trị) để render"""
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Giá trị chỉ tăng (số request, số lần cache hit...)"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Giá trị tức thời. Nếu truyền function thì giá trị được đọc lại mỗi lần render (không có label)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.function is not None:
+            return [(self.name, "", self.function())]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """Phân phối giá trị theo bucket (độ trễ, kích thước batch, số token...)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian chạy của khối lệnh (giây)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    samples.append((
+                        f"{self.name}_bucket",
+                        _format_labels(self.labelnames, key, [("le", _format_value(bound))]),
+                        cumulative
+                    ))
+                labels = _format_labels(self.labelnames, key)
+                samples.append((f"{self.name}_sum", labels, state["sum"]))
+                samples.append((f"{self.name}_count", labels, state["count"]))
+        return samples
+
+
+def render() -> str:
+    """Toàn bộ metric theo định dạng text của Prometheus"""
+    return "\n".join(metric.render() for metric in _metrics) + "\n"
+
+
+# Request HTTP, path là route template (vd. /jobs/{job_id}) để không tạo quá nhiều label
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status code", ("method", "path", "status"))
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency until response headers are sent", ("method", "path")
+)
+
+# Thời gian từng bước xử lý: jwt_decode, user_lookup, tokenize, encode, decode, detokenize,
+# history_write (một batch của history_writer)
+STAGE_SECONDS = Histogram("translation_stage_seconds", "Time spent in each request stage", ("stage",))
+
+# Cache người dùng của get_current_user (auth.principal_cache)
+PRINCIPAL_CACHE_LOOKUPS = Counter("auth_principal_cache_lookups_total", "Principal cache lookups by result", ("result",))
+
+# Hàng đợi và batch inference
+QUEUE_WAIT_SECONDS = Histogram(
+    "inference_queue_wait_seconds", "Time a request waits before its batch starts running", ("queue",)
+)
+BATCH_SIZE = Histogram("inference_batch_size", "Number of sentences per model.generate call", buckets=BATCH_BUCKETS)
+PADDING_RATIO = Histogram(
+    "inference_padding_ratio", "Fraction of padding tokens per model.generate call", buckets=RATIO_BUCKETS
+)
+INPUT_TOKENS = Histogram("translation_input_tokens", "Source tokens per sentence", buckets=TOKEN_BUCKETS)
+OUTPUT_TOKENS = Histogram("translation_output_tokens", "Generated tokens per sentence", buckets=TOKEN_BUCKETS)
+
+# Ghi lịch sử dịch (write-behind)
+HISTORY_ROWS = Counter("history_rows_total", "History rows handled by the write-behind buffer by result", ("result",))
+
+# Cache bản dịch
+CACHE_LOOKUPS = Counter("translation_cache_lookups_total", "Translation cache lookups by result", ("result",))
+CACHE_HIT_RATIO = Histogram(
+    "translation_cache_hit_ratio", "Fraction of sentences served from cache per lookup (request, batch or stream)", buckets=RATIO_BUCKETS
+)
@@ -0,0 +1,146 @@
+"""
+Cập nhật schema cho database đã tồn tại (create_all chỉ tạo bảng mới, không thêm cột/index vào bảng cũ).
+Các bước đều idempotent, được chạy khi server khởi động và có thể chạy trước khi deploy:
+    python -m backend.migrations
+Gộp các bản ghi lịch sử trùng (xóa dữ liệu, không chạy tự động):
+    python -m backend.migrations --dedupe-history
+"""
+import argparse
+import os
+
+from sqlalchemy import bindparam, inspect, select, text
+
+from . import database
+from . import db_models
+from . import history_writer
+from . import search
+
+# Số bản ghi được tính content_hash/search_text trong mỗi transaction khi backfill
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+
+# Bảng có cột content_hash -> (cột văn bản gốc, cột bản dịch)
+CONTENT_HASH_TABLES = {
+    "translation_history": ("original_text", "translated_text"),
+    "saved_translations": ("original_text", "translated_text"),
+    "ratings": ("original_text", "translated_text"),
+    "contributions": ("original_text", "suggested_translation"),
+}
+
+# Cột được tính từ văn bản của bản ghi -> (kiểu SQL, bảng và cột nguồn, hàm tính)
+DERIVED_COLUMNS = {
+    "content_hash": ("VARCHAR(64)", CONTENT_HASH_TABLES, db_models.make_content_hash),
+    "search_text": ("TEXT", search.SEARCH_TABLES, search.make_search_text),
+}
+
+
+def add_missing_columns(engine):
+    """Thêm các cột tính toán vào các bảng tạo trước khi có cột đó"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for column_name, (column_type, tables, _) in DERIVED_COLUMNS.items():
+            for table_name in tables:
+                if table_name not in existing_tables:
+                    continue
+                columns = {column["name"] for column in inspector.get_columns(table_name)}
+                if column_name not in columns:
+                    print(f"Adding column {table_name}.{column_name}...")
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+
+
+def backfill_column(engine, column_name: str, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Tính giá trị cho các bản ghi cũ (cột đang NULL), mỗi batch một transaction"""
+    _, tables, compute = DERIVED_COLUMNS[column_name]
+    for table_name, (original_column, translated_column) in tables.items():
+        table = db_models.Base.metadata.tables[table_name]
+        pending = (
+            select(table.c.id, table.c[original_column], table.c[translated_column])
+            .where(table.c[column_name].is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        )
+        update = (
+            table.update()
+            .where(table.c.id == bindparam("row_id"))
+            .values({column_name: bindparam("value")})
+        )
+        total = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(pending).all()
+                if not rows:
+                    break
+                conn.execute(update, [
+                    {"row_id": row[0], "value": compute(row[1], row[2])} for row in rows
+                ])
+            total += len(rows)
+        if total:
+            print(f"Backfilled {column_name} for {total} rows in {table_name}")
+
+
+def create_history_content_index(engine):
+    """
+    Tạo unique index trên khóa nội dung của lịch sử (history_writer dùng để upsert bằng ON CONFLICT).
+    Lịch sử cũ có bản trùng thì không tạo (không xóa dữ liệu), history_writer dùng cách cập nhật rồi insert.
+    """
+    indexes = {index["name"] for index in inspect(engine).get_indexes("translation_history")}
+    if history_writer.CONTENT_INDEX in indexes:
+        return
+    key = ", ".join(history_writer.CONTENT_KEY)
+    with engine.begin() as conn:
+        duplicate = conn.execute(text(
+            f"SELECT 1 FROM translation_history GROUP BY {key} HAVING count(*) > 1 LIMIT 1"
+        )).first()
+        if duplicate:
+            print(
+                f"translation_history has duplicate translations, skipping {history_writer.CONTENT_INDEX} "
+                f"(run python -m backend.migrations --dedupe-history to create it)"
+            )
+            return
+        print(f"Creating index {history_writer.CONTENT_INDEX}...")
+        conn.execute(text(f"CREATE UNIQUE INDEX {history_writer.CONTENT_INDEX} ON translation_history ({key})"))
+
+
+def deduplicate_history(engine):
+    """
+    Chỉ giữ bản ghi mới nhất của mỗi khóa nội dung (user_id, content_hash, source_lang, target_lang).
+    Xóa vĩnh viễn các lần dịch cũ hơn nên không nằm trong upgrade(), chỉ chạy khi gọi --dedupe-history.
+    """
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            "DELETE FROM translation_history WHERE id NOT IN ("
+            f"SELECT max(id) FROM translation_history GROUP BY {', '.join(history_writer.CONTENT_KEY)})"
+        ))
+    if result.rowcount:
+        print(f"Removed {result.rowcount} duplicate rows from translation_history")
+
+
+def create_missing_indexes(engine):
+    """Tạo các index khai báo trong db_models nhưng chưa có trong database"""
+    for table in db_models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def upgrade(engine=database.engine, dedupe_history: bool = False):
+    # Backfill trước khi tạo index để không phải cập nhật index cho từng bản ghi
+    add_missing_columns(engine)
+    for column_name in DERIVED_COLUMNS:
+        backfill_column(engine, column_name)
+    if dedupe_history:
+        deduplicate_history(engine)
+    create_missing_indexes(engine)
+    create_history_content_index(engine)
+    search.setup(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade the database schema")
+    parser.add_argument(
+        "--dedupe-history", action="store_true",
+        help="Also delete older duplicates of each translation in the history, keeping the newest (irreversible)"
+    )
+    args = parser.parse_args()
+    db_models.Base.metadata.create_all(bind=database.engine)
+    upgrade(dedupe_history=args.dedupe_history)
+    print("Database is up to date.")
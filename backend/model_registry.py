@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .translation_cache import adapter_fingerprint
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Thư mục chứa các LoRA adapter theo lĩnh vực: <ADAPTERS_DIR>/<direction>/<tên adapter>/adapter_config.json
+ADAPTERS_DIR = os.getenv("ADAPTERS_DIR", os.path.join(BASE_DIR, "adapters"))
+# Giới hạn bộ nhớ (MB) và số lượng adapter phụ được giữ trên model cùng lúc, adapter ít dùng nhất bị gỡ trước
+ADAPTER_MEMORY_BUDGET_MB = float(os.getenv("ADAPTER_MEMORY_BUDGET_MB", "512"))
+MAX_LOADED_ADAPTERS = int(os.getenv("MAX_LOADED_ADAPTERS", "8"))
+
+# Tên adapter mặc định của mỗi chiều dịch (lora-vinai-<direction>)
+DEFAULT_ADAPTER = "default"
+
+
+class AdapterError(ValueError):
+    """Adapter không tồn tại hoặc không dùng được với model hiện tại"""
+
+
+def discover_adapters(adapters_dir: str = ADAPTERS_DIR):
+    """Tìm các adapter phụ trên đĩa, trả về {direction: {name: path}}"""
+    found = {}
+    if not os.path.isdir(adapters_dir):
+        return found
+    for direction in sorted(os.listdir(adapters_dir)):
+        direction_dir = os.path.join(adapters_dir, direction)
+        if not os.path.isdir(direction_dir):
+            continue
+        for name in sorted(os.listdir(direction_dir)):
+            path = os.path.join(direction_dir, name)
+            if name != DEFAULT_ADAPTER and os.path.exists(os.path.join(path, "adapter_config.json")):
+                found.setdefault(direction, {})[name] = path
+    return found
+
+
+def _estimate_size_mb(path: str) -> float:
+    """Ước lượng bộ nhớ của adapter trước khi load, dựa trên kích thước file trọng số"""
+    for name in ("adapter_model.safetensors", "adapter_model.bin"):
+        weights = os.path.join(path, name)
+        if os.path.exists(weights):
+            return os.path.getsize(weights) / 1024 ** 2
+    return 0.0
+
+
+def _adapter_size_mb(model, name: str) -> float:
+    """Bộ nhớ thực tế của các tham số LoRA thuộc adapter sau khi load"""
+    marker = f".{name}."
+    return sum(
+        p.numel() * p.element_size() for param_name, p in model.named_parameters() if marker in param_name
+    ) / 1024 ** 2
+
+
+class ModelRegistry:
+    """
+    Quản lý nhiều LoRA adapter trên cùng một base model cho mỗi chiều dịch.
+    Base model chỉ load một lần (PeftModel chưa merge), các adapter phụ được load/gỡ theo nhu cầu
+    bằng load_adapter/delete_adapter, nên mỗi adapter chỉ tốn vài chục MB thay vì một model đầy đủ.
+    Adapter được chọn theo từng request (set_adapter) dưới lock của chiều dịch.
+    """
+
+    def __init__(self, adapters_dir=ADAPTERS_DIR, memory_budget_mb=ADAPTER_MEMORY_BUDGET_MB, max_loaded=MAX_LOADED_ADAPTERS):
+        self.adapters_dir = adapters_dir
+        self.memory_budget_mb = memory_budget_mb
+        self.max_loaded = max(1, max_loaded)
+        self.available = discover_adapters(adapters_dir)
+        self._models = {}  # direction -> PeftModel dùng chung
+        self._locks = {}  # direction -> lock, giữ trong lúc set_adapter + generate
+        self._loaded = OrderedDict()  # (direction, name) -> size_mb, theo thứ tự LRU
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def has_extra_adapters(self, direction: str) -> bool:
+        """Chiều dịch có adapter phụ => model phải giữ dạng PeftModel chưa merge"""
+        return bool(self.available.get(direction))
+
+    def adapter_names(self, direction: str):
+        return [DEFAULT_ADAPTER] + sorted(self.available.get(direction, {}))
+
+    def is_available(self, direction: str, name=None) -> bool:
+        return name in (None, DEFAULT_ADAPTER) or name in self.available.get(direction, {})
+
+    def adapter_id(self, direction: str, name: str) -> str:
+        """Định danh adapter phụ cho key cache, thay đổi khi file adapter thay đổi"""
+        return f"{name}:{adapter_fingerprint(self.available[direction][name])}"
+
+    def attach(self, direction: str, model):
+        """Đăng ký PeftModel (adapter mặc định tên "default") của chiều dịch để dùng chung cho các adapter phụ"""
+        with self._lock:
+            self._models[direction] = model
+            self._locks.setdefault(direction, threading.RLock())
+            for key in [key for key in self._loaded if key[0] == direction]:
+                del self._loaded[key]
+            self._stat(direction, DEFAULT_ADAPTER)["loaded"] = True
+
+    def _stat(self, direction, name):
+        return self._stats.setdefault(f"{direction}/{name}", {
+            "loaded": False,
+            "loads": 0,
+            "load_seconds": 0.0,
+            "evictions": 0,
+            "requests": 0,
+            "last_used": None,
+            "size_mb": 0.0,
+        })
+
+    @contextmanager
+    def activate(self, direction: str, name=None):
+        """
+        Chọn adapter cho một lần generate. Load adapter nếu chưa có (gỡ adapter ít dùng nhất khi vượt giới hạn).
+        Chiều dịch không có adapter phụ thì không cần lock, các worker vẫn chạy song song như trước.
+        """
+        name = name or DEFAULT_ADAPTER
+        if not self.is_available(direction, name):
+            raise AdapterError(f"Unknown adapter '{name}' for {direction}")
+
+        model = self._models.get(direction)
+        if model is None:
+            if name != DEFAULT_ADAPTER:
+                raise AdapterError(f"Adapter '{name}' requires an unmerged PyTorch model for {direction}")
+            self._record_use(direction, name)
+            yield
+            return
+
+        with self._locks[direction]:
+            if name != DEFAULT_ADAPTER:
+                self._ensure_loaded(model, direction, name)
+            model.set_adapter(name)
+            self._record_use(direction, name)
+            yield
+
+    def _record_use(self, direction, name):
+        with self._lock:
+            stat = self._stat(direction, name)
+            stat["requests"] += 1
+            stat["last_used"] = time.time()
+            if (direction, name) in self._loaded:
+                self._loaded.move_to_end((direction, name))
+
+    def _ensure_loaded(self, model, direction, name):
+        key = (direction, name)
+        if key in self._loaded:
+            return
+
+        path = self.available[direction][name]
+        self._evict_for(_estimate_size_mb(path))
+
+        print(f"Loading adapter '{name}' for {direction} from {path}...")
+        start = time.perf_counter()
+        model.load_adapter(path, adapter_name=name)
+        model.eval()
+        elapsed = time.perf_counter() - start
+
+        size_mb = _adapter_size_mb(model, name)
+        with self._lock:
+            self._loaded[key] = size_mb
+            stat = self._stat(direction, name)
+            stat.update(loaded=True, size_mb=round(size_mb, 2))
+            stat["loads"] += 1
+            stat["load_seconds"] += elapsed
+
+    def _evict_for(self, size_mb):
+        """Gỡ các adapter ít dùng nhất cho tới khi đủ chỗ cho adapter mới"""
+        for direction, name in list(self._loaded):
+            if len(self._loaded) < self.max_loaded and sum(self._loaded.values()) + size_mb <= self.memory_budget_mb:
+                return
+            # Không chờ lock của chiều dịch khác đang generate (tránh deadlock), thử adapter kế tiếp
+            lock = self._locks[direction]
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                print(f"Evicting adapter '{name}' for {direction}...")
+                self._models[direction].delete_adapter(name)
+                self._models[direction].set_adapter(DEFAULT_ADAPTER)
+            finally:
+                lock.release()
+            with self._lock:
+                del self._loaded[(direction, name)]
+                stat = self._stat(direction, name)
+                stat.update(loaded=False, size_mb=0.0)
+                stat["evictions"] += 1
+
+    def stats(self):
+        """Thống kê load, gỡ và số request của từng adapter"""
+        with self._lock:
+            return {
+                "memory_budget_mb": self.memory_budget_mb,
+                "max_loaded": self.max_loaded,
+                "loaded_mb": round(sum(self._loaded.values()), 2),
+                "available": {direction: self.adapter_names(direction) for direction in ("en2vi", "vi2en")},
+                "adapters": {key: dict(stat) for key, stat in self._stats.items()},
+            }
+
+
+# Registry dùng chung cho toàn bộ server
+registry = ModelRegistry()
@@ -0,0 +1,388 @@
+"""
+Engine inference bằng ONNX Runtime cho model đã merge LoRA.
+
+Export (chạy từ thư mục gốc của project, cần cài optimum[onnxruntime] trong requirements.txt):
+    python -m backend.export_merged --direction en2vi
+    python -m backend.onnx_engine --direction en2vi
+
+Sau đó chạy server với INFERENCE_ENGINE=onnx.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+from . import inference
+
+# Thư mục chứa các file ONNX đã export
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(inference.BASE_DIR, "onnx"))
+# Số thread cho mỗi phiên ONNX Runtime (0 = để ONNX Runtime tự chọn)
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))
+EXPORT_INFO_FILE = "export_info.json"
+
+ENCODER_FILE = "encoder_model.onnx"
+DECODER_FILE = "decoder_model.onnx"
+DECODER_WITH_PAST_FILE = "decoder_with_past_model.onnx"
+
+
+def get_onnx_path(direction: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, f"vinai-{direction}")
+
+
+def export_onnx_model(direction: str, output_dir: str = None):
+    """
+    Export encoder, decoder và decoder-with-past (KV cache) từ checkpoint đã merge.
+    Kết quả được cache trên đĩa, lần sau chỉ cần load lại.
+    """
+    try:
+        from optimum.exporters.onnx import main_export
+    except ImportError:
+        raise ImportError('ONNX export requires optimum: pip install "optimum[onnxruntime]"') from None
+
+    _, _, merged_path = inference.get_model_paths(direction)
+    merge_info_path = os.path.join(merged_path, inference.MERGE_INFO_FILE)
+    if not os.path.exists(merge_info_path):
+        raise FileNotFoundError(
+            f"No merged model found at {merged_path}. Run: python -m backend.export_merged --direction {direction}"
+        )
+    output_dir = output_dir or get_onnx_path(direction)
+
+    print(f"Exporting {merged_path} to ONNX...")
+    main_export(
+        model_name_or_path=merged_path,
+        output=output_dir,
+        task="text2text-generation-with-past",
+        no_post_process=True  # Giữ decoder và decoder-with-past thành 2 file riêng
+    )
+
+    # Tokenizer và thông tin adapter đi kèm các file ONNX
+    AutoTokenizer.from_pretrained(merged_path).save_pretrained(output_dir)
+    shutil.copy(merge_info_path, os.path.join(output_dir, EXPORT_INFO_FILE))
+    print(f"ONNX model saved to {output_dir}")
+    return output_dir
+
+
+def apply_repetition_penalty(scores, sequences, penalty):
+    """Giống RepetitionPenaltyLogitsProcessor: giảm điểm các token đã xuất hiện trong câu đang sinh"""
+    if penalty == 1.0:
+        return scores
+    scores = scores.copy()
+    for i, seq in enumerate(sequences):
+        tokens = np.unique(seq)
+        values = scores[i, tokens]
+        scores[i, tokens] = np.where(values < 0, values * penalty, values / penalty)
+    return scores
+
+
+def ban_repeated_ngrams(scores, sequences, ngram_size):
+    """Giống NoRepeatNGramLogitsProcessor: cấm token tạo lại một n-gram đã có trong câu"""
+    if ngram_size <= 0:
+        return scores
+    scores = scores.copy()
+    for i, seq in enumerate(sequences):
+        if len(seq) + 1 < ngram_size:
+            continue
+        prefix = seq[len(seq) - ngram_size + 1:]
+        banned = [
+            seq[j + ngram_size - 1] for j in range(len(seq) - ngram_size + 1)
+            if seq[j:j + ngram_size - 1] == prefix
+        ]
+        scores[i, banned] = -np.inf
+    return scores
+
+
+class OnnxSeq2SeqModel:
+    """
+    Model seq2seq chạy bằng ONNX Runtime với cùng interface generate() như model Hugging Face,
+    để inference.translate_batch có thể dùng mà không cần thay đổi.
+    Hỗ trợ greedy search và beam search, tái sử dụng KV cache giữa các bước decode.
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self, model_dir: str, num_threads: int = ONNX_NUM_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+
+        self.encoder = ort.InferenceSession(os.path.join(model_dir, ENCODER_FILE), options, providers=providers)
+        self.decoder = ort.InferenceSession(os.path.join(model_dir, DECODER_FILE), options, providers=providers)
+        self.decoder_with_past = ort.InferenceSession(
+            os.path.join(model_dir, DECODER_WITH_PAST_FILE), options, providers=providers
+        )
+        self._decoder_inputs = {i.name for i in self.decoder.get_inputs()}
+        self._decoder_with_past_inputs = {i.name for i in self.decoder_with_past.get_inputs()}
+
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        generation_config_path = os.path.join(model_dir, "generation_config.json")
+        if os.path.exists(generation_config_path):
+            with open(generation_config_path, encoding="utf-8") as f:
+                config.update(json.load(f))
+        self.eos_token_id = config["eos_token_id"]
+        self.pad_token_id = config["pad_token_id"]
+        # Giống model.generate: ép token cuối cùng là eos khi đạt max_length
+        self.forced_eos_token_id = config.get("forced_eos_token_id")
+
+    def eval(self):
+        return self
+
+    def _run_decoder(self, session, input_names, feeds):
+        """Chạy một bước decode, trả về (logits bước cuối, dict present key/value)"""
+        outputs = session.run(None, {name: value for name, value in feeds.items() if name in input_names})
+        names = [o.name for o in session.get_outputs()]
+        results = dict(zip(names, outputs))
+        present = {
+            name.replace("present", "past_key_values", 1): value
+            for name, value in results.items() if name.startswith("present")
+        }
+        return results["logits"][:, -1, :], present
+
+    def get_encoder(self):
+        """Như model Hugging Face: encoder chạy riêng được, kết quả truyền lại vào generate(encoder_outputs=...)"""
+        def encode(input_ids, attention_mask, **kwargs):
+            return (self._encode(
+                input_ids.cpu().numpy().astype(np.int64), attention_mask.cpu().numpy().astype(np.int64)
+            ),)
+        return encode
+
+    def _encode(self, input_ids, attention_mask):
+        return self.encoder.run(None, {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+
+    def _start(self, input_ids, attention_mask, decoder_input_ids, encoder_hidden_states=None):
+        """Chạy encoder (nếu chưa có kết quả) và bước decode đầu tiên"""
+        if encoder_hidden_states is None:
+            encoder_hidden_states = self._encode(input_ids, attention_mask)
+        feeds = {
+            "input_ids": decoder_input_ids,
+            "encoder_hidden_states": encoder_hidden_states,
+            "encoder_attention_mask": attention_mask,
+        }
+        logits, past = self._run_decoder(self.decoder, self._decoder_inputs, feeds)
+        return encoder_hidden_states, logits, past
+
+    def _step(self, next_tokens, attention_mask, encoder_hidden_states, past):
+        """Một bước decode với KV cache, chỉ cập nhật cache self-attention của decoder"""
+        feeds = {
+            "input_ids": next_tokens[:, None],
+            "encoder_hidden_states": encoder_hidden_states,
+            "encoder_attention_mask": attention_mask,
+            **past,
+        }
+        logits, present = self._run_decoder(self.decoder_with_past, self._decoder_with_past_inputs, feeds)
+        past.update(present)
+        return logits
+
+    def generate(
+        self,
+        input_ids,
+        attention_mask,
+        decoder_start_token_id,
+        max_length=1024,
+        max_new_tokens=None,
+        num_beams=1,
+        length_penalty=1.0,
+        early_stopping=False,
+        repetition_penalty=1.0,
+        no_repeat_ngram_size=0,
+        streamer=None,
+        encoder_outputs=None,
+        **kwargs
+    ):
+        if kwargs:
+            print(f"Warning: ONNX engine ignores generation params {sorted(kwargs)}")
+        input_ids = input_ids.cpu().numpy().astype(np.int64)
+        attention_mask = attention_mask.cpu().numpy().astype(np.int64)
+        # Số token tối đa được sinh thêm (không tính decoder_start_token)
+        max_steps = max_new_tokens if max_new_tokens is not None else max_length - 1
+        encoder_hidden_states = None if encoder_outputs is None else np.asarray(encoder_outputs[0])
+
+        def process(scores, sequences):
+            scores = apply_repetition_penalty(scores, sequences, repetition_penalty)
+            return ban_repeated_ngrams(scores, sequences, no_repeat_ngram_size)
+
+        if num_beams > 1:
+            sequences = self._beam_search(
+                input_ids, attention_mask, decoder_start_token_id, max_steps, num_beams, length_penalty, early_stopping,
+                process, encoder_hidden_states
+            )
+        else:
+            sequences = self._greedy_search(
+                input_ids, attention_mask, decoder_start_token_id, max_steps, streamer, process, encoder_hidden_states
+            )
+
+        # Pad các câu về cùng độ dài giống đầu ra của model.generate
+        width = max(len(seq) for seq in sequences)
+        output = np.full((len(sequences), width), self.pad_token_id, dtype=np.int64)
+        for i, seq in enumerate(sequences):
+            output[i, :len(seq)] = seq
+        return torch.from_numpy(output)
+
+    def _greedy_search(
+        self, input_ids, attention_mask, decoder_start_token_id, max_steps, streamer=None, process=None,
+        encoder_hidden_states=None
+    ):
+        batch_size = input_ids.shape[0]
+        decoder_input_ids = np.full((batch_size, 1), decoder_start_token_id, dtype=np.int64)
+        if streamer is not None:
+            streamer.put(torch.from_numpy(decoder_input_ids[0]))
+
+        encoder_hidden_states, logits, past = self._start(
+            input_ids, attention_mask, decoder_input_ids, encoder_hidden_states
+        )
+        sequences = [[decoder_start_token_id] for _ in range(batch_size)]
+        finished = np.zeros(batch_size, dtype=bool)
+
+        for step in range(max_steps):
+            if process is not None:
+                logits = process(logits, sequences)
+            next_tokens = logits.argmax(axis=-1).astype(np.int64)
+            if step == max_steps - 1 and self.forced_eos_token_id is not None:
+                next_tokens[:] = self.forced_eos_token_id
+            # Câu đã kết thúc chỉ được nối thêm pad
+            next_tokens = np.where(finished, self.pad_token_id, next_tokens)
+            for i in range(batch_size):
+                if not finished[i]:
+                    sequences[i].append(int(next_tokens[i]))
+            if streamer is not None:
+                streamer.put(torch.from_numpy(next_tokens[:1]))
+
+            finished |= next_tokens == self.eos_token_id
+            if finished.all() or step == max_steps - 1:
+                break
+            logits = self._step(next_tokens, attention_mask, encoder_hidden_states, past)
+
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+    def _beam_search(
+        self, input_ids, attention_mask, decoder_start_token_id, max_steps, num_beams, length_penalty, early_stopping,
+        process=None, encoder_hidden_states=None
+    ):
+        batch_size = input_ids.shape[0]
+        # Nhân bản mỗi câu thành num_beams beam
+        input_ids = np.repeat(input_ids, num_beams, axis=0)
+        attention_mask = np.repeat(attention_mask, num_beams, axis=0)
+        if encoder_hidden_states is not None:
+            encoder_hidden_states = np.repeat(encoder_hidden_states, num_beams, axis=0)
+        decoder_input_ids = np.full((batch_size * num_beams, 1), decoder_start_token_id, dtype=np.int64)
+        encoder_hidden_states, logits, past = self._start(
+            input_ids, attention_mask, decoder_input_ids, encoder_hidden_states
+        )
+
+        beams = [[decoder_start_token_id] for _ in range(batch_size * num_beams)]
+        # Ban đầu các beam giống nhau nên chỉ giữ beam đầu tiên để tránh trùng lặp
+        beam_scores = np.zeros((batch_size, num_beams), dtype=np.float32)
+        beam_scores[:, 1:] = -1e9
+        beam_scores = beam_scores.reshape(-1)
+        finished = [[] for _ in range(batch_size)]  # (score, tokens)
+        done = [False] * batch_size
+
+        for step in range(max_steps):
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            log_probs = logits - np.log(np.exp(logits).sum(axis=-1, keepdims=True))
+            # Như model.generate, beam search áp dụng các ràng buộc trên log xác suất
+            if process is not None:
+                log_probs = process(log_probs, beams)
+            if step == max_steps - 1 and self.forced_eos_token_id is not None:
+                forced = np.full_like(log_probs, -np.inf)
+                forced[:, self.forced_eos_token_id] = 0
+                log_probs = forced
+            vocab_size = log_probs.shape[-1]
+            scores = (beam_scores[:, None] + log_probs).reshape(batch_size, num_beams * vocab_size)
+
+            # Lấy 2 * num_beams ứng viên để vẫn đủ beam sau khi loại các beam kết thúc bằng eos
+            top = np.argsort(-scores, axis=-1)[:, :2 * num_beams]
+            next_beams, next_tokens, next_scores = [], [], []
+            for b in range(batch_size):
+                selected = []
+                for index in top[b]:
+                    beam = b * num_beams + index // vocab_size
+                    token = int(index % vocab_size)
+                    score = float(scores[b, index])
+                    if done[b]:
+                        break
+                    if token == self.eos_token_id:
+                        tokens = beams[beam] + [token]
+                        finished[b].append((score / (len(tokens) - 1) ** length_penalty, tokens))
+                    else:
+                        selected.append((beam, token, score))
+                    if len(selected) == num_beams:
+                        break
+                # Câu đã xong: giữ beam giả để không đổi kích thước batch
+                while len(selected) < num_beams:
+                    selected.append((b * num_beams, self.pad_token_id, -1e9))
+
+                if len(finished[b]) >= num_beams:
+                    if early_stopping:
+                        done[b] = True
+                    else:
+                        # Dừng khi không beam nào còn sống có thể vượt hypothesis tốt nhất đã kết thúc
+                        best_alive = max(score for _, _, score in selected) / (len(beams[0]) ** length_penalty)
+                        done[b] = max(s for s, _ in finished[b]) >= best_alive
+
+                for beam, token, score in selected:
+                    next_beams.append(beam)
+                    next_tokens.append(token)
+                    next_scores.append(score)
+
+            beams = [beams[beam] + [token] for beam, token in zip(next_beams, next_tokens)]
+            beam_scores = np.array(next_scores, dtype=np.float32)
+            if all(done) or step == max_steps - 1:
+                break
+
+            # Sắp xếp lại KV cache theo beam được chọn
+            beam_index = np.array(next_beams, dtype=np.int64)
+            for name in past:
+                if ".decoder." in name:
+                    past[name] = past[name][beam_index]
+            logits = self._step(np.array(next_tokens, dtype=np.int64), attention_mask, encoder_hidden_states, past)
+
+        sequences = []
+        for b in range(batch_size):
+            if finished[b]:
+                sequences.append(max(finished[b], key=lambda item: item[0])[1])
+            else:
+                # Không beam nào kết thúc trước max_length: lấy beam có điểm cao nhất
+                best = b * num_beams + int(np.argmax(beam_scores[b * num_beams:(b + 1) * num_beams]))
+                sequences.append(beams[best])
+        return sequences
+
+
+def load_onnx_model(direction: str):
+    """Load model ONNX đã export, trả về (model, tokenizer, adapter_id)"""
+    model_dir = get_onnx_path(direction)
+    export_info_path = os.path.join(model_dir, EXPORT_INFO_FILE)
+    if not os.path.exists(export_info_path):
+        raise FileNotFoundError(
+            f"No ONNX model found at {model_dir}. Run: python -m backend.onnx_engine --direction {direction}"
+        )
+
+    print(f"Loading ONNX model from {model_dir}...")
+    model = OnnxSeq2SeqModel(model_dir)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+    with open(export_info_path, encoding="utf-8") as f:
+        adapter_id = json.load(f)["adapter_id"]
+    return model, tokenizer, adapter_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the merged translation model to ONNX")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], required=True)
+    parser.add_argument("--output", default=None, help="Output directory (default: backend/onnx/vinai-<direction>)")
+    args = parser.parse_args()
+
+    try:
+        export_onnx_model(args.direction, args.output)
+    except (ImportError, FileNotFoundError) as e:
+        # Thiếu thư viện hoặc chưa merge model: in hướng dẫn thay vì traceback
+        raise SystemExit(f"Error: {e}")
@@ -0,0 +1,92 @@
+"""
+Phân trang theo keyset (created_at, id) cho lịch sử dịch và bản dịch đã lưu.
+Cursor là chuỗi base64 của bản ghi cuối trang trước, trang sau chỉ lấy các bản ghi cũ hơn nó
+nên mỗi trang dùng index (user_id, created_at) thay vì OFFSET phải duyệt lại toàn bộ các trang trước.
+Kết quả tìm kiếm xếp theo độ liên quan (số thực, không ổn định để làm keyset) nên dùng cursor chứa offset.
+"""
+import base64
+import os
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# Số bản ghi mặc định / tối đa mỗi trang
+PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+# Header trả về cursor của trang tiếp theo (không có header = trang cuối)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str):
+    """Tách cursor thành (phần đầu, phần sau dấu |), ValueError nếu cursor không hợp lệ"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        head, value = raw.split("|")
+        return head, value
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return _encode(f"{created_at.isoformat()}|{row_id}")
+
+
+def decode_cursor(cursor: str):
+    """Trả về (created_at, id), ValueError nếu cursor không hợp lệ"""
+    created_at, row_id = _decode(cursor)
+    try:
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    head, offset = _decode(cursor)
+    if head != "offset" or not offset.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(offset)
+
+
+def keyset_page(query, model, cursor: str = None, limit: int = PAGE_SIZE):
+    """
+    Sắp xếp mới nhất trước theo (created_at, id) và lấy limit + 1 bản ghi sau cursor
+    (bản ghi thừa chỉ để biết còn trang sau hay không).
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def split_page(rows, limit: int, key=lambda row: row):
+    """Cắt kết quả của keyset_page thành (trang, cursor trang sau hoặc None). key lấy ra bản ghi ORM từ mỗi dòng"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = key(rows[-1])
+    return rows, encode_cursor(last.created_at, last.id)
+
+
+def ranked_page(query, model, ranking, cursor: str = None, limit: int = PAGE_SIZE):
+    """
+    Sắp xếp theo độ liên quan (ranking là danh sách biểu thức ORDER BY), cùng độ liên quan thì mới nhất trước.
+    Trả về (query lấy limit + 1 bản ghi, offset của trang).
+    """
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    query = query.order_by(*ranking, model.created_at.desc(), model.id.desc()).offset(offset).limit(limit + 1)
+    return query, offset
+
+
+def split_ranked_page(rows, limit: int, offset: int):
+    """Cắt kết quả của ranked_page thành (trang, cursor trang sau hoặc None)"""
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], _encode(f"offset|{offset + limit}")
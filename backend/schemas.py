@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -19,10 +19,58 @@ class Token(BaseModel):
     token_type: str
 
 
+class DecodingOptions(BaseModel):
+    """Tham số giải mã, trường để trống lấy giá trị của preset (mặc định preset của server)"""
+    preset: Optional[Literal["fast", "balanced", "quality"]] = None
+    num_beams: Optional[int] = Field(None, ge=1, le=8)
+    # max_new_tokens = max_new_tokens_offset + max_new_tokens_ratio * số token đầu vào
+    max_new_tokens_ratio: Optional[float] = Field(None, gt=0, le=4)
+    max_new_tokens_offset: Optional[int] = Field(None, ge=0, le=256)
+    repetition_penalty: Optional[float] = Field(None, ge=1.0, le=2.0)
+    no_repeat_ngram_size: Optional[int] = Field(None, ge=0, le=10)
+    length_penalty: Optional[float] = Field(None, ge=0.0, le=2.0)
+    early_stopping: Optional[bool] = None
+
+
 class TranslationRequest(BaseModel):
     text: str
     source_lang: str = "en" 
     target_lang: str = "vi" 
+    # "text": dịch cả đoạn một lần, "document": tách câu rồi dịch theo batch
+    mode: Literal["text", "document"] = "text"
+    # Tên LoRA adapter theo lĩnh vực (GET /adapters), để trống để dùng adapter mặc định
+    adapter: Optional[str] = None
+    decoding: Optional[DecodingOptions] = None
+
+
+class StreamTranslationRequest(BaseModel):
+    text: str
+    source_lang: str = "en"
+    target_lang: str = "vi"
+    # "sentence": trả về từng câu đã dịch, "token": trả về từng token khi model sinh ra,
+    # "auto": dùng "token" nếu văn bản chỉ có một câu, ngược lại dùng "sentence"
+    mode: Literal["auto", "sentence", "token"] = "auto"
+    adapter: Optional[str] = None
+    decoding: Optional[DecodingOptions] = None
+    
+
+class BatchTranslationRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+    source_lang: str = "en"
+    target_lang: str = "vi"
+    adapter: Optional[str] = None
+    decoding: Optional[DecodingOptions] = None
+
+
+class BatchTranslationItem(BaseModel):
+    index: int
+    original: str
+    translated: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchTranslationResponse(BaseModel):
+    results: List[BatchTranslationItem]
     
 
 class HistoryResponse(BaseModel):
@@ -66,3 +114,21 @@ class RatingCreate(BaseModel):
     original_text: str
     translated_text: str
     rating: int = Field(..., ge=1, le=5)
+
+
+class TranslationJobResponse(BaseModel):
+    id: int
+    filename: str
+    file_format: str
+    source_lang: str
+    target_lang: str
+    status: str
+    total_chunks: int
+    done_chunks: int
+    failed_chunks: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
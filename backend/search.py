@@ -0,0 +1,161 @@
+"""
+Tìm kiếm toàn văn trong lịch sử dịch và bản dịch đã lưu.
+Mỗi bản ghi có cột search_text = văn bản gốc + bản dịch đã chuẩn hóa (chữ thường, bỏ dấu tiếng Việt),
+từ khóa cũng được chuẩn hóa như vậy nên "chao" tìm được "Xin chào".
+- PostgreSQL: cột tsvector (config 'simple') sinh từ search_text + index GIN, xếp hạng bằng ts_rank.
+- SQLite: bảng ảo FTS5 đồng bộ bằng trigger, xếp hạng bằng bm25 (cột rank của FTS5).
+- Database khác: ILIKE trên search_text, xếp theo thời gian.
+Mỗi từ trong từ khóa được khớp theo tiền tố và mọi từ đều phải có mặt.
+"""
+import os
+import re
+import unicodedata
+
+from sqlalchemy import case, column, func, literal_column, select, table, text
+
+# Số bản ghi khớp mới nhất được xếp hạng theo độ liên quan, các bản ghi khớp cũ hơn xếp theo thời gian (0 = xếp hạng tất cả)
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Bảng có cột search_text -> (cột văn bản gốc, cột bản dịch)
+SEARCH_TABLES = {
+    "translation_history": ("original_text", "translated_text"),
+    "saved_translations": ("original_text", "translated_text"),
+}
+
+
+def normalize(value: str) -> str:
+    """Chữ thường, bỏ dấu (kể cả đ -> d) để tìm kiếm không phân biệt dấu"""
+    value = unicodedata.normalize("NFD", value.lower()).replace("đ", "d")
+    return "".join(ch for ch in value if not unicodedata.combining(ch))
+
+
+def make_search_text(original_text: str, translated_text: str) -> str:
+    return normalize(f"{original_text}\n{translated_text}")
+
+
+def search_text_default(translated_column: str):
+    """Giá trị mặc định của cột search_text, tính từ các cột văn bản của chính bản ghi khi insert"""
+    def default(context):
+        params = context.get_current_parameters()
+        return make_search_text(params["original_text"], params[translated_column])
+    return default
+
+
+def terms(search: str):
+    """Các từ (đã chuẩn hóa) của từ khóa, bỏ dấu câu và ký tự đặc biệt của cú pháp truy vấn"""
+    return re.findall(r"[^\W_]+", normalize(search))
+
+
+def _fts_table(table_name: str) -> str:
+    return f"{table_name}_fts"
+
+
+def setup(engine):
+    """Tạo index/bảng tìm kiếm theo loại database (idempotent, gọi từ migrations.upgrade)"""
+    if engine.dialect.name == "postgresql":
+        _setup_postgresql(engine)
+    elif engine.dialect.name == "sqlite":
+        _setup_sqlite(engine)
+
+
+def _setup_postgresql(engine):
+    with engine.begin() as conn:
+        # btree_gin cho phép gộp user_id vào index GIN để chỉ duyệt bản ghi của một người dùng
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+            composite = True
+        except Exception as e:
+            print(f"btree_gin is not available ({e.__class__.__name__}), indexing search vectors without user_id")
+            composite = False
+
+        for table_name in SEARCH_TABLES:
+            conn.execute(text(
+                f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce(search_text, ''))) STORED"
+            ))
+            columns = "user_id, search_vector" if composite else "search_vector"
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table_name}_search ON {table_name} USING gin ({columns})"
+            ))
+
+
+def _setup_sqlite(engine):
+    with engine.begin() as conn:
+        for table_name in SEARCH_TABLES:
+            fts = _fts_table(table_name)
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+            ).first()
+            if exists:
+                continue
+            print(f"Creating full-text index {fts}...")
+            # Bảng FTS5 kiểu external content: chỉ lưu index, nội dung đọc từ bảng gốc theo rowid = id
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5(search_text, content='{table_name}', "
+                f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+                f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF search_text ON {table_name} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+                f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END"
+            ))
+            # Index các bản ghi đã có
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def apply(query, model, search: str, dialect: str, user_id: int):
+    """
+    Lọc query (đã lọc theo user_id) theo từ khóa, trả về (query, danh sách biểu thức sắp xếp theo độ liên quan hoặc None).
+    Trả về mọi bản ghi khớp: SEARCH_MAX_CANDIDATES bản ghi khớp mới nhất (theo id) được xếp hạng và đứng trước,
+    các bản ghi khớp cũ hơn đứng sau theo thời gian, để từ phổ biến không buộc phải tính điểm cho hàng trăm nghìn bản ghi.
+    Từ khóa không có từ nào (chỉ dấu câu) thì không lọc.
+    """
+    words = terms(search)
+    if not words:
+        return query, None
+    base = model.__table__
+
+    if dialect == "postgresql":
+        ts_query = func.to_tsquery("simple", " & ".join(f"{word}:*" for word in words))
+        vector = literal_column(f"{model.__tablename__}.search_vector")
+        query = query.where(vector.op("@@")(ts_query))
+        if SEARCH_MAX_CANDIDATES <= 0:
+            return query, [func.ts_rank(vector, ts_query).desc()]
+        ranked = select(base.c.id)\
+            .where(base.c.user_id == user_id, vector.op("@@")(ts_query))\
+            .order_by(base.c.id.desc()).limit(SEARCH_MAX_CANDIDATES).subquery()
+        query = query.outerjoin(ranked, ranked.c.id == model.id)
+        # CASE để ts_rank chỉ được tính cho các bản ghi trong SEARCH_MAX_CANDIDATES
+        rank = case((ranked.c.id.is_not(None), func.ts_rank(vector, ts_query)))
+        return query, [ranked.c.id.is_(None), rank.desc()]
+
+    if dialect == "sqlite":
+        fts = table(_fts_table(model.__tablename__), column("rowid"), column("rank"))
+        match = literal_column(fts.name).op("MATCH")(" ".join(f'"{word}"*' for word in words))
+        if SEARCH_MAX_CANDIDATES <= 0:
+            ranked = select(fts.c.rowid.label("id"), fts.c.rank.label("rank")).where(match).subquery()
+            query = query.join(ranked, ranked.c.id == model.id)
+            # bm25 càng nhỏ càng liên quan
+            return query, [ranked.c.rank.asc()]
+        # Chỉ lấy rowid (không có cột rank) thì FTS5 không tính bm25 cho các bản ghi khớp cũ hơn
+        query = query.where(model.id.in_(select(fts.c.rowid).where(match)))
+        # FTS5 chỉ tính rank cho các dòng được trả về, nên giới hạn theo rowid trước khi sắp theo rank
+        ranked = select(fts.c.rowid.label("id"), fts.c.rank.label("rank"))\
+            .join(base, base.c.id == fts.c.rowid)\
+            .where(match, base.c.user_id == user_id)\
+            .order_by(fts.c.rowid.desc()).limit(SEARCH_MAX_CANDIDATES).subquery()
+        query = query.outerjoin(ranked, ranked.c.id == model.id)
+        return query, [ranked.c.id.is_(None), ranked.c.rank.asc()]
+
+    for word in words:
+        query = query.filter(model.search_text.ilike(f"%{word}%"))
+    return query, None
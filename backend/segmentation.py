@@ -0,0 +1,80 @@
+import re
+
+# Các từ viết tắt thường gặp, dấu chấm sau chúng không phải là kết thúc câu
+ABBREVIATIONS = {
+    "en": {
+        "mr.", "mrs.", "ms.", "dr.", "prof.", "sr.", "jr.", "st.", "mt.", "vs.", "etc.",
+        "e.g.", "i.e.", "inc.", "ltd.", "co.", "corp.", "no.", "fig.", "approx.", "dept.",
+        "est.", "jan.", "feb.", "mar.", "apr.", "jun.", "jul.", "aug.", "sep.", "sept.",
+        "oct.", "nov.", "dec.", "a.m.", "p.m.", "u.s.", "u.k.",
+    },
+    "vi": {
+        "tp.", "q.", "p.", "tx.", "ts.", "ths.", "pgs.", "gs.", "bs.", "ks.", "cn.",
+        "v.v.", "tr.", "st.", "ubnd.", "nxb.",
+    },
+}
+
+# Dấu kết thúc câu và các ký tự đóng có thể đứng sau nó
+SENTENCE_END_CHARS = ".!?…"
+CLOSING_CHARS = "\"'”’»)]"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_INITIAL_RE = re.compile(r"(?:\w\.)+", re.UNICODE)
+
+
+def _is_boundary(chunk: str, whitespace: str, next_char: str, abbreviations) -> bool:
+    """Kiểm tra khoảng trắng sau chunk có phải ranh giới giữa 2 câu không"""
+    # Xuống dòng luôn là ranh giới
+    if "\n" in whitespace:
+        return True
+
+    stripped = chunk.rstrip(CLOSING_CHARS)
+    if not stripped or stripped[-1] not in SENTENCE_END_CHARS:
+        return False
+
+    # Câu tiếp theo bắt đầu bằng chữ thường => chưa kết thúc câu
+    if next_char and next_char.islower():
+        return False
+
+    if stripped.endswith("."):
+        last_word = stripped.split()[-1].lower()
+        # Từ viết tắt (Dr., TP., v.v.) hoặc chữ cái viết tắt tên riêng (J., U.S.)
+        if last_word in abbreviations or _INITIAL_RE.fullmatch(last_word):
+            return False
+
+    return True
+
+
+def split_segments(text: str, lang: str = "en"):
+    """
+    Tách văn bản thành các câu, giữ nguyên khoảng trắng và dấu xuống dòng.
+    Trả về (leading_whitespace, [(sentence, whitespace_after), ...]) sao cho
+    leading_whitespace + "".join(sentence + whitespace_after) == text
+    """
+    abbreviations = ABBREVIATIONS.get(lang, set())
+    body = text.lstrip()
+    leading = text[:len(text) - len(body)]
+
+    segments = []
+    start = len(leading)
+    for match in _WHITESPACE_RE.finditer(text):
+        # Bỏ qua khoảng trắng đầu và cuối văn bản
+        if match.start() <= start or match.end() == len(text):
+            continue
+        chunk = text[start:match.start()]
+        next_char = text[match.end():match.end() + 1]
+        if _is_boundary(chunk, match.group(), next_char, abbreviations):
+            segments.append((chunk, match.group()))
+            start = match.end()
+
+    if start < len(text):
+        rest = text[start:]
+        sentence = rest.rstrip()
+        segments.append((sentence, rest[len(sentence):]))
+
+    return leading, segments
+
+
+def join_segments(leading: str, sentences, whitespaces) -> str:
+    """Ghép lại các câu (đã dịch) với khoảng trắng gốc"""
+    return leading + "".join(sentence + whitespace for sentence, whitespace in zip(sentences, whitespaces))
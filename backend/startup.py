@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import inference
+
+# "eager": load model khi khởi động server, "lazy": load ở request đầu tiên (tiện khi phát triển)
+MODEL_LOADING = os.getenv("MODEL_LOADING", "eager").lower()
+# Các chiều dịch được load khi khởi động, phân cách bằng dấu phẩy
+PRELOAD_DIRECTIONS = [d.strip() for d in os.getenv("PRELOAD_DIRECTIONS", "en2vi,vi2en").split(",") if d.strip()]
+# Chạy generate với câu mẫu sau khi load để request đầu tiên không phải chịu chi phí khởi tạo
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+
+class ModelLoader:
+    """
+    Load các chiều dịch song song trên thread nền khi server khởi động, sau đó warmup.
+    Server vẫn nhận request trong lúc load, /health/ready trả 503 cho tới khi tất cả đã sẵn sàng.
+    """
+
+    def __init__(self, directions=PRELOAD_DIRECTIONS, mode=MODEL_LOADING, warmup=WARMUP):
+        self.directions = list(directions) if mode == "eager" else []
+        self.mode = mode
+        self.warmup = warmup
+        self._state = {
+            direction: {"status": "pending", "load_seconds": None, "warmup_seconds": None, "error": None}
+            for direction in self.directions
+        }
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Bắt đầu load trên thread nền, không chặn việc khởi động server"""
+        if self._thread is not None or not self.directions:
+            return
+        self._thread = threading.Thread(target=self._load_all, name="model-loader", daemon=True)
+        self._thread.start()
+
+    def _update(self, direction, **fields):
+        with self._lock:
+            self._state[direction].update(fields)
+
+    def _load_all(self):
+        with ThreadPoolExecutor(max_workers=len(self.directions), thread_name_prefix="model-loader") as pool:
+            list(pool.map(self._load_one, self.directions))
+
+    def _load_one(self, direction):
+        try:
+            self._update(direction, status="loading")
+            start = time.perf_counter()
+            inference.load_model(direction)
+            self._update(direction, load_seconds=round(time.perf_counter() - start, 2))
+
+            if self.warmup:
+                self._update(direction, status="warming_up")
+                self._update(direction, warmup_seconds=round(inference.warmup_model(direction), 2))
+            self._update(direction, status="ready")
+            print(f"Model {direction} is ready.")
+        except Exception as e:
+            print(f"Failed to load model {direction}: {e}")
+            self._update(direction, status="failed", error=str(e))
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": all(state["status"] == "ready" for state in self._state.values()),
+                "mode": self.mode,
+                "directions": {direction: dict(state) for direction, state in self._state.items()},
+            }
+
+
+# Loader dùng chung cho toàn bộ server
+model_loader = ModelLoader()
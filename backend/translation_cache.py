@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from . import metrics
+
+# Cấu hình cache (có thể ghi đè bằng biến môi trường)
+CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("TRANSLATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Đường dẫn file SQLite dùng chung giữa các worker, để trống để tắt tầng lưu trữ bền vững
+CACHE_DB_PATH = os.getenv("TRANSLATION_CACHE_DB", "")
+
+ADAPTER_FILES = ("adapter_config.json", "adapter_model.safetensors", "adapter_model.bin")
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa văn bản trước khi tạo key: Unicode NFC, gộp khoảng trắng, bỏ khoảng trắng đầu/cuối"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_key(text: str, direction: str, params: dict, adapter_id: str) -> str:
+    """Tạo key cache từ văn bản đã chuẩn hóa, chiều dịch, tham số sinh và định danh adapter"""
+    payload = json.dumps(
+        [normalize_text(text), direction, params, adapter_id],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def adapter_fingerprint(adapter_path: str) -> str:
+    """
+    Định danh của LoRA adapter trên đĩa, dựa trên kích thước và thời gian sửa đổi các file trọng số.
+    Adapter thay đổi => fingerprint thay đổi => các entry cũ không còn được dùng.
+    """
+    parts = []
+    for name in ADAPTER_FILES:
+        path = os.path.join(adapter_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    if not parts:
+        return "base"
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class TranslationCache:
+    """
+    Cache bản dịch 2 tầng:
+    - Tầng bộ nhớ: LRU giới hạn theo số entry và số byte.
+    - Tầng SQLite (tùy chọn): dùng chung giữa các worker process, sống qua các lần khởi động lại.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, db_path=CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, direction, adapter_id)
+        self._bytes = 0
+        # Chỉ bảo vệ tầng bộ nhớ và bộ đếm, tầng SQLite được đọc/ghi ngoài lock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db_path = db_path or None
+        # Mỗi thread một connection SQLite (WAL: đọc không bị chặn bởi ghi của thread hay worker khác)
+        self._local = threading.local()
+        if self._db_path:
+            db = self._connection()
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS translation_cache ("
+                "key TEXT PRIMARY KEY, direction TEXT, adapter_id TEXT, value TEXT, created_at REAL)"
+            )
+            db.commit()
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self._db_path, timeout=5)
+        return db
+
+    @staticmethod
+    def _size(key, value):
+        return len(key) + len(value.encode("utf-8"))
+
+    def get(self, key):
+        """Trả về bản dịch đã cache hoặc None (có thể đọc SQLite, không gọi trực tiếp trên event loop)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.CACHE_LOOKUPS.inc(result="hit")
+                return entry[0]
+
+        row = None
+        if self._db_path:
+            row = self._connection().execute(
+                "SELECT value, direction, adapter_id FROM translation_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+        with self._lock:
+            if row is not None:
+                self._put_memory(key, row[0], row[1], row[2])
+                self.hits += 1
+                self.disk_hits += 1
+                metrics.CACHE_LOOKUPS.inc(result="disk_hit")
+                return row[0]
+            self.misses += 1
+            metrics.CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+    def set(self, key, value, direction, adapter_id):
+        """Lưu bản dịch vào cả 2 tầng cache"""
+        with self._lock:
+            self._put_memory(key, value, direction, adapter_id)
+        if self._db_path:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO translation_cache (key, direction, adapter_id, value, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, direction, adapter_id, value, time.time())
+            )
+            db.commit()
+
+    def _put_memory(self, key, value, direction, adapter_id):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= self._size(key, old[0])
+        self._entries[key] = (value, direction, adapter_id)
+        self._bytes += size
+        # Loại bỏ entry ít dùng nhất khi vượt giới hạn
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_key, old_entry[0])
+
+    def invalidate_adapter(self, direction, current_adapter_id):
+        """Xóa các entry của chiều dịch được tạo bởi adapter khác adapter hiện tại"""
+        with self._lock:
+            stale = [
+                key for key, (_, entry_direction, adapter_id) in self._entries.items()
+                if entry_direction == direction and adapter_id != current_adapter_id
+            ]
+            for key in stale:
+                value = self._entries.pop(key)[0]
+                self._bytes -= self._size(key, value)
+        if self._db_path:
+            db = self._connection()
+            db.execute(
+                "DELETE FROM translation_cache WHERE direction = ? AND adapter_id != ?",
+                (direction, current_adapter_id)
+            )
+            db.commit()
+
+    def stats(self):
+        """Thống kê hit/miss và dung lượng cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "persistent": self._db_path is not None,
+            }
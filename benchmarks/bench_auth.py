@@ -0,0 +1,154 @@
+"""
+Đo thông lượng của phần xác thực trên FastAPI app trong cùng process (httpx + ASGITransport), 2 cấu hình:
+- before: không cache người dùng (mỗi request truy vấn bảng users), băm mật khẩu ngay trên event loop.
+- after: auth.principal_cache và auth.hash_executor như khi chạy server.
+
+Kịch bản:
+- authenticated: GET một route chỉ có dependency get_current_user (JWT decode + tra người dùng).
+- login: POST /login (pbkdf2), đồng thời đo độ trễ của event loop: một task ngủ --probe-interval-ms
+  rồi ghi lại số ms bị đánh thức muộn (loop lag). Lag cao nghĩa là mọi request khác đều phải chờ.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_auth --json results/auth.json
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_auth --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from .bench_throughput import percentile
+from .common import save_json
+
+CONFIGS = ["before", "after"]
+
+
+def summarize(latencies, wall_seconds):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "latency_ms_p50": round(1000 * percentile(latencies, 0.50), 2),
+        "latency_ms_p95": round(1000 * percentile(latencies, 0.95), 2),
+        "requests_per_second": round(len(latencies) / wall_seconds, 1),
+    }
+
+
+async def run_requests(send, count: int, concurrency: int):
+    """Gọi send() count lần với tối đa concurrency request cùng lúc, trả về (độ trễ, thời gian tổng)"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send()
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(call() for _ in range(count)))
+    return latencies, time.perf_counter() - start
+
+
+async def measure_loop_lag(interval: float, stop: asyncio.Event, lags):
+    """Ngủ interval giây liên tục, ghi lại thời gian bị đánh thức muộn so với dự kiến"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+def configure(config: str, hash_executor):
+    from backend import auth
+
+    auth.principal_cache.clear()
+    if config == "before":
+        auth.principal_cache.ttl = 0
+        auth.hash_executor = None
+    else:
+        auth.principal_cache.ttl = auth.AUTH_CACHE_TTL_SECONDS
+        auth.hash_executor = hash_executor
+
+
+async def run(args):
+    import httpx
+    from fastapi import Depends
+    from backend import auth
+    from backend.main import app, get_current_user
+
+    @app.get("/_bench/auth")
+    async def bench_auth_route(current_user=Depends(get_current_user)):
+        return {"id": current_user.id}
+
+    hash_executor = auth.hash_executor
+    password = "bench-password"
+    results = {"hash_workers": auth.PASSWORD_HASH_WORKERS, "cache_ttl": auth.AUTH_CACHE_TTL_SECONDS, "scenarios": {}}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        username = f"bench-auth-{int(time.time() * 1000)}"
+        response = await client.post("/register", json={
+            "username": username, "password": password, "confirm_password": password
+        })
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        print(f"{'scenario':<30} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>9} {'lag p95':>10} {'lag max':>10}")
+        for config in CONFIGS:
+            configure(config, hash_executor)
+            for concurrency in args.concurrency:
+                name = f"{config}/authenticated/c{concurrency}"
+                latencies, wall = await run_requests(
+                    lambda: client.get("/_bench/auth", headers=headers), args.requests, concurrency
+                )
+                results["scenarios"][name] = summarize(latencies, wall)
+                print_row(name, results["scenarios"][name])
+
+            for concurrency in args.concurrency:
+                name = f"{config}/login/c{concurrency}"
+                stop, lags = asyncio.Event(), []
+                probe = asyncio.create_task(measure_loop_lag(args.probe_interval_ms / 1000, stop, lags))
+                latencies, wall = await run_requests(
+                    lambda: client.post("/login", json={"username": username, "password": password}),
+                    args.logins, concurrency
+                )
+                stop.set()
+                await probe
+                metrics = summarize(latencies, wall)
+                lags.sort()
+                metrics["loop_lag_ms_p95"] = round(1000 * percentile(lags, 0.95), 2)
+                metrics["loop_lag_ms_max"] = round(1000 * lags[-1], 2)
+                results["scenarios"][name] = metrics
+                print_row(name, metrics)
+    configure("after", hash_executor)
+    return results
+
+
+def print_row(name, metrics):
+    print(
+        f"{name:<30} {metrics['latency_ms_p50']:>9} {metrics['latency_ms_p95']:>9} "
+        f"{metrics['requests_per_second']:>9} {metrics.get('loop_lag_ms_p95', '-'):>10} {metrics.get('loop_lag_ms_max', '-'):>10}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark authentication throughput before/after caching and off-loop hashing")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 16])
+    parser.add_argument("--requests", type=int, default=2000, help="Authenticated requests per scenario")
+    parser.add_argument("--logins", type=int, default=64, help="Logins per scenario")
+    parser.add_argument("--probe-interval-ms", type=float, default=10)
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-auth-")
+    # SQLite tạm thời nếu không chỉ định database (phải đặt trước khi import backend.main)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("MODEL_LOADING", "lazy")
+
+    results = asyncio.run(run(args))
+    shutil.rmtree(workdir, ignore_errors=True)
+    save_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
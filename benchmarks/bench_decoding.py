@@ -0,0 +1,129 @@
+"""
+Ma trận tốc độ/chất lượng của các cấu hình giải mã (preset fast/balanced/quality và lưới tham số):
+- Độ trễ mỗi câu (trung bình, p95) và số token sinh ra mỗi giây.
+- BLEU và chrF so với bản dịch tham chiếu trên tập held-out en-vi (benchmarks/data/heldout_en_vi.jsonl).
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_decoding --direction en2vi
+    python -m benchmarks.bench_decoding --direction vi2en --grid --json results/decoding.json
+    python -m benchmarks.bench_decoding --data my_testset.jsonl --limit 200
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+
+import sacrebleu
+
+from backend import inference
+from .common import DIRECTION_LANGS, HELDOUT_PATH, load_inference_model, real_weights_available, save_json, timed_generate
+
+# Lưới tham số thêm vào các preset khi chạy với --grid
+GRID = {
+    "num_beams": [1, 2, 4],
+    "repetition_penalty": [1.0, 1.2],
+    "no_repeat_ngram_size": [0, 4],
+}
+
+
+def load_pairs(path: str, source_lang: str, target_lang: str, limit: int = None):
+    """Đọc file jsonl, mỗi dòng {"en": ..., "vi": ...}, trả về (câu nguồn, bản dịch tham chiếu)"""
+    sources, references = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                pair = json.loads(line)
+                sources.append(pair[source_lang])
+                references.append(pair[target_lang])
+    if limit:
+        sources, references = sources[:limit], references[:limit]
+    return sources, references
+
+
+def build_settings(grid: bool):
+    """Các cấu hình cần đo: mọi preset, cộng thêm lưới tham số (trên preset fast) nếu grid=True"""
+    settings = {name: inference.resolve_decoding({"preset": name}) for name in inference.DECODING_PRESETS}
+    if grid:
+        keys = list(GRID)
+        for values in itertools.product(*(GRID[key] for key in keys)):
+            options = dict(zip(keys, values))
+            name = ",".join(f"{key}={value}" for key, value in options.items())
+            settings[name] = inference.resolve_decoding(dict(options, preset="fast"))
+    return settings
+
+
+def evaluate(model, tokenizer, sources, references, source_lang, target_lang, decoding, batch_size):
+    """Dịch toàn bộ tập với một cấu hình, trả về các chỉ số tốc độ và chất lượng"""
+    # Chạy thử một lần để loại bỏ chi phí khởi tạo
+    timed_generate(
+        model, tokenizer, sources[:1], source_lang, target_lang,
+        **inference.generation_kwargs(decoding, len(tokenizer(sources[0]).input_ids))
+    )
+
+    hypotheses, latencies = [], []
+    total_time = 0.0
+    total_tokens = 0
+    for start in range(0, len(sources), batch_size):
+        batch = sources[start:start + batch_size]
+        input_length = max(len(tokenizer(text).input_ids) for text in batch)
+        ids, elapsed, new_tokens = timed_generate(
+            model, tokenizer, batch, source_lang, target_lang,
+            **inference.generation_kwargs(decoding, input_length)
+        )
+        hypotheses.extend(text.strip() for text in tokenizer.batch_decode(ids, skip_special_tokens=True))
+        latencies.append(elapsed / len(batch))
+        total_time += elapsed
+        total_tokens += new_tokens
+
+    latencies.sort()
+    return {
+        "latency_ms_mean": round(1000 * statistics.mean(latencies), 2),
+        "latency_ms_p95": round(1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 2),
+        "tokens_per_second": round(total_tokens / total_time, 1) if total_time else None,
+        "bleu": round(sacrebleu.corpus_bleu(hypotheses, [references]).score, 2),
+        "chrf": round(sacrebleu.corpus_chrf(hypotheses, [references]).score, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decoding settings: latency, tokens/s and BLEU")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], default="en2vi")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random mBART instead of the real weights")
+    parser.add_argument("--data", default=HELDOUT_PATH, help="JSONL file with {\"en\": ..., \"vi\": ...} per line")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N sentence pairs")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--grid", action="store_true", help="Also run the parameter grid on top of the presets")
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    tiny = args.tiny or not real_weights_available(args.direction)
+    if tiny and not args.tiny:
+        print(f"Real weights for {args.direction} not found, using a tiny random mBART (BLEU is meaningless).")
+
+    source_lang, target_lang = DIRECTION_LANGS[args.direction]
+    sources, references = load_pairs(args.data, source_lang, target_lang, args.limit)
+    model, tokenizer = load_inference_model(args.direction, tiny)
+
+    results = {
+        "direction": args.direction,
+        "tiny_model": tiny,
+        "data": os.path.relpath(args.data),
+        "sentences": len(sources),
+        "batch_size": args.batch_size,
+        "settings": {},
+    }
+    print(f"{'setting':<58} {'ms/sent':>8} {'p95':>8} {'tok/s':>8} {'BLEU':>6} {'chrF':>6}")
+    for name, decoding in build_settings(args.grid).items():
+        metrics = evaluate(model, tokenizer, sources, references, source_lang, target_lang, decoding, args.batch_size)
+        results["settings"][name] = dict(metrics, decoding=decoding)
+        print(
+            f"{name:<58} {metrics['latency_ms_mean']:>8} {metrics['latency_ms_p95']:>8} "
+            f"{metrics['tokens_per_second']:>8} {metrics['bleu']:>6} {metrics['chrf']:>6}"
+        )
+
+    save_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+So sánh model PEFT chưa merge và model đã merge LoRA:
+- Độ trễ trung bình cho mỗi token sinh ra.
+- Kiểm tra đầu ra của 2 model giống nhau trên bộ câu cố định.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_merge_lora --direction en2vi
+    python -m benchmarks.bench_merge_lora --tiny --json results/merge_lora.json
+"""
+import argparse
+import copy
+import sys
+
+import torch
+from peft import LoraConfig, PeftModel, TaskType, get_peft_model
+
+from backend import inference
+from .common import (
+    DIRECTION_LANGS, SAMPLE_SENTENCES, build_tiny_model, load_tokenizer,
+    real_weights_available, save_json, timed_generate
+)
+
+
+def load_unmerged_model(direction: str, tiny: bool):
+    """Model PEFT chưa merge: base model thật + adapter, hoặc mBART nhỏ + LoRA ngẫu nhiên"""
+    if tiny:
+        tokenizer = load_tokenizer(direction)
+        model = build_tiny_model(tokenizer)
+        lora_config = LoraConfig(
+            task_type=TaskType.SEQ_2_SEQ_LM,
+            r=32,
+            lora_alpha=64,
+            target_modules=["q_proj", "v_proj", "k_proj", "o_proj"],
+            init_lora_weights=False  # Khởi tạo ngẫu nhiên để LoRA thực sự thay đổi đầu ra
+        )
+        return get_peft_model(model, lora_config).eval(), tokenizer
+
+    base_model_name, adapter_path, _ = inference.get_model_paths(direction)
+    model, tokenizer = inference.load_base_model(base_model_name, torch.device("cpu"))
+    model = PeftModel.from_pretrained(model.float(), adapter_path)
+    return model.eval(), tokenizer
+
+
+def measure(model, tokenizer, sentences, source_lang, target_lang, runs, max_new_tokens):
+    """Dịch từng câu (batch size 1), trả về (danh sách token ids, ms/token)"""
+    # Chạy thử một lần để loại bỏ chi phí khởi tạo
+    timed_generate(model, tokenizer, sentences[:1], source_lang, target_lang, max_new_tokens=max_new_tokens, num_beams=1)
+
+    total_time = 0.0
+    total_tokens = 0
+    outputs = []
+    for run in range(runs):
+        for sentence in sentences:
+            ids, elapsed, new_tokens = timed_generate(
+                model, tokenizer, [sentence], source_lang, target_lang,
+                max_new_tokens=max_new_tokens, num_beams=1
+            )
+            total_time += elapsed
+            total_tokens += new_tokens
+            if run == 0:
+                outputs.append(ids[0].tolist())
+    return outputs, 1000 * total_time / max(total_tokens, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark merged vs unmerged LoRA inference")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], default="en2vi")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random mBART instead of the real weights")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    tiny = args.tiny or not real_weights_available(args.direction)
+    if tiny and not args.tiny:
+        print(f"Real weights for {args.direction} not found, using a tiny random mBART.")
+
+    source_lang, target_lang = DIRECTION_LANGS[args.direction]
+    sentences = SAMPLE_SENTENCES[source_lang]
+
+    unmerged, tokenizer = load_unmerged_model(args.direction, tiny)
+    merged = copy.deepcopy(unmerged).merge_and_unload().eval()
+
+    unmerged_outputs, unmerged_ms = measure(unmerged, tokenizer, sentences, source_lang, target_lang, args.runs, args.max_new_tokens)
+    merged_outputs, merged_ms = measure(merged, tokenizer, sentences, source_lang, target_lang, args.runs, args.max_new_tokens)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(unmerged_outputs, merged_outputs)) if a != b]
+
+    results = {
+        "direction": args.direction,
+        "tiny_model": tiny,
+        "sentences": len(sentences),
+        "runs": args.runs,
+        "unmerged_ms_per_token": round(unmerged_ms, 3),
+        "merged_ms_per_token": round(merged_ms, 3),
+        "speedup": round(unmerged_ms / merged_ms, 3) if merged_ms else None,
+        "outputs_match": not mismatches,
+        "mismatched_sentences": [sentences[i] for i in mismatches],
+    }
+
+    print(f"Unmerged: {results['unmerged_ms_per_token']} ms/token")
+    print(f"Merged:   {results['merged_ms_per_token']} ms/token (x{results['speedup']})")
+    print(f"Outputs match: {results['outputs_match']} ({len(sentences) - len(mismatches)}/{len(sentences)})")
+    save_json(args.json, results)
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
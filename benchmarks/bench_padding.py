@@ -0,0 +1,104 @@
+"""
+Đo tỉ lệ padding và thời gian generate của các cách chia batch trên một tập câu dài ngắn lẫn lộn:
+- fixed: chia theo thứ tự đến, mỗi batch --batch-size câu (micro-batch trước đây).
+- sorted: sắp theo độ dài rồi chia mỗi batch --batch-size câu (translate_many trước đây).
+- token_budget: length_bucketing.bucket_by_length theo số token, mỗi batch tối đa --batch-size câu
+  và --max-tokens token kể cả padding (như translate_batch nhận các nhóm từ micro-batcher/translate_many).
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_padding --direction en2vi --json results/padding.json
+    python -m benchmarks.bench_padding --tiny --sentences 256 --max-tokens 1024
+    python -m benchmarks.bench_padding --no-generate   # chỉ tính tỉ lệ padding
+"""
+import argparse
+import random
+
+from backend import inference
+from backend.length_bucketing import bucket_by_length, padding_stats
+from .common import DIRECTION_LANGS, load_corpora, load_inference_model, real_weights_available, save_json, timed_generate
+
+
+def build_batches(lengths, batch_size: int, max_tokens: int):
+    arrival = list(range(len(lengths)))
+    by_length = sorted(arrival, key=lambda i: lengths[i])
+    return {
+        "fixed": [arrival[i:i + batch_size] for i in range(0, len(arrival), batch_size)],
+        "sorted": [by_length[i:i + batch_size] for i in range(0, len(by_length), batch_size)],
+        "token_budget": bucket_by_length(lengths, max_tokens, batch_size),
+    }
+
+
+def time_batches(model, tokenizer, texts, batches, source_lang, target_lang):
+    """Generate từng batch, trả về (tổng số giây, tổng số token sinh ra)"""
+    decoding = inference.resolve_decoding()
+    total_time, total_tokens = 0.0, 0
+    for batch in batches:
+        batch_texts = [texts[i] for i in batch]
+        input_length = max(len(tokenizer(text).input_ids) for text in batch_texts)
+        _, elapsed, new_tokens = timed_generate(
+            model, tokenizer, batch_texts, source_lang, target_lang,
+            **inference.generation_kwargs(decoding, input_length)
+        )
+        total_time += elapsed
+        total_tokens += new_tokens
+    return total_time, total_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark padding ratio of fixed-size vs length-bucketed batches")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], default="en2vi")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random mBART instead of the real weights")
+    parser.add_argument("--sentences", type=int, default=128, help="Number of sentences (mixed corpus is cycled)")
+    parser.add_argument("--batch-size", type=int, default=inference.DOCUMENT_BATCH_SIZE)
+    parser.add_argument("--max-tokens", type=int, default=inference.BATCH_MAX_TOKENS)
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help="Cap on generated tokens (default: server setting, 64 with the tiny model)")
+    parser.add_argument("--no-generate", action="store_true", help="Only compute padding ratios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    tiny = args.tiny or not real_weights_available(args.direction)
+    if tiny and not args.tiny:
+        print(f"Real weights for {args.direction} not found, using a tiny random mBART.")
+    if args.max_new_tokens or tiny:
+        inference.MAX_NEW_TOKENS_LIMIT = args.max_new_tokens or 64
+
+    source_lang, target_lang = DIRECTION_LANGS[args.direction]
+    corpus = [text for texts in load_corpora(source_lang).values() for text in texts]
+    # Thứ tự đến ngẫu nhiên nhưng cố định theo seed
+    rng = random.Random(args.seed)
+    texts = [rng.choice(corpus) for _ in range(args.sentences)]
+
+    model, tokenizer = load_inference_model(args.direction, tiny)
+    tokenizer.src_lang = inference.LANG_CODE_MAP[source_lang]
+    lengths = [len(ids) for ids in tokenizer(texts, max_length=1024, truncation=True).input_ids]
+
+    results = {
+        "direction": args.direction,
+        "tiny_model": tiny,
+        "sentences": len(texts),
+        "batch_size": args.batch_size,
+        "max_tokens": args.max_tokens,
+        "strategies": {},
+    }
+    print(f"{'strategy':<14} {'batches':>8} {'real tok':>9} {'padded':>9} {'padding':>8} {'gen s':>8} {'tok/s':>8}")
+    for name, batches in build_batches(lengths, args.batch_size, args.max_tokens).items():
+        metrics = padding_stats(lengths, batches)
+        metrics["padding_ratio"] = round(metrics["padding_ratio"], 4)
+        if not args.no_generate:
+            seconds, new_tokens = time_batches(model, tokenizer, texts, batches, source_lang, target_lang)
+            metrics["generate_seconds"] = round(seconds, 3)
+            metrics["tokens_per_second"] = round(new_tokens / seconds, 1) if seconds else None
+        results["strategies"][name] = metrics
+        print(
+            f"{name:<14} {metrics['batches']:>8} {metrics['real_tokens']:>9} {metrics['padded_tokens']:>9} "
+            f"{metrics['padding_ratio']:>8.1%} {metrics.get('generate_seconds', '-'):>8} "
+            f"{metrics.get('tokens_per_second', '-'):>8}"
+        )
+
+    save_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Đo độ trễ tìm kiếm trong lịch sử dịch của một người dùng có nhiều bản ghi:
+- ilike: cách cũ, ILIKE '%từ khóa%' trên original_text/translated_text (quét bản ghi của người dùng tới khi đủ một trang).
+- index: GET /history?search=... hiện tại (FTS5 trên SQLite, tsvector + GIN trên PostgreSQL), trang đầu tiên.
+
+Bản ghi được sinh từ các từ trong tập held-out nên tần suất từ gần với văn bản thật.
+Từ khóa gồm một từ, hai từ và từ tiếng Việt không dấu.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_search --rows 100000 --json results/search.json
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_search --rows 1000000 --keep
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from .common import HELDOUT_PATH, save_json
+
+INSERT_BATCH_SIZE = 10000
+
+
+def load_vocabulary():
+    words = {"en": [], "vi": []}
+    with open(HELDOUT_PATH, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                pair = json.loads(line)
+                for lang in words:
+                    words[lang].extend(pair[lang].replace(",", " ").replace(".", " ").split())
+    return words
+
+
+def populate(db_models, engine, user_id: int, rows: int, words, rng):
+    """Chèn `rows` bản ghi lịch sử cho user_id theo từng batch"""
+    from backend import search
+
+    table = db_models.TranslationHistory.__table__
+    start = datetime(2024, 1, 1)
+    for offset in range(0, rows, INSERT_BATCH_SIZE):
+        batch = []
+        for i in range(offset, min(offset + INSERT_BATCH_SIZE, rows)):
+            original = " ".join(rng.choices(words["en"], k=rng.randint(4, 16)))
+            translated = " ".join(rng.choices(words["vi"], k=rng.randint(4, 16)))
+            batch.append({
+                "user_id": user_id,
+                "original_text": original,
+                "translated_text": translated,
+                "source_lang": "en",
+                "target_lang": "vi",
+                "created_at": start + timedelta(seconds=i),
+                "content_hash": db_models.make_content_hash(original, translated),
+                "search_text": search.make_search_text(original, translated),
+            })
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        print(f"\rInserted {offset + len(batch)}/{rows} rows", end="", flush=True)
+    print()
+
+
+def build_queries(words, count: int, rng):
+    from backend import search
+
+    queries = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            queries.append(rng.choice(words["en"]))
+        elif kind == 1:
+            queries.append(" ".join(rng.choices(words["vi"], k=2)))
+        else:
+            # Tiếng Việt gõ không dấu
+            queries.append(search.normalize(rng.choice(words["vi"])))
+    return queries
+
+
+def time_queries(run, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "queries": len(latencies),
+        "latency_ms_p50": round(1000 * statistics.median(latencies), 2),
+        "latency_ms_p95": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "latency_ms_max": round(1000 * latencies[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history search latency")
+    parser.add_argument("--rows", type=int, default=100000, help="History rows of the searched user")
+    parser.add_argument("--queries", type=int, default=60)
+    parser.add_argument("--limit", type=int, default=50, help="Page size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark user and its rows")
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-search-")
+    # SQLite tạm thời nếu không chỉ định database (phải đặt trước khi import backend.main)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    from fastapi import Response
+    from sqlalchemy import select
+    from backend import database, db_models
+    from backend.main import fetch_page
+
+    rng = random.Random(args.seed)
+    words = load_vocabulary()
+    db = database.SessionLocal()
+    user = db_models.User(username=f"bench-search-{int(time.time() * 1000)}", hashed_password="-")
+    db.add(user)
+    db.commit()
+
+    populate(db_models, database.engine, user.id, args.rows, words, rng)
+    queries = build_queries(words, args.queries, rng)
+    History = db_models.TranslationHistory
+
+    def run_ilike(term):
+        db.query(History).filter(History.user_id == user.id).filter(
+            History.original_text.ilike(f"%{term}%") | History.translated_text.ilike(f"%{term}%")
+        ).order_by(History.created_at.desc()).limit(args.limit + 1).all()
+
+    # fetch_page dùng AsyncSession, mọi truy vấn chạy trên cùng một event loop
+    loop = asyncio.new_event_loop()
+    async_db = database.AsyncSessionLocal()
+
+    def run_index(term):
+        loop.run_until_complete(fetch_page(
+            async_db, select(History).where(History.user_id == user.id), History, user.id, Response(), term, None, args.limit
+        ))
+
+    results = {
+        "dialect": database.engine.dialect.name,
+        "rows": args.rows,
+        "page_size": args.limit,
+        "strategies": {},
+    }
+    print(f"{'strategy':<10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, run in [("ilike", run_ilike), ("index", run_index)]:
+        run(queries[0])
+        metrics = time_queries(run, queries)
+        results["strategies"][name] = metrics
+        print(f"{name:<10} {metrics['latency_ms_p50']:>9} {metrics['latency_ms_p95']:>9} {metrics['latency_ms_max']:>9}")
+
+    loop.run_until_complete(async_db.close())
+    loop.run_until_complete(database.async_engine.dispose())
+    loop.close()
+    if not args.keep:
+        db.query(History).filter(History.user_id == user.id).delete()
+        db.delete(user)
+        db.commit()
+    db.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+    save_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Đo thời gian khởi động (cold start) của inference, mỗi lần đo chạy trong một process Python mới:
+- import_inference: import backend.inference (torch/transformers/peft được import lazy).
+- import_ml_stack: import torch + transformers + peft (chi phí trước đây phải trả ngay khi import).
+- tokenizer_sentencepiece / tokenizer_json: load tokenizer từ file sentencepiece hoặc từ tokenizer.json (fast).
+- load_adapter: base model + LoRA adapter + merge khi load, rồi dịch câu đầu tiên.
+- load_merged: checkpoint đã merge sẵn (safetensors, mmap) + tokenizer.json, rồi dịch câu đầu tiên.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_startup --direction en2vi --repeats 3
+    python -m benchmarks.bench_startup --tiny --json results/startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = [
+    "import_inference", "import_ml_stack",
+    "tokenizer_sentencepiece", "tokenizer_json",
+    "load_adapter", "load_merged",
+]
+
+
+def run_child(scenario: str, config: dict):
+    """Chạy một kịch bản trong process hiện tại (process con), in kết quả dạng JSON"""
+    result = {}
+    start = time.perf_counter()
+
+    if scenario == "import_ml_stack":
+        import torch  # noqa: F401
+        import transformers  # noqa: F401
+        import peft  # noqa: F401
+        result["import_s"] = time.perf_counter() - start
+    elif scenario.startswith("tokenizer_"):
+        from transformers import AutoTokenizer
+        result["import_s"] = time.perf_counter() - start
+        path = config["sentencepiece_dir"] if scenario == "tokenizer_sentencepiece" else config["merged_dir"]
+        load_start = time.perf_counter()
+        AutoTokenizer.from_pretrained(path, use_fast=True, local_files_only=True)
+        result["load_s"] = time.perf_counter() - load_start
+    else:
+        from backend import inference
+        result["import_s"] = time.perf_counter() - start
+        if scenario != "import_inference":
+            direction = config["direction"]
+            if direction == "en2vi":
+                inference.EN2VI_BASE, inference.EN2VI_LORA_PATH = config["base"], config["adapter"]
+            else:
+                inference.VI2EN_BASE, inference.VI2EN_LORA_PATH = config["base"], config["adapter"]
+            # Thư mục merged rỗng => load_model phải merge adapter lúc load
+            inference.MERGED_MODEL_DIR = config["merged_root"] if scenario == "load_merged" else config["empty_dir"]
+            inference.MAX_NEW_TOKENS_LIMIT = config["max_new_tokens"]
+
+            load_start = time.perf_counter()
+            inference.load_model(direction)
+            result["load_s"] = time.perf_counter() - load_start
+
+            source_lang = "en" if direction == "en2vi" else "vi"
+            target_lang = "vi" if direction == "en2vi" else "en"
+            first_start = time.perf_counter()
+            _, error = inference.perform_translation(config["sentence"], source_lang, target_lang)
+            result["first_translation_s"] = time.perf_counter() - first_start
+            result["error"] = error
+
+    result["total_s"] = time.perf_counter() - start
+    print(json.dumps(result))
+
+
+def prepare_artifacts(direction: str, tiny: bool, workdir: str):
+    """
+    Chuẩn bị base model, adapter và checkpoint đã merge.
+    Với --tiny: tạo mBART nhỏ + LoRA ngẫu nhiên trong workdir. Với model thật: dùng checkpoint
+    merge sẵn trong backend/merged nếu có, nếu không thì export vào workdir.
+    """
+    from backend import inference
+    from backend.export_merged import export_merged_model
+    from .common import build_tiny_model, load_tokenizer
+
+    base_model_name, adapter_path, merged_path = inference.get_model_paths(direction)
+    merged_root = inference.MERGED_MODEL_DIR
+    # Thư mục adapter trong repo chỉ có sentencepiece.bpe.model, tokenizer fast phải được convert khi load
+    sentencepiece_dir = adapter_path
+
+    if tiny:
+        from peft import LoraConfig, TaskType, get_peft_model
+
+        tokenizer = load_tokenizer(direction)
+        base_model_name = os.path.join(workdir, "base")
+        build_tiny_model(tokenizer).save_pretrained(base_model_name)
+        tokenizer.save_pretrained(base_model_name)
+
+        adapter_path = os.path.join(workdir, "adapter")
+        lora_config = LoraConfig(
+            task_type=TaskType.SEQ_2_SEQ_LM, r=32, lora_alpha=64,
+            target_modules=["q_proj", "v_proj", "k_proj", "o_proj"], init_lora_weights=False
+        )
+        get_peft_model(build_tiny_model(tokenizer), lora_config).save_pretrained(adapter_path)
+
+    if tiny or not os.path.exists(os.path.join(merged_path, inference.MERGE_INFO_FILE)):
+        if direction == "en2vi":
+            inference.EN2VI_BASE, inference.EN2VI_LORA_PATH = base_model_name, adapter_path
+        else:
+            inference.VI2EN_BASE, inference.VI2EN_LORA_PATH = base_model_name, adapter_path
+        merged_root = os.path.join(workdir, "merged")
+        export_merged_model(direction, os.path.join(merged_root, f"vinai-{direction}"))
+
+    return {
+        "base": base_model_name,
+        "adapter": adapter_path,
+        "merged_root": merged_root,
+        "merged_dir": os.path.join(merged_root, f"vinai-{direction}"),
+        "sentencepiece_dir": sentencepiece_dir,
+        "empty_dir": os.path.join(workdir, "empty"),
+    }
+
+
+def run_scenario(scenario: str, config: dict):
+    """Chạy kịch bản trong process mới, trả về kết quả kèm thời gian của cả process"""
+    env = dict(os.environ, TRANSLATION_CACHE_DB="", HF_HUB_OFFLINE="1")
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", scenario, "--config", json.dumps(config)],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start time of the inference stack")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], default="en2vi")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random mBART instead of the real weights")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, json.loads(args.config))
+        return
+
+    from .common import DIRECTION_LANGS, SAMPLE_SENTENCES, real_weights_available, save_json
+
+    tiny = args.tiny or not real_weights_available(args.direction)
+    if tiny and not args.tiny:
+        print(f"Real weights for {args.direction} not found, using a tiny random mBART.")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = prepare_artifacts(args.direction, tiny, workdir)
+        os.makedirs(config["empty_dir"], exist_ok=True)
+        config.update(
+            direction=args.direction,
+            max_new_tokens=args.max_new_tokens,
+            sentence=SAMPLE_SENTENCES[DIRECTION_LANGS[args.direction][0]][1],
+        )
+
+        results = {"direction": args.direction, "tiny_model": tiny, "repeats": args.repeats, "scenarios": {}}
+        for scenario in SCENARIOS:
+            runs = [run_scenario(scenario, config) for _ in range(args.repeats)]
+            # Trung vị của các lần chạy cho mỗi chỉ số
+            summary = {
+                key: round(statistics.median(run[key] for run in runs), 3)
+                for key in runs[0] if isinstance(runs[0][key], float)
+            }
+            results["scenarios"][scenario] = summary
+            print(f"{scenario:<24} " + "  ".join(f"{key}={value:.3f}" for key, value in summary.items()))
+
+    save_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Đo độ trễ và thông lượng khi dịch với nhiều request đồng thời, trên 2 đích:
+- inference: gọi trực tiếp inference.perform_translation từ một thread pool.
+- api: gọi POST /translate của FastAPI app trong cùng process (httpx + ASGITransport, không cần mở cổng),
+  đi qua micro-batcher, hàng đợi inference và (với --auth) JWT + ghi lịch sử.
+
+Mỗi kịch bản (đích x bộ câu short/medium/long x mức đồng thời) báo cáo p50/p95/p99 độ trễ, requests/s,
+tokens/s (token đầu ra) và peak RSS của process. Cache bản dịch bị tắt để mọi request đều chạy model.
+Kết quả lưu dạng JSON, --baseline so sánh với một lần chạy trước để phát hiện regression.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.bench_throughput --tiny --json results/throughput.json
+    python -m benchmarks.bench_throughput --targets api --concurrency 1 8 32 --auth
+    python -m benchmarks.bench_throughput --tiny --baseline results/throughput.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import inference
+from backend.translation_cache import TranslationCache
+from .common import DIRECTION_LANGS, build_tiny_model, load_corpora, load_tokenizer, real_weights_available, save_json
+
+TARGETS = ["inference", "api"]
+
+
+def peak_rss_mb():
+    """Peak RSS của process (MB), None nếu hệ điều hành không hỗ trợ module resource"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values, q):
+    """Percentile theo nội suy tuyến tính trên danh sách đã sắp xếp"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class GeneratedTokenCounter:
+    """
+    Bọc model.generate để đếm số token sinh ra (không tính token mở đầu và padding).
+    Đếm trên token id nên đúng cả với model ngẫu nhiên (bản dịch có thể rỗng sau khi bỏ token đặc biệt)
+    và với micro-batch của API (nhiều request trong một lần generate).
+    """
+
+    def __init__(self, model, pad_token_id):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._generate = model.generate
+        self._pad_token_id = pad_token_id
+        model.generate = self.generate
+
+    def generate(self, *args, **kwargs):
+        outputs = self._generate(*args, **kwargs)
+        new_tokens = int((outputs[:, 1:] != self._pad_token_id).sum())
+        with self._lock:
+            self.count += new_tokens
+        return outputs
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+def summarize(latencies, errors, wall_seconds, output_tokens):
+    """Tổng hợp chỉ số của một kịch bản"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "latency_ms_p50": round(1000 * percentile(latencies, 0.50), 2),
+        "latency_ms_p95": round(1000 * percentile(latencies, 0.95), 2),
+        "latency_ms_p99": round(1000 * percentile(latencies, 0.99), 2),
+        "latency_ms_mean": round(1000 * statistics.mean(latencies), 2),
+        "requests_per_second": round(len(latencies) / wall_seconds, 2),
+        "tokens_per_second": round(output_tokens / wall_seconds, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_inference(texts, source_lang, target_lang, concurrency):
+    """Gọi perform_translation với `concurrency` thread, trả về (độ trễ, số lỗi, thời gian tổng)"""
+    def call(text):
+        start = time.perf_counter()
+        _, error = inference.perform_translation(text, source_lang, target_lang)
+        return time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, texts))
+    wall_seconds = time.perf_counter() - start
+
+    return [latency for latency, _ in results], sum(1 for _, error in results if error), wall_seconds
+
+
+async def run_api(client, headers, texts, source_lang, target_lang, concurrency):
+    """Gửi POST /translate với tối đa `concurrency` request đang chờ cùng lúc"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(text):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/translate",
+                json={"text": text, "source_lang": source_lang, "target_lang": target_lang},
+                headers=headers,
+            )
+            latency = time.perf_counter() - start
+        return latency, response.status_code != 200
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call(text) for text in texts))
+    wall_seconds = time.perf_counter() - start
+
+    return [latency for latency, _ in results], sum(1 for _, failed in results if failed), wall_seconds
+
+
+async def run_api_scenarios(scenarios, source_lang, target_lang, auth, counter):
+    """Chạy các kịch bản trên FastAPI app trong process (không chạy lifespan, model đã được load sẵn)"""
+    import httpx
+    from backend.main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        headers = {}
+        if auth:
+            response = await client.post("/register", json={
+                "username": f"bench-{int(time.time() * 1000)}", "password": "bench-pw", "confirm_password": "bench-pw"
+            })
+            response.raise_for_status()
+            headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        for name, texts, concurrency in scenarios:
+            # Request đầu tiên của mỗi kịch bản không tính (khởi tạo batcher, executor)
+            await run_api(client, headers, texts[:1], source_lang, target_lang, 1)
+            counter.reset()
+            latencies, errors, wall_seconds = await run_api(client, headers, texts, source_lang, target_lang, concurrency)
+            results[name] = summarize(latencies, errors, wall_seconds, counter.count)
+            print_row(name, results[name])
+    return results
+
+
+def print_row(name, metrics):
+    print(
+        f"{name:<28} {metrics['latency_ms_p50']:>9} {metrics['latency_ms_p95']:>9} {metrics['latency_ms_p99']:>9} "
+        f"{metrics['requests_per_second']:>8} {metrics['tokens_per_second']:>8} {metrics['peak_rss_mb']:>8} "
+        f"{metrics['errors']:>6}"
+    )
+
+
+def compare_with_baseline(results, baseline_path):
+    """In phần trăm thay đổi p95 và requests/s so với kết quả lưu trước đó"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["scenarios"]
+    print(f"\nCompared with {baseline_path} (negative p95 / positive req/s is better):")
+    for name, metrics in results["scenarios"].items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        p95_change = 100 * (metrics["latency_ms_p95"] - old["latency_ms_p95"]) / old["latency_ms_p95"]
+        rps_change = 100 * (metrics["requests_per_second"] - old["requests_per_second"]) / old["requests_per_second"]
+        print(f"{name:<28} p95 {p95_change:+7.1f}%   req/s {rps_change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark translation latency and throughput under concurrency")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], default="en2vi")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random mBART instead of the real weights")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--corpora", nargs="+", choices=["short", "medium", "long"], default=["short", "medium", "long"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario (the corpus is cycled)")
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help="Cap on generated tokens (default: server setting, 64 with the tiny model)")
+    parser.add_argument("--auth", action="store_true", help="Send API requests as a logged-in user (JWT + history write)")
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    tiny = args.tiny or not real_weights_available(args.direction)
+    if tiny and not args.tiny:
+        print(f"Real weights for {args.direction} not found, using a tiny random mBART.")
+
+    workdir = tempfile.mkdtemp(prefix="bench-throughput-")
+    # App dùng SQLite tạm thời nếu không chỉ định database (phải đặt trước khi import backend.main)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    # Tắt cache để mọi request đều chạy model
+    inference.translation_cache = TranslationCache(max_entries=0, db_path="")
+    if args.max_new_tokens or tiny:
+        inference.MAX_NEW_TOKENS_LIMIT = args.max_new_tokens or 64
+
+    source_lang, target_lang = DIRECTION_LANGS[args.direction]
+    if tiny:
+        tokenizer = load_tokenizer(args.direction)
+        inference.models[args.direction] = build_tiny_model(tokenizer)
+        inference.tokenizers[args.direction] = tokenizer
+    model, tokenizer = inference.load_model(args.direction)
+    inference.warmup_model(args.direction)
+    counter = GeneratedTokenCounter(model, tokenizer.pad_token_id)
+
+    corpora = load_corpora(source_lang)
+    scenarios = {target: [] for target in args.targets}
+    for target in args.targets:
+        for corpus in args.corpora:
+            texts = [corpora[corpus][i % len(corpora[corpus])] for i in range(args.requests)]
+            for concurrency in args.concurrency:
+                scenarios[target].append((f"{target}/{corpus}/c{concurrency}", texts, concurrency))
+
+    results = {
+        "direction": args.direction,
+        "tiny_model": tiny,
+        "requests_per_scenario": args.requests,
+        "max_new_tokens_limit": inference.MAX_NEW_TOKENS_LIMIT,
+        "decoding": inference.resolve_decoding(),
+        "engine": inference.INFERENCE_ENGINE,
+        "quantization": inference.QUANTIZATION,
+        "scenarios": {},
+    }
+    print(f"{'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'tok/s':>8} {'rss MB':>8} {'errors':>6}")
+    for name, texts, concurrency in scenarios.get("inference", []):
+        counter.reset()
+        latencies, errors, wall_seconds = run_inference(texts, source_lang, target_lang, concurrency)
+        results["scenarios"][name] = summarize(latencies, errors, wall_seconds, counter.count)
+        print_row(name, results["scenarios"][name])
+    if "api" in scenarios:
+        results["scenarios"].update(asyncio.run(
+            run_api_scenarios(scenarios["api"], source_lang, target_lang, args.auth, counter)
+        ))
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    save_json(args.json, results)
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
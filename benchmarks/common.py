@@ -0,0 +1,148 @@
+import io
+import json
+import os
+import time
+
+import torch
+from transformers import AutoTokenizer, MBartConfig, MBartForConditionalGeneration
+
+from backend import inference
+
+# Bộ câu cố định dùng cho các benchmark
+SAMPLE_SENTENCES = {
+    "en": [
+        "Hello, how are you today?",
+        "The weather is nice, so we decided to go for a walk in the park.",
+        "Please send me the report before Friday afternoon.",
+        "Machine translation has improved dramatically over the past decade.",
+        "I would like to book a table for two people at seven o'clock.",
+        "The company announced that its revenue grew by twenty percent last year.",
+        "Can you tell me where the nearest train station is?",
+        "Reading books every day helps children develop their vocabulary and imagination.",
+    ],
+    "vi": [
+        "Xin chào, hôm nay bạn thế nào?",
+        "Thời tiết đẹp nên chúng tôi quyết định đi dạo trong công viên.",
+        "Vui lòng gửi cho tôi báo cáo trước chiều thứ Sáu.",
+        "Dịch máy đã tiến bộ vượt bậc trong thập kỷ qua.",
+        "Tôi muốn đặt một bàn cho hai người lúc bảy giờ.",
+        "Công ty thông báo doanh thu năm ngoái tăng hai mươi phần trăm.",
+        "Bạn có thể chỉ cho tôi ga tàu gần nhất ở đâu không?",
+        "Đọc sách mỗi ngày giúp trẻ phát triển vốn từ vựng và trí tưởng tượng.",
+    ],
+}
+
+DIRECTION_LANGS = {
+    "en2vi": ("en", "vi"),
+    "vi2en": ("vi", "en"),
+}
+
+# Tập câu song ngữ held-out, mỗi dòng {"en": ..., "vi": ...}
+HELDOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "heldout_en_vi.jsonl")
+# Số câu ghép thành một đoạn văn trong bộ "long"
+LONG_PARAGRAPH_SENTENCES = 6
+
+
+def load_corpora(source_lang: str):
+    """
+    Các bộ câu cố định:
+    - short: câu ngắn trong SAMPLE_SENTENCES.
+    - medium: câu trong tập held-out.
+    - long: đoạn văn ghép từ các câu held-out liên tiếp.
+    """
+    with open(HELDOUT_PATH, encoding="utf-8") as f:
+        heldout = [json.loads(line)[source_lang] for line in f if line.strip()]
+    long_texts = [
+        " ".join(heldout[start:start + LONG_PARAGRAPH_SENTENCES])
+        for start in range(0, len(heldout) - LONG_PARAGRAPH_SENTENCES + 1, LONG_PARAGRAPH_SENTENCES)
+    ]
+    return {
+        "short": SAMPLE_SENTENCES[source_lang],
+        "medium": heldout,
+        "long": long_texts,
+    }
+
+
+def real_weights_available(direction: str) -> bool:
+    """Kiểm tra base model thật đã có trong cache Hugging Face hoặc đã merge sẵn chưa"""
+    base_model_name, _, merged_path = inference.get_model_paths(direction)
+    if os.path.exists(os.path.join(merged_path, inference.MERGE_INFO_FILE)):
+        return True
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        return isinstance(try_to_load_from_cache(base_model_name, "config.json"), str)
+    except Exception:
+        return False
+
+
+def load_tokenizer(direction: str):
+    """Tokenizer lưu kèm LoRA adapter, dùng được khi không có mạng"""
+    _, adapter_path, _ = inference.get_model_paths(direction)
+    return AutoTokenizer.from_pretrained(adapter_path)
+
+
+def build_tiny_model(tokenizer, seed: int = 0):
+    """mBART rất nhỏ khởi tạo ngẫu nhiên, dùng thay model thật khi chạy benchmark offline"""
+    torch.manual_seed(seed)
+    config = MBartConfig(
+        vocab_size=len(tokenizer),
+        d_model=64,
+        encoder_layers=2,
+        decoder_layers=2,
+        encoder_attention_heads=4,
+        decoder_attention_heads=4,
+        encoder_ffn_dim=128,
+        decoder_ffn_dim=128,
+        max_position_embeddings=1024,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    return MBartForConditionalGeneration(config).eval()
+
+
+def load_inference_model(direction: str, tiny: bool):
+    """
+    Model float32 dùng làm chuẩn: mBART nhỏ ngẫu nhiên, hoặc model thật đã merge LoRA
+    (load qua inference.load_model, không lượng tử hóa).
+    """
+    if tiny:
+        tokenizer = load_tokenizer(direction)
+        return build_tiny_model(tokenizer), tokenizer
+
+    inference.QUANTIZATION = "none"
+    inference.MERGE_LORA = True
+    return inference.load_model(direction)
+
+
+def model_size_mb(model) -> float:
+    """Dung lượng state_dict của model (MB), tính cả trọng số đã lượng tử hóa"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def timed_generate(model, tokenizer, texts, source_lang, target_lang, **generate_kwargs):
+    """Chạy generate cho một batch, trả về (token ids đầu ra, số giây, số token mới sinh)"""
+    tokenizer.src_lang = inference.LANG_CODE_MAP[source_lang]
+    inputs = tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True, max_length=1024)
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids=inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            decoder_start_token_id=tokenizer.lang_code_to_id[inference.LANG_CODE_MAP[target_lang]],
+            **generate_kwargs
+        )
+    elapsed = time.perf_counter() - start
+    new_tokens = int((outputs[:, 1:] != tokenizer.pad_token_id).sum())
+    return outputs, elapsed, new_tokens
+
+
+def save_json(path: str, data: dict):
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {path}")
@@ -0,0 +1,109 @@
+"""
+Quality gate cho chế độ lượng tử hóa dynamic int8:
+dịch bộ câu cố định bằng model float32 và model int8, dùng bản dịch float32 làm tham chiếu
+để tính BLEU/chrF của bản int8, kèm theo tốc độ và dung lượng model.
+
+Cách dùng (chạy từ thư mục gốc của project):
+    python -m benchmarks.quality_gate_quantization --direction en2vi --min-bleu 80 --min-chrf 90
+"""
+import argparse
+import copy
+import sys
+
+import sacrebleu
+import torch
+
+from backend import inference
+from .common import (
+    DIRECTION_LANGS, SAMPLE_SENTENCES, load_inference_model, model_size_mb,
+    real_weights_available, save_json, timed_generate
+)
+
+
+def translate_all(model, tokenizer, sentences, source_lang, target_lang, max_new_tokens):
+    """Dịch từng câu, trả về (danh sách bản dịch, tổng số giây, tổng số token sinh ra)"""
+    translations = []
+    total_time = 0.0
+    total_tokens = 0
+    for sentence in sentences:
+        ids, elapsed, new_tokens = timed_generate(
+            model, tokenizer, [sentence], source_lang, target_lang,
+            max_new_tokens=max_new_tokens, num_beams=1
+        )
+        translations.append(tokenizer.decode(ids[0], skip_special_tokens=True).strip())
+        total_time += elapsed
+        total_tokens += new_tokens
+    return translations, total_time, total_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dynamic int8 quantized output against fp32")
+    parser.add_argument("--direction", choices=["en2vi", "vi2en"], default="en2vi")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random mBART instead of the real weights")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--min-bleu", type=float, default=80.0, help="Minimum BLEU of int8 output vs fp32 output")
+    parser.add_argument("--min-chrf", type=float, default=90.0, help="Minimum chrF of int8 output vs fp32 output")
+    parser.add_argument("--json", default=None, help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    tiny = args.tiny or not real_weights_available(args.direction)
+    if tiny and not args.tiny:
+        print(f"Real weights for {args.direction} not found, using a tiny random mBART.")
+
+    source_lang, target_lang = DIRECTION_LANGS[args.direction]
+    sentences = SAMPLE_SENTENCES[source_lang]
+
+    fp32_model, tokenizer = load_inference_model(args.direction, tiny)
+    fp32_model = fp32_model.float().to("cpu").eval()
+    int8_model = inference.quantize_model(copy.deepcopy(fp32_model), "int8").eval()
+
+    # Chạy thử một lần để loại bỏ chi phí khởi tạo
+    for model in (fp32_model, int8_model):
+        timed_generate(model, tokenizer, sentences[:1], source_lang, target_lang, max_new_tokens=8)
+
+    fp32_out, fp32_time, fp32_tokens = translate_all(fp32_model, tokenizer, sentences, source_lang, target_lang, args.max_new_tokens)
+    int8_out, int8_time, int8_tokens = translate_all(int8_model, tokenizer, sentences, source_lang, target_lang, args.max_new_tokens)
+
+    if int8_out == fp32_out:
+        # Đầu ra giống hệt nhau (sacrebleu trả về 0 khi tham chiếu rỗng)
+        bleu = chrf = 100.0
+    else:
+        bleu = sacrebleu.corpus_bleu(int8_out, [fp32_out]).score
+        chrf = sacrebleu.corpus_chrf(int8_out, [fp32_out]).score
+    passed = bleu >= args.min_bleu and chrf >= args.min_chrf
+
+    results = {
+        "direction": args.direction,
+        "tiny_model": tiny,
+        "threads": torch.get_num_threads(),
+        "sentences": len(sentences),
+        "bleu_vs_fp32": round(bleu, 2),
+        "chrf_vs_fp32": round(chrf, 2),
+        "bleu_drift": round(100 - bleu, 2),
+        "chrf_drift": round(100 - chrf, 2),
+        "exact_match": sum(a == b for a, b in zip(fp32_out, int8_out)),
+        "fp32_ms_per_token": round(1000 * fp32_time / max(fp32_tokens, 1), 3),
+        "int8_ms_per_token": round(1000 * int8_time / max(int8_tokens, 1), 3),
+        "fp32_size_mb": round(model_size_mb(fp32_model), 1),
+        "int8_size_mb": round(model_size_mb(int8_model), 1),
+        "passed": passed,
+        "samples": [
+            {"source": s, "fp32": a, "int8": b}
+            for s, a, b in zip(sentences, fp32_out, int8_out) if a != b
+        ],
+    }
+
+    print(f"BLEU vs fp32: {results['bleu_vs_fp32']} (drift {results['bleu_drift']})")
+    print(f"chrF vs fp32: {results['chrf_vs_fp32']} (drift {results['chrf_drift']})")
+    print(f"Exact matches: {results['exact_match']}/{len(sentences)}")
+    print(f"Latency: fp32 {results['fp32_ms_per_token']} ms/token, int8 {results['int8_ms_per_token']} ms/token")
+    print(f"Model size: fp32 {results['fp32_size_mb']} MB, int8 {results['int8_size_mb']} MB")
+    print("PASSED" if passed else "FAILED")
+    save_json(args.json, results)
+
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -168,6 +168,33 @@ document.addEventListener('DOMContentLoaded', () => {
         document.getElementById(`${tab}Form`).style.display = 'block';
     };
 
+    // Đọc response dạng Server-Sent Events, gọi onEvent(event, data) cho từng sự kiện
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+
     // --- LOGIC DỊCH ---
     if (translateBtn) {
         translateBtn.addEventListener('click', async () => {
@@ -185,7 +212,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 const headers = { 'Content-Type': 'application/json' };
                 if (token) headers['Authorization'] = `Bearer ${token}`;
 
-                const response = await fetch(`${API_BASE_URL}/translate`, {
+                // Nhận bản dịch từng phần để hiển thị ngay khi có kết quả
+                const response = await fetch(`${API_BASE_URL}/translate/stream`, {
                     method: 'POST',
                     headers: headers,
                     body: JSON.stringify({ text, source_lang: sourceLang.value, target_lang: targetLang.value })
@@ -193,11 +221,19 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 if (!response.ok) {
                     const err = await response.json();
-                    outputText.value = "Error: " + (err.detail || "Unknown error");
+                    outputText.value = "Error: " + formatError(err.detail || "Unknown error");
                 } else {
-                    const data = await response.json();
-                    outputText.value = data.translated;
-                    if (headers['Authorization']) loadHistory();
+                    outputText.value = '';
+                    await readEventStream(response, (event, data) => {
+                        if (event === 'delta') {
+                            outputText.value += data.text;
+                        } else if (event === 'done') {
+                            outputText.value = data.translated;
+                            if (headers['Authorization']) loadHistory();
+                        } else if (event === 'error') {
+                            outputText.value = "Error: " + (data.detail || "Unknown error");
+                        }
+                    });
                 }
             } catch (e) {
                 outputText.value = "Network Error: " + e.message;
@@ -446,6 +482,19 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // --- DANH SÁCH PHÂN TRANG ---
+    const fullHistoryPager = fullHistoryList && createPagedList(
+        fullHistoryList, '/history',
+        item => renderCard(item, item.is_saved, `deleteHistoryItem(${item.id})`),
+        '<div style="text-align:center; padding:1rem; color: var(--text-muted)">No history records.</div>'
+    );
+
+    const savedPager = savedList && createPagedList(
+        savedList, '/saved-translations',
+        item => renderCard(item, true, `deleteSavedItem(${item.id})`),
+        '<div style="text-align:center; padding:1rem; color: var(--text-muted)">No saved translations.</div>'
+    );
+
     // --- LOGIC BẢN DỊCH ĐÃ LƯU ---
     if (savedList) {
         loadSavedTranslations();
@@ -502,6 +551,74 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Danh sách phân trang: API trả cursor của trang sau trong header X-Next-Cursor,
+    // khi cuộn tới phần tử cuối (sentinel) thì tải thêm trang
+    function createPagedList(container, path, renderItem, emptyHtml) {
+        const sentinel = document.createElement('div');
+        let nextCursor = null;
+        let search = '';
+        let loading = false;
+        let generation = 0;
+
+        const observer = new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting) loadPage(false);
+        }, { rootMargin: '300px' });
+
+        async function loadPage(reset) {
+            if (!reset && (loading || !nextCursor)) return;
+            // Bỏ kết quả của request cũ nếu người dùng đã tìm kiếm lại
+            const current = reset ? ++generation : generation;
+            loading = true;
+            try {
+                const params = new URLSearchParams();
+                if (search) params.set('search', search);
+                if (!reset) params.set('cursor', nextCursor);
+                const response = await fetch(`${API_BASE_URL}${path}?${params}`, { headers: { 'Authorization': `Bearer ${token}` } });
+                if (current !== generation) return;
+
+                if (response.status === 401) {
+                    forceLogout();
+                    return;
+                }
+                if (!response.ok) throw new Error(response.statusText);
+
+                const items = await response.json();
+                nextCursor = response.headers.get('X-Next-Cursor');
+                if (reset) {
+                    container.innerHTML = '';
+                    if (items.length === 0) container.innerHTML = emptyHtml;
+                }
+                items.forEach(item => container.appendChild(renderItem(item)));
+
+                // Sentinel luôn nằm cuối danh sách, chỉ theo dõi khi còn trang sau
+                observer.unobserve(sentinel);
+                if (nextCursor) {
+                    container.appendChild(sentinel);
+                    observer.observe(sentinel);
+                } else {
+                    sentinel.remove();
+                }
+            } finally {
+                if (current === generation) loading = false;
+            }
+        }
+
+        return {
+            reload(searchTerm = '') {
+                search = searchTerm;
+                nextCursor = null;
+                return loadPage(true);
+            }
+        };
+    }
+
+    function renderCard(item, isSaved, deleteFunctionStr) {
+        const el = document.createElement('div');
+        el.className = 'history-card';
+        el.innerHTML = renderCardHTML(item, isSaved, deleteFunctionStr);
+        return el;
+    }
+
     async function loadFullHistory(searchTerm = '') {
         if (!token) {
             fullHistoryList.innerHTML = `
@@ -513,20 +630,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         try {
-            let histUrl = `${API_BASE_URL}/history`;
-            if (searchTerm) histUrl += `?search=${encodeURIComponent(searchTerm)}`;
-            
-            const [histRes, savedRes] = await Promise.all([
-                fetch(histUrl, { headers: { 'Authorization': `Bearer ${token}` } }),
-                fetch(`${API_BASE_URL}/saved-translations`, { headers: { 'Authorization': `Bearer ${token}` } })
-            ]);
-
-            if (histRes.ok) {
-                const history = await histRes.json();
-                const savedItems = savedRes.ok ? await savedRes.json() : [];
-                const savedTexts = new Set(savedItems.map(i => i.original_text));
-                renderFullHistory(history, savedTexts);
-            }
+            await fullHistoryPager.reload(searchTerm);
         } catch (e) {
             fullHistoryList.innerHTML = '<div style="text-align:center; padding:1rem;">Error loading history</div>';
         }
@@ -571,57 +675,15 @@ document.addEventListener('DOMContentLoaded', () => {
         `;
     }
 
-    function renderFullHistory(history, savedTexts) {
-        fullHistoryList.innerHTML = '';
-        if (history.length === 0) {
-            fullHistoryList.innerHTML = '<div style="text-align:center; padding:1rem; color: var(--text-muted)">No history records.</div>';
-            return;
-        }
-
-        history.forEach(item => {
-            const el = document.createElement('div');
-            el.className = 'history-card';
-            el.innerHTML = renderCardHTML(item, savedTexts.has(item.original_text), `deleteHistoryItem(${item.id})`);
-            fullHistoryList.appendChild(el);
-        });
-    }
-
     async function loadSavedTranslations(searchTerm = '') {
         if (!token) return;
         try {
-            let url = `${API_BASE_URL}/saved-translations`;
-            if (searchTerm) url += `?search=${encodeURIComponent(searchTerm)}`;
-            
-            const response = await fetch(url, { headers: { 'Authorization': `Bearer ${token}` } });
-
-            if (response.status === 401) {
-                forceLogout();
-                return;
-            }
-
-            if (response.ok) {
-                const items = await response.json();
-                renderSavedList(items);
-            }
+            await savedPager.reload(searchTerm);
         } catch (e) {
             if (savedList) savedList.innerHTML = 'Error loading saved items';
         }
     }
 
-    function renderSavedList(items) {
-        savedList.innerHTML = '';
-        if (items.length === 0) {
-            savedList.innerHTML = '<div style="text-align:center; padding:1rem; color: var(--text-muted)">No saved translations.</div>';
-            return;
-        }
-        items.forEach(item => {
-            const el = document.createElement('div');
-            el.className = 'history-card';
-            el.innerHTML = renderCardHTML(item, true, `deleteSavedItem(${item.id})`);
-            savedList.appendChild(el);
-        });
-    }
-
     // --- TỰ ĐỘNG CHUYỂN ĐỔI NGÔN NGỮ ---
     if (sourceLang && targetLang) {
         sourceLang.addEventListener('change', () => {